@@ -0,0 +1,106 @@
+"""
+Check the column types that `src.aggregate` gives to logs of real sessions.
+
+Runs `--sessions` sessions of the bundled conditions headless (see
+`headless.py`, with frame timing and some trials without response), writes
+their csv files like psychopy's ExperimentHandler (a timeout is logged as
+"nan" or "None") and their `_settings.json`, and aggregates them into a store
+with `python -m src.aggregate`.
+
+Exits with an error unless the numeric columns of the trial log (`choice`,
+`rt`, rewards, durations, ...) are numbers in the store, timeouts are missing
+values (not "nan" text), and no text column holds "nan" or "None".
+
+Usage (from the repository root):
+    python benchmarks/aggregate_logs.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import headless
+
+headless.install()
+os.chdir(headless.ROOT)
+
+import settings
+from src.aggregate import NUMERIC_COLUMNS, load_store
+from src.frametiming import FlipRecorder
+from src.logwriter import write_wide_text
+from src.schedule import TrialRecord
+from src.trial import Trial
+
+
+def run_session(folder, seed):
+    """Run a session headless, write its logfiles to `folder` and return its number of timeouts."""
+    win, exp_info, visual_elements, schedule = headless.make_session(seed=seed)
+    exp_info["flip_recorder"] = FlipRecorder(win)
+    rng = np.random.default_rng(seed)
+    rts = rng.uniform(0.3, 2.0, size=len(schedule))
+    keys = rng.choice([settings.button_left, settings.button_right], size=len(schedule))
+    timeouts = rng.random(len(schedule)) < 0.2
+    headless.KEY_SCRIPT[:] = [
+        (None, None) if timeout else (key, rt) for key, rt, timeout in zip(keys, rts, timeouts)
+    ]
+    exp = headless.Experiment()
+    for trial_info in TrialRecord.from_frame(schedule):
+        trial = Trial(trial_info, exp, exp_info, win, visual_elements)
+        trial.prepare()
+        trial.run()
+        trial.log()
+    logfile_path = os.path.join(
+        folder, f"task-{settings.experiment_label}_subject-{seed:03d}_date-20260101_time-1200"
+    )
+    write_wide_text(exp.rows, f"{logfile_path}.csv")
+    with open(f"{logfile_path}_settings.json", "w") as file:
+        json.dump(
+            {"random_seed": seed, "Stimulus-Set": "Set 1", "stimulus_map": exp_info["stimulus_map"]},
+            file,
+        )
+    return int(timeouts.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=3)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    n_timeouts = sum(run_session(folder, seed) for seed in range(args.sessions))
+    store = os.path.join(folder, "aggregate")
+    subprocess.run(
+        [sys.executable, "-m", "src.aggregate", folder, "--store", store, "--label", settings.experiment_label],
+        check=True,
+    )
+    trials = load_store(store)
+
+    numeric = [c for c in trials.columns if c in NUMERIC_COLUMNS or c.startswith("duration_")]
+    text = trials.select_dtypes(exclude="number").columns
+    not_numeric = [c for c in numeric if not pd.api.types.is_numeric_dtype(trials[c])]
+    nan_text = [c for c in text if trials[c].isin(["nan", "NaN", "None"]).any()]
+    print(f"{len(trials)} trials, {n_timeouts} timeouts, {len(numeric)} numeric columns")
+    if not_numeric:
+        print(f"  not numeric: {', '.join(not_numeric)}")
+    if nan_text:
+        print(f"  text 'nan' or 'None' in: {', '.join(nan_text)}")
+    checks = {
+        "numeric columns are numbers": not not_numeric,
+        "timeouts are missing choices": int(trials["choice"].isna().sum()) == n_timeouts
+        and int(trials["rt"].isna().sum()) == n_timeouts,
+        "no 'nan' text": not nan_text,
+    }
+    for check, ok in checks.items():
+        print(f"  {check}: {'OK' if ok else 'FAILED'}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
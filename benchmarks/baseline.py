@@ -0,0 +1,50 @@
+"""
+Stored benchmark results (`baselines/<name>.json`) and the regression check against them.
+
+Used by the scripts in this folder, not by the task.
+"""
+import json
+import os
+
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def check(
+    name, results, tolerance=0.25, slack=0.0, update=False, unit="ms", scale=1e3, require=False
+):
+    """
+    Print `results` (durations in s, by label) next to the baseline `name` and return whether none got slower.
+
+    A result is slower if it exceeds its baseline by more than `tolerance`
+    (relative) plus `slack` (s). Labels without baseline are only printed,
+    or fail if `require`. With `update`, the results are written as the new
+    baseline (and never fail).
+    """
+    path = os.path.join(FOLDER, f"{name}.json")
+    baseline = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            baseline = json.load(file)
+
+    ok = True
+    width = max(len(label) for label in results)
+    for label, duration in results.items():
+        line = f"  {label:{width}s} {duration * scale:9.3f} {unit}"
+        if label in baseline:
+            limit = baseline[label] * (1 + tolerance) + slack
+            slower = duration > limit
+            ok &= update or not slower
+            line += f"  (baseline {baseline[label] * scale:.3f}, limit {limit * scale:.3f})"
+            line += "  SLOWER" if slower else ""
+        else:
+            ok &= update or not require
+            line += "  (no baseline" + (", run with --update-baseline)" if require else ")")
+        print(line)
+
+    if update:
+        baseline.update(results)
+        os.makedirs(FOLDER, exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Baseline written to {path}")
+    return ok
@@ -0,0 +1,78 @@
+"""
+Check that a session checkpoint survives repeated crashes and resumes.
+
+Writes checkpoints of a session of `--trials` trials with
+`src.checkpoint.Checkpoint`, and "crashes" it twice while a line is being
+written (the last line is left incomplete). After every crash, the
+checkpoint is loaded like `task.py --resume` does, and the session continues
+at the next trial with a new `Checkpoint` on the same file.
+
+Exits with an error unless the final checkpoint has every trial exactly
+once, in order, with the state (trial, points) of the last one.
+
+Usage (from the repository root):
+    python benchmarks/checkpoint_resume.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import headless
+
+sys.path.insert(0, headless.ROOT)
+
+from src.checkpoint import Checkpoint, load_checkpoint
+
+
+def run(path, first, last, crash):
+    """Run trials `first` to `last` (exclusive), then crash while writing the next line if `crash`."""
+    checkpoint = Checkpoint(path)
+    for trial in range(first, last):
+        checkpoint.save(
+            dict(trial=trial, phase="learning", total_reward=trial * 10),
+            dict(trial_id=trial, choice=1 + trial % 2),
+        )
+    if crash:
+        # the process dies in the middle of writing a line
+        checkpoint._file.write('{"state": {"trial": ' + str(last))
+    checkpoint._file.close()
+
+
+def resume(path):
+    """First trial to run after resuming (as in `task.py`)."""
+    state, rows = load_checkpoint(path)
+    return 0 if state is None else state["trial"] + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--trials", type=int, default=30)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "session_checkpoint.jsonl")
+    crashes = [args.trials // 3, 2 * args.trials // 3]
+    first = 0
+    for crash in crashes:
+        run(path, first, crash, crash=True)
+        first = resume(path)
+        print(f"Crashed after trial {crash - 1}, resuming at trial {first}")
+    run(path, first, args.trials, crash=False)
+
+    state, rows = load_checkpoint(path)
+    checks = {
+        "resumed at the next trial": first == crashes[-1],
+        "every trial once, in order": [row["trial_id"] for row in rows] == list(range(args.trials)),
+        "state of the last trial": state["trial"] == args.trials - 1
+        and state["total_reward"] == (args.trials - 1) * 10,
+        "no incomplete lines": all(line.endswith("\n") for line in open(path)),
+    }
+    for check, ok in checks.items():
+        print(f"  {check}: {'OK' if ok else 'FAILED'}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
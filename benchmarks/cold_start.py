@@ -0,0 +1,143 @@
+"""
+Cold-start time of the task, relative to a reference import, checked against a stored baseline.
+
+Every stage runs in a fresh python process (so nothing is cached in
+`sys.modules`; this script imports nothing heavy itself), `--repeats` times
+(all stages one after the other in every repeat, so they see the same load
+of the machine), and the fastest run of each stage (the least disturbed by
+other processes) is taken. Stages are compared as a ratio to the
+"reference" stage, importing numpy and pandas in a fresh process, so the
+numbers in `baselines/cold_start.json` do not depend on how fast the
+computer is:
+
+- "import task": importing `task.py` (psychopy, numpy, pandas, `src`), with
+  psychopy if it is installed, otherwise with the headless stand-ins of
+  `headless.py` (then without psychopy's share)
+- "schedule and stimuli": compiling the schedule and preloading the label
+  and outcome text caches (headless)
+- "instructions": `instructions.make_instructions()` (headless)
+- "reference": `import numpy, pandas` (not compared, only the unit)
+
+The dialog, hardware and window are not covered (they need a person and a
+screen; see `python task.py --profile-startup` for those).
+
+Exits with an error if a stage's ratio is larger than its baseline by more
+than `--tolerance` (relative) plus 0.02 (about 5 ms), or if a stage has no
+baseline yet (e.g., "import task (psychopy)" on the first run on a computer
+with psychopy). Record or update the baseline with `--update-baseline` after
+checking the numbers (e.g., when a stage got faster on purpose).
+
+Usage (from the repository root):
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --update-baseline
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+import baseline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SLACK = 0.02  # absolute tolerance (ratio to the reference), for stages that only take a few ms
+
+
+def import_mode():
+    return "psychopy" if importlib.util.find_spec("psychopy") is not None else "headless"
+
+
+def run_stage(stage):
+    """Run `stage` in this process and return its duration (s)."""
+    if stage == "reference":
+        start = time.perf_counter()
+        import numpy
+        import pandas
+
+        return time.perf_counter() - start
+    if stage == "import task":
+        start = time.perf_counter()
+        if import_mode() == "headless":
+            import headless
+
+            headless.install()
+        else:
+            sys.path.insert(0, os.path.dirname(HERE))
+        import task
+
+        return time.perf_counter() - start
+
+    import headless
+
+    headless.install()
+    os.chdir(headless.ROOT)
+    if stage == "schedule and stimuli":
+        start = time.perf_counter()
+        headless.make_session()
+        return time.perf_counter() - start
+    if stage == "instructions":
+        import instructions
+
+        win = headless.Window()
+        start = time.perf_counter()
+        instructions.make_instructions(win)
+        return time.perf_counter() - start
+    raise ValueError(f"Unknown stage '{stage}'.")
+
+
+def measure(stage):
+    """Duration (s) of `stage` in a fresh process."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--stage", stage],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--stage", help=argparse.SUPPRESS)  # used by the child processes
+    args = parser.parse_args()
+
+    if args.stage is not None:
+        print(run_stage(args.stage))
+        return
+
+    stages = ["reference", f"import task ({import_mode()})", "schedule and stimuli", "instructions"]
+    durations = {stage: [] for stage in stages}
+    for _ in range(args.repeats):
+        for stage in stages:
+            durations[stage].append(measure(stage.split(" (")[0]))
+    fastest = {stage: min(values) for stage, values in durations.items()}
+    reference = fastest.pop("reference")
+    results = {stage: duration / reference for stage, duration in fastest.items()}
+
+    print(
+        f"Cold start, fastest of {args.repeats} processes, "
+        + f"as ratio to the reference ({reference * 1e3:.0f} ms):"
+    )
+    ok = baseline.check(
+        "cold_start",
+        results,
+        args.tolerance,
+        slack=SLACK,
+        update=args.update_baseline,
+        unit="x",
+        scale=1,
+        require=True,
+    )
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
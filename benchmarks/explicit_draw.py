@@ -0,0 +1,104 @@
+"""
+Draw time per frame of the explicit-phase opacity animation, with and without `LabelCache`.
+
+Opens a psychopy window (needs a display) with the task's settings and
+animates the two lottery labels like `Trial.run()` does in the explicit
+phase: once with `TextStim`s (`setOpacity()` + `draw()` every frame, as
+before), once with the cached label textures. The time from the first draw
+call of a frame until `win.flip()` is called is measured.
+
+Usage (from the repository root):
+    python benchmarks/explicit_draw.py --frames 600
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psychopy
+
+psychopy.useVersion("2024.1.0")
+
+from psychopy import visual
+
+import settings
+from src.labelcache import LabelCache, explicit_label
+
+LABELS = [(0.75, 1), (0.25, 10)]
+
+
+def animate(win, bg_rects, stims, n_frames):
+    """Draw `n_frames` frames of the opacity animation and return the draw time of each (s)."""
+    durations = np.empty(n_frames)
+    animation_phase = 0
+    for i in range(n_frames):
+        start = time.perf_counter()
+        for rect in bg_rects:
+            rect.draw()
+        animation_phase += settings.animation_speed
+        opacity = 1 + (math.cos(animation_phase) * 0.5)
+        for stim in stims:
+            stim.setOpacity(opacity)
+            stim.draw()
+        durations[i] = time.perf_counter() - start
+        win.flip()
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--frames", type=int, default=600)
+    args = parser.parse_args()
+
+    win = visual.Window(
+        size=settings.screen_size, units="height", color=settings.background_color
+    )
+    bg_rects = [
+        visual.Rect(
+            win,
+            pos=[pos, 0],
+            size=[settings.rect_width, settings.rect_height],
+            lineWidth=settings.rect_linewidth,
+            lineColor=settings.rect_linecolor,
+            fillColor=settings.rect_background_color,
+            units="height",
+        )
+        for pos in [settings.pos_left, settings.pos_right]
+    ]
+    texts = [
+        visual.TextStim(
+            win,
+            text=explicit_label(probability, outcome),
+            pos=(pos, 0),
+            height=settings.text_height,
+            color=settings.text_color,
+        )
+        for pos, (probability, outcome) in zip([settings.pos_left, settings.pos_right], LABELS)
+    ]
+    text_durations = animate(win, bg_rects, texts, args.frames)
+
+    cache = LabelCache(win, texts, bg_rects)
+    cache.preload((slot, explicit_label(*label)) for slot, label in enumerate(LABELS))
+    cached = [cache.get(slot, explicit_label(*label)) for slot, label in enumerate(LABELS)]
+    cached_durations = animate(win, bg_rects, cached, args.frames)
+    win.close()
+
+    print(f"Draw time per frame ({args.frames} frames), ms:")
+    for label, durations in [("TextStim", text_durations), ("LabelCache", cached_durations)]:
+        durations = durations * 1e3
+        print(
+            f"  {label:10s} median {np.median(durations):.3f}, "
+            + f"95th percentile {np.percentile(durations, 95):.3f}, max {durations.max():.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Streaming of eye-tracker samples to disk (`src.eyetracking.GazeRecorder`).
+
+Runs a frame loop of `--duration` seconds (60 Hz, real time) with a
+simulated eye tracker (`DummyEyetracker` with a sample buffer at `--rate`
+Hz, SDK calls take `--call-duration` seconds), sends a message every few
+frames through a `MessageDispatcher`, and streams the samples with a `GazeRecorder` in the background. Reports the
+time `send()` takes in the frame loop, the time per written chunk (in the
+background thread) and the most samples that waited in the eye tracker's
+buffer (the memory bound).
+
+Recording is stopped with `GazeRecorder.stop_recording()`, then recorded
+once more for a moment and stopped by `GazeRecorder.close()` alone, as when
+the task ends without stopping the recording.
+
+Exits with an error if samples are lost or out of order (every sample that
+arrived while recording has to be in the .npy file, none left in the eye
+tracker's buffer for its .h5 file), if the recording was not stopped, if a
+message is not placed before the first sample after it, or if the buffer held
+more samples than two drain intervals plus one chunk.
+
+Usage (from the repository root):
+    python benchmarks/gaze_stream.py
+    python benchmarks/gaze_stream.py --rate 1200 --duration 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import headless
+
+sys.path.insert(0, headless.ROOT)
+
+from src.eyetracking import DummyEyetracker, GazeRecorder, MessageDispatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of recording")
+    parser.add_argument("--rate", type=int, default=600, help="Sampling rate (Hz)")
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=600)
+    parser.add_argument(
+        "--call-duration", type=float, default=0.01, help="Duration of an SDK call (s)"
+    )
+    args = parser.parse_args()
+
+    frame_period = 1 / 60
+    folder = tempfile.mkdtemp()
+    eyetracker = DummyEyetracker(call_duration=args.call_duration, sampling_rate=args.rate)
+    recorder = GazeRecorder(
+        eyetracker,
+        os.path.join(folder, "session_eyetracking"),
+        interval=args.interval,
+        chunk_size=args.chunk_size,
+    )
+    dispatcher = MessageDispatcher(eyetracker, clock=time.perf_counter, recorder=recorder)
+
+    recorder.start_recording(gaze=True)
+    send_durations = []
+    n_frames = int(args.duration / frame_period)
+    next_flip = time.perf_counter()
+    for i in range(n_frames):
+        next_flip += frame_period
+        time.sleep(max(next_flip - time.perf_counter(), 0))  # stands in for `win.flip()`
+        if i % 6 == 0:
+            start = time.perf_counter()
+            dispatcher.send(f"frame {i}", next_flip)
+            send_durations.append(time.perf_counter() - start)
+    dispatcher.close()
+    recorder.stop_recording(gaze=True)
+    n_first = recorder.n_samples
+    n_left = eyetracker.buffer.n_arrived - eyetracker.buffer.n_consumed  # would go to the .h5 file
+
+    # Record a little more, and leave stopping to `close()`
+    recorder.start_recording(gaze=True)
+    time.sleep(args.interval * 1.5)
+    recorder.close()
+
+    samples = np.load(recorder.samples_path, mmap_mode="r")
+    messages = pd.read_csv(recorder.messages_path)
+    timestamps = np.asarray(samples["system_time_stamp"])
+    expected_sample = np.searchsorted(timestamps, messages["system_time_stamp"].values)
+    bound = 2 * args.interval * args.rate + args.chunk_size
+    flushes = np.array(recorder.flush_durations) * 1e3
+    send_durations = np.array(send_durations) * 1e6
+
+    print(
+        f"{len(samples)} samples at {args.rate} Hz ({len(samples) - n_first} after the first "
+        + f"stop) in {recorder.n_chunks} chunks, "
+        + f"{len(messages)} messages ({os.path.getsize(recorder.samples_path) / 1e6:.1f} MB)"
+    )
+    print(
+        f"send() in the frame loop: median {np.median(send_durations):.1f} µs, "
+        + f"max {send_durations.max():.1f} µs"
+    )
+    print(
+        f"Chunk consumed and written (background): median {np.median(flushes):.2f} ms, "
+        + f"max {flushes.max():.2f} ms"
+    )
+    print(f"Most samples waiting in the buffer: {eyetracker.buffer.max_held} (bound {bound:.0f})")
+
+    checks = {
+        "no samples lost": n_left == 0
+        and len(samples) == eyetracker.buffer.n_consumed == eyetracker.buffer.n_arrived,
+        "recording stopped by close()": not eyetracker.recording and len(samples) > n_first,
+        "samples in order": bool(np.all(np.diff(timestamps) > 0)),
+        "messages placed": bool(np.all(messages["sample"].values == expected_sample)),
+        "memory bounded": eyetracker.buffer.max_held <= bound,
+    }
+    for check, ok in checks.items():
+        print(f"  {check}: {'OK' if ok else 'FAILED'}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
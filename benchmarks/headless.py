@@ -0,0 +1,274 @@
+"""
+Headless stand-ins for the parts of psychopy the task uses, on a virtual clock.
+
+`install()` puts fake `psychopy` modules into `sys.modules`, so that `src.Trial`
+runs without a screen, keyboard or psychopy installation. Time only advances
+when the code waits or flips: `Window.flip()` jumps to the next screen refresh
+(`Window.extra_frames` can make single flips late, to simulate dropped frames),
+and `core.wait()` jumps by the waited time. Responses come from a script of
+`(key, rt)` pairs, one per trial, with RTs relative to the stimulus onset.
+
+Used by the scripts in this folder, not by the task.
+"""
+import math
+import os
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_now = [0.0]  # virtual time (s)
+KEY_SCRIPT = []  # (key, rt) of the coming trials; key None means no response
+
+
+def getTime():
+    return _now[0]
+
+
+def wait(secs, hogCPUperiod=None):
+    _now[0] += max(secs, 0)
+
+
+def quit():
+    raise SystemExit
+
+
+class Clock(object):
+    def __init__(self):
+        self._t0 = _now[0]
+
+    def getTime(self):
+        return _now[0] - self._t0
+
+    def reset(self, newT=0.0):
+        self._t0 = _now[0] + newT
+
+
+class CountdownTimer(Clock):
+    def __init__(self, start=0):
+        self._t0 = _now[0] + start
+
+    def getTime(self):
+        return self._t0 - _now[0]
+
+
+class Window(object):
+    def __init__(self, frame_period=1 / 60, size=(1920, 1080), **kwargs):
+        self.monitorFramePeriod = frame_period
+        self.size = size
+        self.extra_frames = {}  # flip number -> number of refreshes the flip misses
+        self.n_flips = 0
+        self._on_flip = []
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self._on_flip.append((function, args, kwargs))
+
+    def flip(self, clearBuffer=True):
+        refresh = math.floor(_now[0] / self.monitorFramePeriod + 1e-9) + 1
+        refresh += self.extra_frames.get(self.n_flips, 0)
+        _now[0] = refresh * self.monitorFramePeriod
+        for function, args, kwargs in self._on_flip:
+            function(*args, **kwargs)
+        self._on_flip = []
+        self.n_flips += 1
+        return _now[0]
+
+    def clearBuffer(self, color=True, depth=False, stencil=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class Stim(object):
+    """Any visual stimulus: remembers what is set, draws nothing."""
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.opacity = 1
+        self.n_draws = 0
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        self.n_draws += 1
+
+    def __getattr__(self, name):
+        if name.startswith("set") and len(name) > 3:
+            attribute = name[3].lower() + name[4:]
+            return lambda value, *args, **kwargs: setattr(self, attribute, value)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+
+def waitKeys(maxWait=float("inf"), keyList=None, timeStamped=False, **kwargs):
+    """`event.waitKeys`: takes the next scripted response, blocks until it is given."""
+    key, rt = KEY_SCRIPT.pop(0) if KEY_SCRIPT else (None, None)
+    if key is None or rt > maxWait:
+        wait(maxWait)
+        return None
+    wait(rt)
+    return [(key, rt)] if timeStamped is not False else [key]
+
+
+class Key(object):
+    def __init__(self, name, tDown, rt):
+        self.name = name
+        self.tDown = tDown
+        self.rt = rt
+        self.duration = None
+
+
+class ScriptedKeyboard(object):
+    """`hardware.keyboard.Keyboard`: gives the scripted response of every trial at its exact time."""
+
+    def __init__(self, *args, **kwargs):
+        self.clock = Clock()
+        self._press = None
+
+    def clearEvents(self, eventType=None):
+        self._press = None
+
+    def getKeys(self, keyList=None, waitRelease=True, clear=True):
+        if self._press is None:
+            # responses are scripted relative to the last clock reset (the stimulus onset)
+            key, rt = KEY_SCRIPT.pop(0) if KEY_SCRIPT else (None, None)
+            self._press = (key, float("inf") if key is None else self.clock._t0 + rt)
+        key, t_down = self._press
+        if key is None or t_down > _now[0]:
+            return []
+        self._press = (None, float("inf"))
+        return [Key(key, t_down, t_down - self.clock._t0)]
+
+
+def install():
+    """Replace psychopy by the headless stand-ins (before anything imports it)."""
+    psychopy = types.ModuleType("psychopy")
+    psychopy.__version__ = "2024.1.0"
+    psychopy.useVersion = lambda version: None
+    core = types.ModuleType("psychopy.core")
+    core.getTime, core.wait, core.quit = getTime, wait, quit
+    core.Clock, core.CountdownTimer = Clock, CountdownTimer
+    core.monotonicClock = Clock()
+    event = types.ModuleType("psychopy.event")
+    event.waitKeys = waitKeys
+    event.getKeys = lambda *args, **kwargs: []
+    event.clearEvents = lambda *args, **kwargs: None
+    visual = types.ModuleType("psychopy.visual")
+    visual.Window = Window
+    for name in ["ImageStim", "TextStim", "MovieStim", "Rect", "GratingStim", "BufferImageStim"]:
+        setattr(visual, name, Stim)
+    data = types.ModuleType("psychopy.data")
+    data.ExperimentHandler = Experiment
+    gui = types.ModuleType("psychopy.gui")
+    tools = types.ModuleType("psychopy.tools")
+    filetools = types.ModuleType("psychopy.tools.filetools")
+    filetools.fromFile = filetools.toFile = lambda *args, **kwargs: None
+    tools.filetools = filetools
+    hardware = types.ModuleType("psychopy.hardware")
+    keyboard = types.ModuleType("psychopy.hardware.keyboard")
+    keyboard.Keyboard = ScriptedKeyboard
+    hardware.keyboard = keyboard
+    psychopy.core, psychopy.event, psychopy.visual, psychopy.hardware = core, event, visual, hardware
+    psychopy.data, psychopy.gui, psychopy.tools = data, gui, tools
+    sys.modules.update(
+        {
+            "psychopy": psychopy,
+            "psychopy.core": core,
+            "psychopy.event": event,
+            "psychopy.visual": visual,
+            "psychopy.data": data,
+            "psychopy.gui": gui,
+            "psychopy.tools": tools,
+            "psychopy.tools.filetools": filetools,
+            "psychopy.hardware": hardware,
+            "psychopy.hardware.keyboard": keyboard,
+        }
+    )
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def make_session(seed=0, conditions_file="conditions.csv", **settings):
+    """
+    Window, `exp_info` and visual elements for running `Trial`s headless, and the compiled schedule.
+
+    `settings` override the defaults (e.g., `response_mode="event"`).
+    """
+    from src.conditions import load_conditions
+    from src.schedule import compile_schedule, make_stimulus_map, schedule_to_frame
+
+    conditions = load_conditions(os.path.join(ROOT, "stim", conditions_file))
+    win = Window()
+    exp_info = dict(
+        Subject="headless",
+        Session=1,
+        **{"Stimulus-Set": "Set 1"},
+        duration_timeout=5.0,
+        duration_choice=0.5,
+        duration_outcome=1.0,
+        duration_iti=1.0,
+        duration_iti_jitter=0.5,
+        duration_fixed_response=False,
+        pos_left=-0.25,
+        pos_right=0.25,
+        animation_speed=0.1,
+        animation_mode="movie",
+        temporal_arrangement="blocked",
+        training_n_repeats_max=0,
+        response_mode="keyboard",
+        buttons=dict(button_left="f", button_right="j", button_quit="q"),
+        use_eyetracker=False,
+        use_serialport=False,
+        total_reward=0,
+        log_writer=None,
+        flip_recorder=None,
+        cache_explicit_labels=True,
+        cache_outcome_texts=True,
+        outcome_color="white",
+        outcome_color_counterfactual="grey",
+    )
+    exp_info.update(settings)
+    exp_info["stimulus_map"] = make_stimulus_map(conditions, rng=np.random.default_rng(seed))
+    exp_info["keyboard"] = ScriptedKeyboard() if exp_info["response_mode"] == "keyboard" else None
+    schedule = schedule_to_frame(compile_schedule(conditions, exp_info, seed))
+    positions = [(exp_info["pos_left"], 0), (exp_info["pos_right"], 0)]
+    visual_elements = dict(
+        images=[Stim(win), Stim(win)],
+        videos=[Stim(win), Stim(win)],
+        bg_rects=[Stim(win, pos=pos, size=(0.25, 0.25)) for pos in positions],
+        fb_rects=[Stim(win), Stim(win)],
+        outcomes=[Stim(win), Stim(win)],
+        explicit=[Stim(win, pos=pos) for pos in positions],
+    )
+    from src.labelcache import preload_caches
+
+    visual_elements["label_cache"], visual_elements["outcome_cache"] = preload_caches(
+        win,
+        schedule,
+        templates=visual_elements["explicit"],
+        backgrounds=visual_elements["bg_rects"],
+        positions=[exp_info["pos_left"], exp_info["pos_right"]],
+        colors=[exp_info["outcome_color"], exp_info["outcome_color_counterfactual"]],
+        labels=exp_info["cache_explicit_labels"],
+        outcomes=exp_info["cache_outcome_texts"],
+    )
+    return win, exp_info, visual_elements, schedule
+
+
+class Experiment(object):
+    """`data.ExperimentHandler` that keeps the rows in memory."""
+
+    def __init__(self):
+        self.rows = []
+        self._row = {}
+
+    def addData(self, name, value):
+        self._row[name] = value
+
+    def nextEntry(self):
+        self.rows.append(self._row)
+        self._row = {}
@@ -0,0 +1,118 @@
+"""
+Check that a csv file recovered from the streamed trial log matches the one of a finished session.
+
+Runs a session of the bundled conditions headless (see `headless.py`, with
+frame timing and some trials without response) with a `TrialLogWriter`, and
+logs the trials to psychopy's `ExperimentHandler` (the installed psychopy,
+not a stand-in), which writes the session's csv file as at the end of a
+session. A last row with values the trials do not produce (text with commas
+and line breaks, None, numpy scalars, a new and a missing column) is logged
+the same way. The csv file is then recovered from the
+streamed log with `python -m src.logwriter`.
+
+Exits with an error unless both files are identical (column set and order,
+number formatting, empty cells and quoting). Skipped (without error) if
+psychopy cannot be imported.
+
+Usage (from the repository root):
+    python benchmarks/log_recovery.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import headless
+
+try:  # the real one, before the headless stand-ins replace psychopy
+    from psychopy.data import ExperimentHandler
+except ImportError:
+    ExperimentHandler = None
+
+headless.install()
+os.chdir(headless.ROOT)
+
+import settings
+from src.frametiming import FlipRecorder
+from src.logwriter import TrialLogWriter
+from src.schedule import TrialRecord
+from src.trial import Trial
+
+# Values that trials do not log, but that the csv file has to show like psychopy does
+EXTRA_ROW = dict(
+    phase="note, with a comma",
+    response="line\nbreak",
+    choice=None,
+    rt=np.float32(0.1),
+    obtained_reward=np.int64(3),
+    cumulative_reward=np.float64(0.30000000000000004),
+    note=float("nan"),
+)
+
+
+def run_session(folder, seed):
+    """Run a session headless and return the paths of its csv file and streamed trial log."""
+    logfile_path = os.path.join(folder, "session")
+    win, exp_info, visual_elements, schedule = headless.make_session(seed=seed)
+    exp_info["flip_recorder"] = FlipRecorder(win)
+    exp_info["log_writer"] = TrialLogWriter(f"{logfile_path}_trials.jsonl")
+    rng = np.random.default_rng(seed)
+    rts = rng.uniform(0.3, 2.0, size=len(schedule))
+    keys = rng.choice([settings.button_left, settings.button_right], size=len(schedule))
+    timeouts = rng.random(len(schedule)) < 0.1
+    headless.KEY_SCRIPT[:] = [
+        (None, None) if timeout else (key, rt) for key, rt, timeout in zip(keys, rts, timeouts)
+    ]
+    exp = ExperimentHandler(
+        name="log_recovery", dataFileName=f"{logfile_path}_finished", savePickle=False, saveWideText=False
+    )
+    for trial_info in TrialRecord.from_frame(schedule):
+        trial = Trial(trial_info, exp, exp_info, win, visual_elements)
+        trial.prepare()
+        trial.run()
+        trial.log()
+    for var, val in EXTRA_ROW.items():
+        exp.addData(var, val)
+    exp.nextEntry()
+    exp_info["log_writer"].write(EXTRA_ROW)
+    exp_info["log_writer"].close()
+    exp.saveAsWideText(f"{logfile_path}_finished.csv", delim=",", fileCollisionMethod="overwrite")
+    return f"{logfile_path}_finished.csv", f"{logfile_path}_trials.jsonl"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if ExperimentHandler is None:
+        print("psychopy cannot be imported, skipping the comparison with its csv file.")
+        sys.exit(0)
+
+    folder = tempfile.mkdtemp()
+    finished_path, log_path = run_session(folder, args.seed)
+    subprocess.run([sys.executable, "-m", "src.logwriter", log_path], check=True)
+    recovered_path = log_path.replace("_trials.jsonl", "") + ".csv"
+
+    with open(finished_path, "rb") as file:
+        finished = file.read().split(b"\n")
+    with open(recovered_path, "rb") as file:
+        recovered = file.read().split(b"\n")
+    print(f"{len(finished) - 2} trials in the finished csv file, {len(recovered) - 2} recovered")
+    differing = [
+        i for i, (line1, line2) in enumerate(zip(finished, recovered)) if line1 != line2
+    ] + ([min(len(finished), len(recovered))] if len(finished) != len(recovered) else [])
+    for i in differing[:5]:
+        print(f"  line {i + 1} differs:")
+        print(f"    finished:  {finished[i] if i < len(finished) else b''}")
+        print(f"    recovered: {recovered[i] if i < len(recovered) else b''}")
+    print("Recovered csv file is identical: " + ("OK" if not differing else "FAILED"))
+    sys.exit(0 if not differing else 1)
+
+
+if __name__ == "__main__":
+    main()
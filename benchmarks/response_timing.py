@@ -0,0 +1,105 @@
+"""
+Check response timing of both `response_mode`s with scripted key presses.
+
+Runs all trials of the bundled conditions headless (see `headless.py`), with
+random scripted RTs (and some trials without response), and compares:
+
+- measured vs. scripted RTs
+- number of stimulus frames flipped while waiting for the response
+  (the stimuli can only animate if they are redrawn)
+- with `duration_fixed_response`: how far the outcome onset is from
+  stimulus onset + `duration_timeout`
+
+The headless `event.waitKeys` returns exact RTs as well, so this does not
+show the coarser timestamps of the real event queue, only the differences
+of the frame-locked loop.
+
+Exits with an error if "keyboard" mode RTs are off by more than 1 µs or its
+fixed-response outcome onsets by more than half a frame.
+
+Usage (from the repository root):
+    python benchmarks/response_timing.py
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+import headless
+
+headless.install()
+
+from src.frametiming import FlipRecorder
+from src.schedule import TrialRecord
+from src.trial import Trial
+
+
+def run_session(response_mode, duration_fixed_response, seed):
+    win, exp_info, visual_elements, schedule = headless.make_session(
+        seed=seed,
+        response_mode=response_mode,
+        duration_fixed_response=duration_fixed_response,
+    )
+    exp_info["flip_recorder"] = FlipRecorder(win)
+    rng = np.random.default_rng(seed)
+    scripted_rt = rng.uniform(0.2, 2.0, size=len(schedule))
+    scripted_rt[rng.random(len(schedule)) < 0.1] = np.nan  # no response
+    keys = rng.choice(["f", "j"], size=len(schedule))
+    headless.KEY_SCRIPT[:] = [
+        (None, None) if np.isnan(rt) else (key, rt) for key, rt in zip(keys, scripted_rt)
+    ]
+    exp = headless.Experiment()
+    for trial_info in TrialRecord.from_frame(schedule):
+        trial = Trial(trial_info, exp, exp_info, win, visual_elements)
+        trial.prepare()
+        trial.run()
+        trial.log()
+    log = pd.DataFrame(exp.rows)
+    log["scripted_rt"] = scripted_rt
+    flips = exp_info["flip_recorder"].to_frame()
+    log["stimulus_flips"] = (
+        flips.loc[flips["phase"] == "stimulus"].groupby("trial").size().reindex(range(len(log))).values
+    )
+    return log, win.monitorFramePeriod, exp_info["duration_timeout"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ok = True
+    for response_mode in ["event", "keyboard"]:
+        log, frame_period, _ = run_session(response_mode, False, args.seed)
+        responded = log["scripted_rt"].notna()
+        rt_error = (log["rt"] - log["scripted_rt"])[responded].abs().max()
+        timeouts_ok = log.loc[~responded, "rt"].isna().all()
+
+        fixed, _, duration_timeout = run_session(response_mode, True, args.seed)
+        responded_fixed = fixed["scripted_rt"].notna()
+        outcome_onset = (
+            fixed["duration_stimulus_achieved"] + fixed["duration_choice_achieved"]
+        )[responded_fixed]
+        onset_error = (outcome_onset - duration_timeout).abs()
+
+        print(f"response_mode = '{response_mode}' ({responded.sum()} responses, {(~responded).sum()} timeouts)")
+        print(f"  largest RT error:                        {rt_error * 1e3:.4f} ms")
+        print(f"  timeouts recorded as missing RT:         {timeouts_ok}")
+        print(
+            f"  stimulus frames while waiting (median):  {log.loc[responded, 'stimulus_flips'].median():.0f}"
+        )
+        print(
+            f"  fixed response, outcome onset error:     mean {onset_error.mean() * 1e3:.2f} ms, max {onset_error.max() * 1e3:.2f} ms"
+            + f" (frame: {frame_period * 1e3:.2f} ms)"
+        )
+        if response_mode == "keyboard":
+            ok &= rt_error < 1e-6 and timeouts_ok and onset_error.max() <= frame_period / 2 + 1e-9
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Per-trial overhead of the trial loop between stimulus offset and the next trial's onset.
+
+Compares the old loop (`DataFrame.iterrows()` with a pandas.Series per trial,
+printed to the console) with `TrialRecord`s (console echo off, as by default).
+Only the bookkeeping the trial loop and `Trial` do with the trial information
+is timed (reading fields in `prepare()`/`run()`, adding fields and copying the
+row in `log()`), nothing is drawn.
+
+Usage (from the repository root):
+    python benchmarks/trial_record.py
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.schedule import TrialRecord, compile_schedule, make_stimulus_map, schedule_to_frame
+
+# Fields `Trial.prepare()` and `Trial.run()` read from the trial information
+READ_FIELDS = [
+    "phase", "image1", "image2", "video1", "video2", "outcome_randomness",
+    "actual_outcome1", "actual_outcome2", "feedback", "pos1", "pos2", "iti",
+    "trial_type", "trial_id", "option1pos",
+]  # fmt: skip
+
+
+def use_trial(trial_info):
+    for field in READ_FIELDS:
+        trial_info[field]
+    trial_info["subject"] = "1"
+    trial_info["session"] = "1"
+    trial_info["iti"] = trial_info["iti"]
+    return dict(trial_info.items())
+
+
+def loop_series(schedule, echo):
+    for idx, trial_info in schedule.iterrows():
+        if echo:
+            print(trial_info)
+        use_trial(trial_info)
+
+
+def loop_records(schedule, echo):
+    for trial_info in TrialRecord.from_frame(schedule):
+        if echo:
+            print(trial_info)
+        use_trial(trial_info)
+
+
+def per_trial(loop, schedule, echo, repeats):
+    """Best time per trial (in µs) over `repeats` runs through the schedule."""
+    best = float("inf")
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            loop(schedule, echo)
+            best = min(best, time.perf_counter() - start)
+    return best / len(schedule) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--conditions", default=os.path.join("stim", "conditions.csv"))
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    conditions = pd.read_csv(args.conditions)
+    exp_info = {
+        "Stimulus-Set": "Set 1",
+        "training_n_repeats_max": 0,
+        "temporal_arrangement": "blocked",
+        "pos_left": -0.25,
+        "pos_right": 0.25,
+        "duration_iti": 1.0,
+        "duration_iti_jitter": 0.5,
+        "stimulus_map": make_stimulus_map(conditions),
+    }
+    schedule = schedule_to_frame(compile_schedule(conditions, exp_info, seed=0))
+
+    print(f"{len(schedule)} trials, best of {args.repeats} runs, µs per trial:")
+    results = [
+        ("pandas.Series, printed", per_trial(loop_series, schedule, True, args.repeats)),
+        ("pandas.Series, not printed", per_trial(loop_series, schedule, False, args.repeats)),
+        ("TrialRecord, printed", per_trial(loop_records, schedule, True, args.repeats)),
+        ("TrialRecord, not printed", per_trial(loop_records, schedule, False, args.repeats)),
+    ]
+    for label, duration in results:
+        print(f"  {label:28s} {duration:10.1f}")
+    print(f"Speedup (old loop vs. new default): {results[0][1] / results[-1][1]:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
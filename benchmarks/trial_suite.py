@@ -0,0 +1,167 @@
+"""
+CPU overhead of `Trial` and `SlideShow`, headless, checked against a stored baseline.
+
+Runs complete sessions of the bundled conditions (all phases and feedback
+types) with the headless stand-ins of `headless.py`: fake window and stimuli,
+virtual clock, scripted responses (random keys and RTs, some trials without
+response). Waiting only moves the virtual clock, so all time that passes on
+the real clock is overhead of the task's code outside the intended waits
+(e.g., per-frame work in `Trial.run()`, setting up stimuli in `prepare()`,
+copying the row in `log()`). After the trials, all instruction slides of
+`instructions.py` are paged through (newly built per session, so image
+slides are decoded like in the task).
+
+Reports the median per-trial overhead (prepare, run, log and total) by phase
+and feedback, the run overhead per flipped frame, and the overhead per
+instruction page. The medians are compared to `baselines/trial_suite.json`;
+exits with an error if one is slower by more than `--tolerance` (relative)
+plus 20 µs. Baselines are machine-specific: update them with
+`--update-baseline` after checking the numbers.
+
+Runs without display or GPU.
+
+Usage (from the repository root):
+    python benchmarks/trial_suite.py
+    python benchmarks/trial_suite.py --sessions 50 --update-baseline
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import baseline
+import headless
+
+headless.install()
+os.chdir(headless.ROOT)
+
+import instructions
+import settings
+from src.frametiming import FlipRecorder
+from src.schedule import TrialRecord
+from src.slideshow import SlideShow
+from src.trial import Trial
+
+SLACK = 20e-6  # absolute tolerance (s)
+
+
+def run_trials(seed, response_mode):
+    """Run all trials of one session and return the overhead (s) of every trial, by step."""
+    win, exp_info, visual_elements, schedule = headless.make_session(
+        seed=seed, response_mode=response_mode
+    )
+    exp_info["flip_recorder"] = FlipRecorder(win)
+    rng = np.random.default_rng(seed)
+    rts = rng.uniform(0.3, 2.0, size=len(schedule))
+    keys = rng.choice([settings.button_left, settings.button_right], size=len(schedule))
+    timeouts = rng.random(len(schedule)) < 0.1
+    headless.KEY_SCRIPT[:] = [
+        (None, None) if timeout else (key, rt) for key, rt, timeout in zip(keys, rts, timeouts)
+    ]
+    exp = headless.Experiment()
+    rows = []
+    for trial_info in TrialRecord.from_frame(schedule):
+        n_flips = win.n_flips
+        start = time.perf_counter()
+        trial = Trial(trial_info, exp, exp_info, win, visual_elements)
+        trial.prepare()
+        prepared = time.perf_counter()
+        trial.run()
+        ran = time.perf_counter()
+        trial.log()
+        logged = time.perf_counter()
+        rows.append(
+            dict(
+                phase=trial_info["phase"],
+                feedback=trial_info["feedback"],
+                prepare=prepared - start,
+                run=ran - prepared,
+                log=logged - ran,
+                total=logged - start,
+                flips=win.n_flips - n_flips,
+            )
+        )
+    return rows
+
+
+def run_instructions():
+    """Page through all instruction slides (next on every slide, then finish) and return the overhead (s) per page."""
+    win = headless.Window()
+    slideshows = instructions.make_instructions(win)
+    n_pages = sum(len(slides) for slides in slideshows)
+    headless.KEY_SCRIPT[:] = [
+        (settings.button_instr_next if i < len(slides) - 1 else settings.button_instr_finish, 1.0)
+        for slides in slideshows
+        for i in range(len(slides))
+    ]
+    start = time.perf_counter()
+    for slides in slideshows:
+        SlideShow(
+            win=win,
+            slides=slides,
+            keys_finish=[settings.button_instr_finish],
+            keys_previous=[settings.button_instr_previous],
+            keys_next=[settings.button_instr_next],
+            keys_quit=[settings.button_quit],
+            keys_skip=[settings.button_instr_skip],
+        ).run()
+    return (time.perf_counter() - start) / n_pages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--response-mode", default="keyboard", choices=["keyboard", "event"])
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    rows = []
+    page_durations = []
+    for seed in range(args.sessions):
+        rows.extend(run_trials(seed, args.response_mode))
+        page_durations.append(run_instructions())
+    trials = pd.DataFrame(rows)
+    trials["run_per_flip"] = trials["run"] / trials["flips"]
+
+    steps = ["prepare", "run", "log", "total"]
+    by_condition = trials.groupby(["phase", "feedback"], sort=False)[steps + ["flips"]].median()
+    print(
+        f"Median overhead per trial, µs ({args.sessions} sessions, {len(trials)} trials, "
+        + f"response_mode '{args.response_mode}'):"
+    )
+    print((by_condition[steps] * 1e6).round(1).assign(flips=by_condition["flips"]).to_string())
+    print()
+
+    results = {
+        f"trial {step} ({args.response_mode})": float(trials[step].median()) for step in steps
+    }
+    results.update(
+        {
+            f"trial total, {phase} {feedback} ({args.response_mode})": float(duration)
+            for (phase, feedback), duration in by_condition["total"].items()
+        }
+    )
+    results[f"run per flip ({args.response_mode})"] = float(trials["run_per_flip"].median())
+    results["instruction page"] = float(np.median(page_durations))
+    print("Medians:")
+    ok = baseline.check(
+        "trial_suite",
+        results,
+        args.tolerance,
+        slack=SLACK,
+        update=args.update_baseline,
+        unit="µs",
+        scale=1e6,
+    )
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,11 @@ conditions_file = "conditions.csv"
 ## Responses
 button_left = "f"
 button_right = "j"
+## How responses are collected
+## "keyboard": poll psychopy's `hardware.keyboard` every frame (stimuli stay on screen and are
+##   redrawn while waiting, RTs are timestamped by the keyboard backend, sub-millisecond with psychtoolbox)
+## "event": wait with `event.waitKeys` (blocks until a key is pressed, coarser RTs)
+response_mode = "keyboard"  # ["keyboard", "event"]
 
 ## Quit button (don't tell participants)
 button_quit = "q"
@@ -78,6 +83,12 @@ pos_right = +0.25
 symbol_width = 0.24
 symbol_height = 0.24
 
+## Symbol image cache
+## All symbol images used in a session are decoded once at startup and kept in memory.
+image_cache_size = 24  # maximum number of decoded images kept (least recently used ones are dropped)
+cache_explicit_labels = True  # render the explicit-phase lottery labels to textures once at the start
+cache_outcome_texts = True  # lay out all outcome feedback texts once at the start
+
 ## Outcome text
 outcome_color = "forestgreen"
 outcome_color_counterfactual = "gray"
@@ -97,6 +108,21 @@ fb_rect_linecolor = "black"
 ## Animation
 animation_speed = 0.5  # speed of the flicker, 0 is no animation, I think :)
 
+## Choice animation of the symbols (slot machine)
+## - "movie": stream the mp4s in `stim/images/<Set>/anim` with a movie decoder in every trial
+## - "preloaded": decode all mp4s of the stimulus set into memory once at the start, play frames from there
+## - "procedural": roll the symbol images while drawing them (no mp4s needed), see scroll settings below
+animation_mode = "movie"  # ["movie", "preloaded", "procedural"]
+animation_preload_max_mb = 1024  # memory limit for "preloaded" animations (~64 MB per animation)
+
+## Scroll settings for "procedural" animations
+## (these correspond to the arguments of `stim/images/slot_animation.py`)
+animation_scroll_duration = 2.0  # duration of the full roll in seconds (`--duration`)
+animation_scroll_speed = 1600.0  # average speed in image pixels per second (`--rotation_speed`)
+animation_scroll_axis = "vertical"  # ["vertical", "horizontal"] (`--axis`)
+animation_scroll_acceleration_duration = 0.1  # seconds (`--acceleration_duration`)
+animation_scroll_deceleration_duration = 0.1  # seconds (`--deceleration_duration`)
+
 # Screen
 fullscreen = True
 screen_size = [1280, 1080]  # ignored, if fullscreen = True, I think
@@ -104,6 +130,18 @@ monitor = "testMonitor"  # name of the monitor configuration used (see PsychoPy
 
 # Logfile
 logfile_folder = "data"  # folder where to save logfiles
+## Stream every finished trial to `<logfile>_trials.jsonl` while the task runs,
+## so the data of a crashed or quit session is not lost (the usual .csv is still saved at the end)
+log_stream = True  # [True, False]
+log_fsync_interval = 1.0  # seconds between forced writes to disk of the streamed log
+## Write a checkpoint after every trial to `<logfile>_checkpoint.jsonl`, so that a crashed or
+## quit session can be continued at the next trial with `python task.py --resume data/<logfile>`
+checkpoint = True  # [True, False]
+## Record the time of every screen flip, and log intended vs. achieved durations of the
+## trial phases and dropped frames for every trial (all flips are saved to `<logfile>_flips.csv`)
+record_flips = True  # [True, False]
+flip_drop_tolerance = 1.5  # flips later than this many frame periods count as dropped frames
+print_trial_info = False  # [True, False] print every trial's information to the console (slows down the trial loop)
 
 # External Hardware
 ## Tobii eye-tracker via titta
@@ -115,8 +153,27 @@ if use_eyetracker:
     eyetracker_name = 'Tobii X3-120 EPU'
     eyetracker_n_calibration_targets = 9
     eyetracker_debug = False
+    ### Stream the gaze samples to `<logfile>_eyetracking_gaze.npy` while recording (with the messages
+    ### in `<logfile>_eyetracking_messages.csv`), instead of keeping them in memory until the end
+    eyetracker_stream = True  # [True, False]
+    eyetracker_stream_interval = 0.5  # seconds between writes
+    eyetracker_stream_chunk_size = 600  # most samples per write
     VIEWING_DIST = 63  # distance from eye to center of screen (cm)
     SCREEN_WIDTH = 52.7  # cm
     
 ## Serial port
 use_serialport = False
+if use_serialport:
+    serialport_name = "COM3"  # e.g., "/dev/ttyUSB0" on Linux
+    serialport_baudrate = 115200
+    serialport_pulse_duration = 0.01  # seconds a trigger code stays up before it is reset to 0
+    ### Trigger codes (1-255) of trial events. Events without a code send no trigger.
+    serialport_codes = {
+        "stimulus on": 1,
+        "responded": 2,
+        "timed out": 3,
+        "choice on": 4,
+        "choice off": 5,
+        "outcome on": 6,
+        "outcome off": 7,
+    }
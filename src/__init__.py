@@ -1,2 +1,37 @@
-from .slideshow import ImageSlide, SlideShow, TextSlide
-from .trial import Trial
\ No newline at end of file
+"""
+Building blocks of the task.
+
+Classes are imported when they are first used (e.g., `from src import Trial`),
+so that tools that do not show anything (simulation, analysis) can use
+`src` without importing psychopy.
+"""
+import importlib
+
+_modules = dict(
+    ImageSlide=".slideshow",
+    SlideShow=".slideshow",
+    TextSlide=".slideshow",
+    Trial=".trial",
+    ImageCache=".imagecache",
+    MovieBank=".animation",
+    PreloadedMovieStim=".animation",
+    ScrollingImageStim=".animation",
+    TrialLogWriter=".logwriter",
+    Checkpoint=".checkpoint",
+    TrialRecord=".schedule",
+    FlipRecorder=".frametiming",
+    MessageDispatcher=".eyetracking",
+    GazeRecorder=".eyetracking",
+    TriggerPort=".triggers",
+    LabelCache=".labelcache",
+    OutcomeTextCache=".labelcache",
+    StartupProfiler=".startup",
+)
+
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    if name in _modules:
+        return getattr(importlib.import_module(_modules[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
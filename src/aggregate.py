@@ -0,0 +1,208 @@
+"""
+Collect the trial logs of all sessions into one store.
+
+Finds all session logfiles (`task-<label>_subject-*_date-*_time-*.csv`) in a
+folder, reads the new ones in a process pool with fixed column types
+("None", "nan" and empty cells become missing values, numeric columns are
+floats, so a timeout is a missing `choice` instead of turning the column
+into text)
+and joins in the settings of each session from its `_settings.json`
+(random seed, stimulus set, stimulus map).
+
+The store is a folder of NumPy structured arrays (see
+`src.schedule.to_structured_array`): every aggregation run that finds new
+sessions appends one `part-<n>.npy` file, and `manifest.json` lists which
+logfiles are in which part, so sessions are only read once. Parts are
+memory-mapped when loading (`load_store()`).
+
+Usage:
+    python -m src.aggregate data --store data/aggregate
+"""
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from .schedule import to_structured_array
+
+LOGFILE_PATTERN = re.compile(
+    r"^task-(?P<label>.+)_subject-(?P<subject>.+)_date-(?P<date>\d+)_time-(?P<time>\d+)\.csv$"
+)
+MISSING = ["None", "nan", "NaN", ""]  # psychopy writes missing values with `str()`
+
+# Columns that are always text (everything else is numeric if it can be)
+TEXT_COLUMNS = [
+    "phase", "trial_type", "symbol1", "symbol2", "option1pos", "feedback",
+    "outcome_randomness", "image1", "image2", "video1", "video2", "response",
+    "subject", "session", "session_file", "date", "time", "stimulus_set",
+    "stimulus_map",
+]  # fmt: skip
+INTEGER_COLUMNS = ["block", "trial_id"]
+# Columns that are always numbers (as are the `duration_*` columns of frame timing)
+NUMERIC_COLUMNS = [
+    "potential_outcome1", "potential_outcome2", "probability1", "probability2",
+    "actual_outcome1", "actual_outcome2", "training_repeat", "pos1", "pos2", "iti",
+    "choice", "rt", "obtained_reward", "cumulative_reward", "prepare_duration",
+    "animation_frames_dropped", "n_flips", "frames_dropped", "image_cache_hits",
+    "image_cache_misses",
+]  # fmt: skip
+
+
+def find_sessions(folder, experiment_label=None):
+    """Logfile names (not paths) of all sessions in `folder`, sorted."""
+    names = []
+    for name in os.listdir(folder):
+        match = LOGFILE_PATTERN.match(name)
+        if match and (experiment_label is None or match["label"] == experiment_label):
+            names.append(name)
+    return sorted(names)
+
+
+def enforce_types(log):
+    """Give every column of a trial log its type (text, int or float; missing values as NaN)."""
+    log = log.copy()
+    for column in log.columns:
+        values = log[column]
+        if column in TEXT_COLUMNS:
+            log[column] = values.where(values.isna(), values.astype(str)).astype(object)
+        elif column in INTEGER_COLUMNS:
+            log[column] = pd.to_numeric(values).astype(np.int64)
+        elif column in NUMERIC_COLUMNS or column.startswith("duration_"):
+            log[column] = pd.to_numeric(values, errors="coerce").astype(float)
+        elif not pd.api.types.is_numeric_dtype(values):
+            numeric = pd.to_numeric(values, errors="coerce")
+            if numeric.notna().sum() == values.notna().sum():
+                log[column] = numeric.astype(float)
+            else:  # not a number column
+                log[column] = values.where(values.isna(), values.astype(str)).astype(object)
+        else:
+            log[column] = values.astype(float)
+    return log
+
+
+def read_session(path):
+    """Read one session's trial log ("None", "nan" and empty cells as NaN) and its settings (if the `_settings.json` exists)."""
+    name = os.path.basename(path)
+    log = pd.read_csv(
+        path,
+        na_values=MISSING,
+        keep_default_na=False,
+        dtype={column: str for column in TEXT_COLUMNS},
+    )
+    log = log.drop(columns=[c for c in log.columns if c.startswith("Unnamed")])
+    match = LOGFILE_PATTERN.match(name)
+    log["session_file"] = name
+    log["date"] = match["date"]
+    log["time"] = match["time"]
+
+    settings_path = path[: -len(".csv")] + "_settings.json"
+    settings = {}
+    if os.path.exists(settings_path):
+        with open(settings_path) as file:
+            settings = json.load(file)
+    log["random_seed"] = settings.get("random_seed", np.nan)
+    log["stimulus_set"] = settings.get("Stimulus-Set", np.nan)
+    log["stimulus_map"] = (
+        json.dumps(settings["stimulus_map"]) if "stimulus_map" in settings else np.nan
+    )
+    return log
+
+
+def read_manifest(store):
+    path = join(store, "manifest.json")
+    if not os.path.exists(path):
+        return dict(parts=[], sessions={})
+    with open(path) as file:
+        return json.load(file)
+
+
+def aggregate(folder, store, experiment_label=None, n_jobs=None):
+    """
+    Add the sessions in `folder` that are not in `store` yet as a new part.
+
+    Returns:
+        list: Logfile names that were added
+    """
+    manifest = read_manifest(store)
+    new = [
+        name
+        for name in find_sessions(folder, experiment_label)
+        if name not in manifest["sessions"]
+    ]
+    if not new:
+        return []
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        logs = list(
+            pool.map(read_session, [join(folder, name) for name in new], chunksize=8)
+        )
+    part = f"part-{len(manifest['parts']) + 1:05d}.npy"
+    os.makedirs(store, exist_ok=True)
+    # Types are fixed on all new sessions at once (a column can be all missing in single sessions)
+    trials = enforce_types(pd.concat(logs, ignore_index=True))
+    np.save(join(store, part), to_structured_array(trials))
+    manifest["parts"].append(part)
+    for name, log in zip(new, logs):
+        manifest["sessions"][name] = dict(part=part, n_trials=len(log))
+    # Write the manifest last, so an interrupted run leaves the store as it was
+    with open(join(store, "manifest.json.tmp"), "w") as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(join(store, "manifest.json.tmp"), join(store, "manifest.json"))
+    return new
+
+
+def load_store(store):
+    """All trials in `store` as a pandas.DataFrame (missing text as NaN, as in `enforce_types()`)."""
+    manifest = read_manifest(store)
+    frames = [
+        pd.DataFrame(np.load(join(store, part), mmap_mode="r")) for part in manifest["parts"]
+    ]
+    if not frames:
+        return pd.DataFrame()
+    trials = pd.concat(frames, ignore_index=True)
+    text = trials.select_dtypes(exclude="number").columns
+    trials[text] = trials[text].replace("", np.nan)
+    return trials
+
+
+def main():
+    import settings
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "folder", nargs="?", default=settings.logfile_folder, help="Folder with the logfiles"
+    )
+    parser.add_argument("--store", default=join(settings.logfile_folder, "aggregate"))
+    parser.add_argument(
+        "--label",
+        default=settings.experiment_label,
+        help="Only sessions of this experiment label (default: the one in settings.py)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="Worker processes (default: all cores)"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    added = aggregate(args.folder, args.store, experiment_label=args.label, n_jobs=args.jobs)
+    print(
+        f"Added {len(added)} new sessions to '{args.store}' in {time.perf_counter() - start:.2f} s."
+    )
+    start = time.perf_counter()
+    trials = load_store(args.store)
+    n_sessions = trials["session_file"].nunique() if len(trials) else 0
+    print(
+        f"Store has {len(trials)} trials of {n_sessions} sessions "
+        + f"(loaded in {time.perf_counter() - start:.2f} s)."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+from psychopy import visual, core
+import numpy as np
+from glob import glob
+from os.path import join
+from PIL import Image
+
+from .scroll import scroll_displacement
+
+
+def load_movie_frames(filename, max_bytes=None):
+    """
+    Decode a movie file into memory.
+
+    Raises a `MemoryError` before decoding if the frames would need more than
+    `max_bytes` (estimated from the duration, frame rate and frame size).
+
+    Returns:
+        frames (numpy.ndarray): uint8 array of shape (n_frames, height, width, 3),
+            flipped vertically so that frames can be handed to `visual.ImageStim` directly
+        fps (float): frame rate of the movie
+    """
+    import imageio_ffmpeg
+
+    reader = imageio_ffmpeg.read_frames(filename)
+    meta = next(reader)
+    width, height = meta["size"]
+    if max_bytes is not None:
+        n_frames = int(np.ceil(meta["duration"] * meta["fps"]))
+        if n_frames * height * width * 3 > max_bytes:
+            reader.close()
+            raise MemoryError(f"Decoding '{filename}' needs more than {max_bytes / 1e6:.0f} MB.")
+    frames = [
+        np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3)
+        for frame in reader
+    ]
+    frames = np.ascontiguousarray(np.stack(frames)[:, ::-1])
+    return frames, float(meta["fps"])
+
+
+class MovieBank(object):
+    """
+    Decoded frames of all choice animations (`anim/*.mp4`) of a stimulus set.
+
+    Movies are decoded once when the bank is created, and kept as float32
+    intensities in [-1, 1] (as `visual.ImageStim` expects). Loading stops with a
+    `MemoryError` if the decoded frames would exceed `max_mb` megabytes (checked
+    for every movie before it is decoded). `upload()` then makes one `ImageStim`
+    per frame, so playing a movie only switches between textures.
+    """
+
+    def __init__(self, stimulus_set, image_dir=join("stim", "images"), max_mb=1024):
+        self.stimulus_set = str(stimulus_set)
+        self.max_mb = max_mb
+        self.movies = {}
+        self.stims = {}
+        self.nbytes = 0
+        for filename in sorted(glob(join(image_dir, self.stimulus_set, "anim", "*.mp4"))):
+            try:
+                # Frames are kept as float32 (4 bytes per value instead of 1)
+                frames, fps = load_movie_frames(filename, max_bytes=(max_mb * 1e6 - self.nbytes) / 4)
+            except MemoryError:
+                frames = None
+            if frames is None or self.nbytes + 4 * frames.nbytes > max_mb * 1e6:
+                raise MemoryError(
+                    f"Preloading choice animations of '{self.stimulus_set}' needs more than `animation_preload_max_mb` ({max_mb} MB)."
+                )
+            # Converted to the intensities ImageStim expects ([-1, 1]) once, here
+            frames = frames.astype(np.float32)
+            frames /= 127.5
+            frames -= 1
+            self.nbytes += frames.nbytes
+            self.movies[filename] = (frames, fps)
+        print(
+            f"Preloaded {len(self.movies)} choice animations ({self.nbytes / 1e6:.0f} MB)."
+        )
+
+    def __getitem__(self, filename):
+        return self.movies[filename]
+
+    def upload(self, win, **kwargs):
+        """Make one `visual.ImageStim` per frame of every movie (once, shared by all stimuli that play them)."""
+        if self.stims:
+            return
+        for filename, (frames, fps) in self.movies.items():
+            self.stims[filename] = [
+                visual.ImageStim(win=win, image=frame, **kwargs) for frame in frames
+            ]
+
+
+class PreloadedMovieStim(object):
+    """
+    Plays movies from a `MovieBank` by frame index.
+
+    Mirrors the parts of the `visual.MovieStim` interface used by `Trial`,
+    so it can be used in its place. There is no decoder to open per trial:
+    `setFilename` only selects the frames to show, and every frame is a
+    texture made once by `MovieBank.upload()`. The frame shown at each
+    `draw()` follows the movie's fps, so frames that are skipped because
+    draws come too late are counted in `frames_dropped`.
+    """
+
+    def __init__(self, win=None, movies=None, **kwargs):
+        self.win = win
+        self.movies = movies
+        self.pos = kwargs.pop("pos", (0, 0))
+        self.kwargs = kwargs
+        self.movies.upload(win, **self.kwargs)
+        self.frames = None
+        self._stims = None
+        self.fps = None
+        self.frames_dropped = 0
+        self._start = None
+        self._index = -1
+
+    def setFilename(self, filename):
+        self.frames, self.fps = self.movies[filename]
+        self._stims = self.movies.stims[filename]
+        self.frames_dropped = 0
+        self.stop()
+
+    def setPos(self, pos):
+        self.pos = pos
+
+    def play(self):
+        self._start = None
+        self._index = -1
+        self.frames_dropped = 0
+
+    def draw(self):
+        now = core.getTime()
+        if self._start is None:
+            self._start = now
+        index = min(int((now - self._start) * self.fps), len(self.frames) - 1)
+        if index != self._index:
+            if index > self._index + 1:
+                self.frames_dropped += index - self._index - 1
+            self._index = index
+        # Frame stims are shared with the other stimulus (the other position)
+        stim = self._stims[index]
+        stim.pos = self.pos
+        stim.draw()
+
+    def stop(self):
+        self._start = None
+        self._index = -1
+
+    def unload(self):
+        pass
+
+
+class ScrollingImageStim(object):
+    """
+    Rolls symbol images along an axis at draw time.
+
+    Instead of playing a prerendered movie, the texture coordinates of the
+    (already loaded) image are shifted every frame following the same
+    acceleration / constant speed / deceleration profile that
+    `stim/images/slot_animation.py` uses to render the mp4s.
+    All `images` are loaded as textures when the stimulus is created, so
+    `setImage` only selects one of them.
+    """
+
+    def __init__(
+        self,
+        win=None,
+        images=None,
+        duration=2.0,
+        rotation_speed=1600.0,
+        axis="vertical",
+        acceleration_duration=0.1,
+        deceleration_duration=0.1,
+        **kwargs,
+    ):
+        self.win = win
+        if axis not in ["vertical", "horizontal"]:
+            raise ValueError(
+                f"`axis` must be one of ['vertical', 'horizontal'], but is '{axis}'."
+            )
+        self.duration = duration
+        self.rotation_speed = rotation_speed
+        self.axis = axis
+        self.acceleration_duration = acceleration_duration
+        self.deceleration_duration = deceleration_duration
+        self.kwargs = kwargs
+        self.pos = kwargs.pop("pos", (0, 0))
+        # Gratings wrap their texture around, which is exactly the roll we need
+        self._textures = {}
+        for image in images:
+            with Image.open(image) as im:
+                width, height = im.size
+            self._textures[image] = (
+                visual.GratingStim(win=win, tex=image, mask=None, **self.kwargs),
+                height if axis == "vertical" else width,
+            )
+        self._texture = None
+        self._start = None
+
+    def setImage(self, image):
+        self._texture = self._textures[image]
+        self.stop()
+
+    def setPos(self, pos):
+        self.pos = pos
+
+    def play(self):
+        self._start = None
+
+    def draw(self):
+        now = core.getTime()
+        if self._start is None:
+            self._start = now
+        grating, image_size = self._texture
+        offset = scroll_displacement(
+            now - self._start,
+            self.duration,
+            self.rotation_speed,
+            self.acceleration_duration,
+            self.deceleration_duration,
+        )
+        # Phase is given in fractions of the texture. A positive offset moves the
+        # image content down (vertical) or right (horizontal), as `np.roll` does.
+        phase = float(offset) / image_size % 1
+        if self.axis == "vertical":
+            grating.phase = (0, phase)
+        else:
+            grating.phase = (-phase, 0)
+        grating.pos = self.pos
+        grating.draw()
+
+    def stop(self):
+        self._start = None
+        if self._texture is not None:
+            self._texture[0].phase = (0, 0)
+
+    def unload(self):
+        pass
@@ -0,0 +1,110 @@
+import atexit
+import json
+import os
+
+import numpy as np
+
+from .logwriter import _to_json
+
+
+def _random_state():
+    """State of numpy's global random number generator, as JSON serializable dict."""
+    state = np.random.get_state(legacy=False)
+    state["state"]["key"] = state["state"]["key"].tolist()
+    return state
+
+
+class Checkpoint(object):
+    """
+    Append-only checkpoint of a running session, for `python task.py --resume <logfile>`.
+
+    After every trial, `save()` appends one JSON line with the position in
+    the schedule (index of the completed trial, its phase, training repeat
+    and block), `total_reward` and the trial's logged row, and flushes it to
+    the operating system. The cost per trial is the same for the first and
+    the last trial (the file is never rewritten), and a line always holds a
+    trial's row together with the state after it. The state of numpy's global
+    random number generator is only added when it changed since the last line
+    (trial randomness comes from the compiled schedule, so it usually does not).
+
+    A crash or `core.quit()` loses nothing but the trial that was running.
+    `os.fsync` is only called on `close()`, so a power cut or system crash can
+    lose the last lines. When an existing checkpoint is continued (a resumed
+    session), an incomplete last line is cut off first, so new lines never
+    start in the middle of it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.n_saved = 0
+        self._last_random_state = None
+        _truncate_partial_line(path)
+        self._file = open(path, "a", encoding="utf-8")
+        atexit.register(self.close)
+
+    def save(self, state, row):
+        """Append the session `state` (dict) after a trial, together with the trial's `row`."""
+        line = dict(state=dict(state), row=row)
+        random_state = np.random.get_state(legacy=False)
+        if self._last_random_state is None or not (
+            random_state["state"]["pos"] == self._last_random_state["state"]["pos"]
+            and np.array_equal(
+                random_state["state"]["key"], self._last_random_state["state"]["key"]
+            )
+        ):
+            line["state"]["random_state"] = _random_state()
+            self._last_random_state = random_state
+        self._file.write(json.dumps(line, default=_to_json) + "\n")
+        self._file.flush()
+        self.n_saved += 1
+
+    def close(self):
+        """Sync the checkpoint to disk and close it."""
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def _truncate_partial_line(path):
+    """Cut off an incomplete last line of `path` (a crash while it was written)."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file:
+        content = file.read()
+        if content and not content.endswith(b"\n"):
+            file.truncate(content.rfind(b"\n") + 1)
+
+
+def load_checkpoint(path):
+    """
+    Read a session checkpoint written by `Checkpoint`.
+
+    Lines that cannot be read (e.g., incomplete because the session died while
+    writing them) are skipped.
+
+    Returns:
+        dict: State after the last completed trial (with the last recorded `random_state`), or None if no trial was completed
+        list: Logged rows of all completed trials, in order
+    """
+    state, rows, random_state = None, [], None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            state = entry["state"]
+            random_state = state.get("random_state", random_state)
+            rows.append(entry["row"])
+    if state is not None:
+        state["random_state"] = random_state
+    return state, rows
+
+
+def restore_random_state(random_state):
+    """Set numpy's global random number generator to a state recorded by `Checkpoint`."""
+    random_state = dict(random_state, state=dict(random_state["state"]))
+    random_state["state"]["key"] = np.array(random_state["state"]["key"], dtype=np.uint32)
+    np.random.set_state(random_state)
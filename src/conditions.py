@@ -0,0 +1,398 @@
+"""
+Conditions files: loading them (validated, cached) and generating them from a design spec.
+
+`load_conditions()` checks a conditions file completely when it is first
+loaded (columns, allowed values, types) and caches the parsed table,
+keyed by the file's content hash, so later loads of the same file skip
+parsing and checks. Trials can therefore rely on valid conditions.
+
+A design (a dict, or a json file with the same structure, see `DESIGN`)
+names the symbol pairs of every context with their outcomes and
+probabilities, and for every phase the feedback types, the number of
+repetitions and the number of blocks. `make_conditions()` crosses every pair
+with every feedback type and both positions of option 1 (`option1pos`
+left/right), so that each combination occurs exactly `repetitions` times per
+block. Transfer pairs can be listed or be "all" pairs of learning symbols.
+
+With `outcome_randomness` "pseudorandom", outcomes are fixed in the file
+with exact proportions: in every block, each symbol gives its outcome in
+exactly round(probability x its number of trials) trials, in a random order.
+`make_variants()` draws these orders for many participants at once.
+
+Usage:
+    python -m src.conditions --variants 100 --output stim/conditions
+"""
+import argparse
+import hashlib
+import json
+import os
+from itertools import combinations
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from .schedule import PHASES
+
+# Columns of a conditions file, in the order `task.py` expects them
+COLUMNS = [
+    "phase", "block", "trial_id", "trial_type", "symbol1", "symbol2", "option1pos",
+    "feedback", "potential_outcome1", "potential_outcome2", "probability1",
+    "probability2", "actual_outcome1", "actual_outcome2", "outcome_randomness",
+]  # fmt: skip
+
+# Allowed values of the categorical columns
+CATEGORIES = dict(
+    phase=PHASES,
+    option1pos=["left", "right"],
+    feedback=["complete", "partial", "none", "skip"],
+    outcome_randomness=["random", "pseudorandom"],
+)
+INTEGER_COLUMNS = ["block", "trial_id"]
+FLOAT_COLUMNS = [
+    "potential_outcome1", "potential_outcome2", "probability1", "probability2",
+    "actual_outcome1", "actual_outcome2",
+]  # fmt: skip
+CACHE_VERSION = 1  # change when the parsed format changes, to invalidate cached files
+
+# Contexts and explicit lotteries of the bundled `conditions.csv`, at full length
+DESIGN = dict(
+    contexts=dict(
+        training=dict(pairs=[["T1", "T2"], ["T3", "T4"]], outcome=1, probabilities=[0.75, 0.25]),
+        wide=dict(pairs=[["A", "B"], ["C", "D"]], outcome=10, probabilities=[0.75, 0.25]),
+        narrow=dict(pairs=[["E", "F"], ["G", "H"]], outcome=1, probabilities=[0.75, 0.25]),
+    ),
+    training=dict(
+        contexts=["training"],
+        feedback=["complete", "partial", "none", "skip"],
+        repetitions=1,
+        blocks=1,
+    ),
+    learning=dict(contexts=["wide", "narrow"], feedback=["complete"], repetitions=5, blocks=2),
+    transfer=dict(pairs="all", feedback=["none"], repetitions=2, blocks=1),
+    explicit=dict(
+        # trial_type: [potential_outcome1, potential_outcome2, probability1, probability2]
+        lotteries={
+            "magnitude1_dev2.25": [1, 10, 0.25, 0.25],
+            "magnitude2_dev6.75": [1, 10, 0.75, 0.75],
+            "magnitude3_dev9.0": [1, 10, 1.0, 1.0],
+            "probability1_dev1.5": [1, 10, 1.0, 0.25],
+            "probability2_dev4.0": [1, 10, 1.0, 0.5],
+            "probability3_dev6.5": [1, 10, 1.0, 0.75],
+            "key-transfer_dev1.75": [1, 10, 0.75, 0.25],
+            "key-transfer_dev7.25": [1, 10, 0.25, 0.75],
+        },
+        repetitions=1,
+        blocks=1,
+    ),
+    outcome_randomness="random",
+)
+
+
+def _symbols(design):
+    """Outcome, probability and context of every symbol in the design's contexts."""
+    symbols = {}
+    for name, context in design["contexts"].items():
+        for pair in context["pairs"]:
+            for symbol, probability in zip(pair, context["probabilities"]):
+                if symbol in symbols:
+                    raise ValueError(f"Symbol '{symbol}' is in more than one context pair.")
+                symbols[symbol] = (context["outcome"], probability, name)
+    return symbols
+
+
+def make_conditions(design=DESIGN):
+    """
+    The conditions of a design, with the columns of a conditions file (`COLUMNS`).
+
+    Outcomes of "pseudorandom" designs are left missing here (see `make_variants()`).
+
+    Returns:
+        pandas.DataFrame
+    """
+    symbols = _symbols(design)
+    rows = []
+    for phase in PHASES:
+        spec = design.get(phase)
+        if spec is None:
+            continue
+        if phase == "explicit":
+            trials = [
+                dict(
+                    trial_type=trial_type,
+                    symbol1=None,
+                    symbol2=None,
+                    potential_outcome1=o1,
+                    potential_outcome2=o2,
+                    probability1=p1,
+                    probability2=p2,
+                    feedback="none",
+                )
+                for trial_type, (o1, o2, p1, p2) in spec["lotteries"].items()
+            ]
+        else:
+            if phase == "transfer":
+                pairs = spec["pairs"]
+                if pairs == "all":
+                    learning = [
+                        symbol
+                        for name in design["learning"]["contexts"]
+                        for pair in design["contexts"][name]["pairs"]
+                        for symbol in pair
+                    ]
+                    pairs = list(combinations(learning, 2))
+                pairs = [(pair, "transfer") for pair in pairs]
+            else:
+                pairs = [
+                    (pair, name)
+                    for name in spec["contexts"]
+                    for pair in design["contexts"][name]["pairs"]
+                ]
+            trials = []
+            for (symbol1, symbol2), trial_type in pairs:
+                for symbol in [symbol1, symbol2]:
+                    if symbol not in symbols:
+                        raise ValueError(
+                            f"Symbol '{symbol}' of the {phase} phase is not in any context."
+                        )
+                for feedback in spec["feedback"]:
+                    trials.append(
+                        dict(
+                            trial_type=trial_type,
+                            symbol1=symbol1,
+                            symbol2=symbol2,
+                            potential_outcome1=symbols[symbol1][0],
+                            potential_outcome2=symbols[symbol2][0],
+                            probability1=symbols[symbol1][1],
+                            probability2=symbols[symbol2][1],
+                            feedback=feedback,
+                        )
+                    )
+        for block in range(1, spec["blocks"] + 1):
+            trial_id = 1
+            for trial in trials:
+                for option1pos in ["left", "right"]:
+                    for _ in range(spec["repetitions"]):
+                        rows.append(
+                            dict(
+                                trial,
+                                phase=phase,
+                                block=block,
+                                trial_id=trial_id,
+                                option1pos=option1pos,
+                            )
+                        )
+                        trial_id += 1
+
+    conditions = pd.DataFrame(rows)
+    pseudorandom = design["outcome_randomness"] == "pseudorandom"
+    # Explicit-phase outcomes are always drawn with the shown probabilities
+    conditions["outcome_randomness"] = np.where(
+        pseudorandom & (conditions["phase"] != "explicit"), "pseudorandom", "random"
+    )
+    conditions["actual_outcome1"] = np.nan
+    conditions["actual_outcome2"] = np.nan
+    return conditions[COLUMNS]
+
+
+def make_variants(conditions, n, rng=None):
+    """
+    Fix the outcomes of the "pseudorandom" trials of `conditions` for `n` participants at once.
+
+    Within every phase and block, each symbol gives its `potential_outcome`
+    in exactly round(probability x number of its trials) of its trials (and
+    0 in the others), in a random order for every participant.
+
+    Returns:
+        numpy.ndarray: `actual_outcome1` and `actual_outcome2` of every variant, shape (n, n_trials, 2)
+    """
+    rng = np.random.default_rng(rng)
+    n_trials = len(conditions)
+    # one slot per option of every trial (option 1 of all trials, then option 2)
+    symbol = np.concatenate([conditions["symbol1"].values, conditions["symbol2"].values])
+    outcome = np.concatenate(
+        [conditions["potential_outcome1"].values, conditions["potential_outcome2"].values]
+    ).astype(float)
+    probability = np.concatenate(
+        [conditions["probability1"].values, conditions["probability2"].values]
+    ).astype(float)
+    fixed = np.tile((conditions["outcome_randomness"] == "pseudorandom").values, 2)
+    if not fixed.any():
+        return np.full((n, n_trials, 2), np.nan)
+    group_keys = pd.MultiIndex.from_arrays(
+        [np.tile(conditions["phase"].values, 2), np.tile(conditions["block"].values, 2), symbol]
+    )
+    group = np.where(fixed, pd.factorize(group_keys)[0], -1)
+    group_size = np.bincount(group[fixed], minlength=group.max() + 1)
+    # number of trials with outcome per group (same probability for all trials of a symbol)
+    n_hits = np.zeros(len(group_size))
+    n_hits[group[fixed]] = np.round(probability[fixed] * group_size[group[fixed]])
+
+    # random rank of every slot within its group, for every variant at once
+    keys = rng.random((n, 2 * n_trials)) + np.where(fixed, group, -1)
+    order = keys.argsort(axis=1)
+    group_start = np.concatenate([[0], np.cumsum(group_size)[:-1]]) + (~fixed).sum()
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(2 * n_trials)[None, :], axis=1)
+    rank = rank - np.where(fixed, group_start[np.maximum(group, 0)], 0)
+    hit = rank < np.where(fixed, n_hits[np.maximum(group, 0)], 0)
+
+    actual = np.where(fixed, np.where(hit, outcome, 0.0), np.nan)
+    return np.stack([actual[:, :n_trials], actual[:, n_trials:]], axis=-1)
+
+
+def write_conditions(conditions, path):
+    """Write a conditions file ("None" for missing values, like the bundled one)."""
+    conditions[COLUMNS].to_csv(path, index=False, na_rep="None")
+
+
+def _rows(mask):
+    """Line numbers in the file (header is line 1) of the rows in `mask`, for error messages."""
+    lines = (np.flatnonzero(np.asarray(mask)) + 2).tolist()
+    return ", ".join(map(str, lines[:10])) + (", ..." if len(lines) > 10 else "")
+
+
+def parse_conditions(conditions):
+    """
+    Check a conditions table (as read from the csv file) and give its columns their types.
+
+    Raises a ValueError listing all problems at once. Categorical columns
+    (`CATEGORIES`) become pandas categoricals, `block` and `trial_id`
+    integers, outcomes and probabilities floats (missing as NaN); "None"
+    entries are missing values.
+
+    Returns:
+        pandas.DataFrame
+    """
+    conditions = conditions.replace("None", np.nan)
+    missing_columns = [column for column in COLUMNS if column not in conditions.columns]
+    if missing_columns:
+        raise ValueError(f"Conditions are missing the column(s) {missing_columns}.")
+    errors = []
+    parsed = pd.DataFrame(index=conditions.index)
+    for column in COLUMNS:
+        values = conditions[column]
+        if column in CATEGORIES:
+            invalid = ~values.isin(CATEGORIES[column])
+            if invalid.any():
+                errors.append(
+                    f"`{column}` must be one of {CATEGORIES[column]}, but is "
+                    + f"{sorted(set(values[invalid].astype(str)))} (lines {_rows(invalid)})."
+                )
+            parsed[column] = pd.Categorical(values, categories=CATEGORIES[column])
+        elif column in INTEGER_COLUMNS or column in FLOAT_COLUMNS:
+            numeric = pd.to_numeric(values, errors="coerce")
+            invalid = numeric.isna() & values.notna()
+            if column in INTEGER_COLUMNS:
+                invalid |= numeric.isna() | (numeric != numeric.round())
+            if invalid.any():
+                errors.append(
+                    f"`{column}` must be {'an integer' if column in INTEGER_COLUMNS else 'a number'} "
+                    + f"(lines {_rows(invalid)})."
+                )
+            parsed[column] = numeric.astype(float)
+        else:
+            parsed[column] = values.where(values.isna(), values.astype(str)).astype(object)
+
+    for i in [1, 2]:
+        probability = parsed[f"probability{i}"]
+        invalid = ~probability.between(0, 1)
+        if invalid.any():
+            errors.append(f"`probability{i}` must be between 0 and 1 (lines {_rows(invalid)}).")
+        invalid = parsed[f"potential_outcome{i}"].isna()
+        if invalid.any():
+            errors.append(f"`potential_outcome{i}` is missing (lines {_rows(invalid)}).")
+        invalid = (parsed["outcome_randomness"] == "pseudorandom") & parsed[
+            f"actual_outcome{i}"
+        ].isna()
+        if invalid.any():
+            errors.append(
+                f"`actual_outcome{i}` must be given if `outcome_randomness` is 'pseudorandom' "
+                + f"(lines {_rows(invalid)})."
+            )
+        invalid = (parsed["phase"] != "explicit") & parsed[f"symbol{i}"].isna()
+        if invalid.any():
+            errors.append(
+                f"`symbol{i}` is missing outside the explicit phase (lines {_rows(invalid)})."
+            )
+    if errors:
+        raise ValueError("Invalid conditions:\n- " + "\n- ".join(errors))
+
+    parsed[INTEGER_COLUMNS] = parsed[INTEGER_COLUMNS].astype(np.int64)
+    # Keep any extra columns as they are
+    extra = [column for column in conditions.columns if column not in COLUMNS]
+    return pd.concat([parsed, conditions[extra]], axis=1)
+
+
+def load_conditions(path, cache_dir=None):
+    """
+    Load a conditions file, checked and typed (see `parse_conditions()`).
+
+    The parsed table is cached in `cache_dir` (default: `.cache` next to the
+    file) under the hash of the file's content and the pandas and NumPy
+    versions, so a file is only parsed and checked once, and every change to
+    it is checked again. A cached file that cannot be read is parsed again
+    and replaced.
+
+    Returns:
+        pandas.DataFrame
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+    versions = f"v{CACHE_VERSION}-pandas{pd.__version__}-numpy{np.__version__}"
+    key = hashlib.sha256(content + versions.encode()).hexdigest()[:16]
+    if cache_dir is None:
+        cache_dir = join(os.path.dirname(path), ".cache")
+    cache_path = join(cache_dir, f"conditions-{key}.pkl")
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception:  # e.g., written by another pandas version: parse again
+            pass
+
+    try:
+        conditions = parse_conditions(pd.read_csv(path))
+    except ValueError as error:
+        raise ValueError(f"'{path}': {error}") from None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        conditions.to_pickle(cache_path + ".tmp")
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError:
+        pass  # read-only folder: just don't cache
+    return conditions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--design", default=None, help="Design json file (default: `DESIGN`)")
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=1,
+        help="Number of files (participants); they only differ with pseudorandom outcomes",
+    )
+    parser.add_argument("--output", default=join("stim", "conditions"))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    design = DESIGN
+    if args.design is not None:
+        with open(args.design) as file:
+            design = json.load(file)
+    conditions = make_conditions(design)
+    actual_outcomes = make_variants(conditions, args.variants, rng=args.seed)
+    os.makedirs(args.output, exist_ok=True)
+    for i, outcomes in enumerate(actual_outcomes):
+        conditions[["actual_outcome1", "actual_outcome2"]] = outcomes
+        write_conditions(conditions, join(args.output, f"conditions_{i + 1:04d}.csv"))
+    print(
+        f"Wrote {args.variants} conditions files with {len(conditions)} trials each to '{args.output}' "
+        + f"({conditions.groupby('phase', sort=False).size().to_dict()})."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+import csv
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+_STOP = object()  # tells the dispatcher thread to finish
+
+
+class MessageDispatcher(object):
+    """
+    Sends eye-tracker messages from a background thread.
+
+    The trial code calls `send(message, t)` with the (psychopy clock) time the
+    message belongs to, usually the timestamp returned by `win.flip()`. The
+    message is queued and passed to `eyetracker.send_message(message, ts)` by
+    a worker thread, with `t` converted to the eye tracker's clock (Tobii
+    system time, in microseconds). So the SDK call no longer runs in the frame
+    loop, and the message time is the flip time instead of the time the call
+    returned.
+
+    The offset between the two clocks is estimated once at the start (the
+    sample with the shortest round trip of `n_sync` samples). Eye trackers
+    without `get_system_time_stamp()` (e.g., some dummy modes), or with
+    `n_sync=0`, get the messages without a time, and stamp them when they arrive.
+
+    With a `recorder`, every message is also passed to
+    `recorder.add_message()`, to be stored with the streamed samples.
+    """
+
+    def __init__(self, eyetracker, clock=None, n_sync=20, recorder=None):
+        self.eyetracker = eyetracker
+        self.recorder = recorder  # `GazeRecorder` that also gets every message
+        if clock is None:
+            from psychopy import core
+
+            clock = core.getTime
+        self.clock = clock
+        self.offset = self.estimate_offset(n_sync)
+        self.n_sent = 0
+        self.latencies = []  # time from `send()` to the end of `eyetracker.send_message()` (s)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name="MessageDispatcher", daemon=True)
+        self._thread.start()
+
+    def estimate_offset(self, n_sync=20):
+        """Offset (µs) to add to psychopy clock times (in µs) to get eye tracker system times."""
+        if n_sync == 0 or not hasattr(self.eyetracker, "get_system_time_stamp"):
+            return None
+        best = None
+        for _ in range(n_sync):
+            t0 = self.clock()
+            ts = self.eyetracker.get_system_time_stamp()
+            t1 = self.clock()
+            if best is None or t1 - t0 < best[0]:
+                best = (t1 - t0, ts - (t0 + t1) / 2 * 1e6)
+        return best[1]
+
+    def send(self, message, t=None):
+        """Queue `message` with the psychopy clock time `t` it belongs to (default: now). Does not block."""
+        if t is None:
+            t = self.clock()
+        self._queue.put((message, t, time.perf_counter()))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            message, t, queued = item
+            if self.offset is None:
+                ts = None
+                self.eyetracker.send_message(message)
+            else:
+                ts = int(round(t * 1e6 + self.offset))
+                self.eyetracker.send_message(message, ts=ts)
+            if self.recorder is not None:
+                self.recorder.add_message(message, ts)
+            self.latencies.append(time.perf_counter() - queued)
+            self.n_sent += 1
+
+    def close(self):
+        """Send all queued messages and stop the dispatcher thread (call before saving the eye tracker data)."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+def _npy_header(dtype, n, size):
+    """Header of a .npy file with `n` records of `dtype`, padded to `size` bytes (so it can be rewritten in place)."""
+    header = repr(
+        dict(descr=np.lib.format.dtype_to_descr(dtype), fortran_order=False, shape=(n,))
+    )
+    padding = size - len(np.lib.format.magic(1, 0)) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError(f"The header of {dtype} does not fit into {size} bytes.")
+    header = (header + " " * padding + "\n").encode("latin1")
+    return np.lib.format.magic(1, 0) + struct.pack("<H", len(header)) + header
+
+
+class GazeRecorder(object):
+    """
+    Streams eye-tracker samples to disk while recording, from a background thread.
+
+    Recording is started and stopped through the recorder (`start_recording()`
+    and `stop_recording()` take the arguments of Titta's methods of the same
+    name). While recording, a worker thread empties the Titta buffer of
+    `stream` every `interval` seconds, in chunks of at most `chunk_size`
+    samples (`eyetracker.buffer.consume_N()`), and appends them to
+    `<path>_<stream>.npy`. So the samples of a session are not kept in memory
+    until `eyetracker.save_data()` at the end, and a crash loses at most the
+    last `interval` seconds.
+
+    The samples are consumed: they are taken out of Titta's buffer, and the
+    .h5 file of `eyetracker.save_data()` only has the messages, calibrations
+    and system info, not the samples of `stream`. To get all of them into the
+    .npy file, `stop_recording()` stops the background thread, writes the
+    samples that are left, stops the eye tracker's recording and then writes
+    the samples that arrived in the meantime. `close()` does the same if the
+    recording was not stopped yet, so it has to come before `save_data()`.
+
+    The .npy file is a structured array with one field per numeric column of
+    the stream (the columns of the first chunk). Its header is rewritten after
+    every chunk, so the file is always complete and can be read while the
+    session runs (`numpy.load(path, mmap_mode="r")`). Messages (`add_message()`,
+    e.g., from a `MessageDispatcher`) go to `<path>_messages.csv` with their
+    time and the index of the first sample at or after it (`sample`), so they
+    can be placed between the samples.
+
+    Eye trackers without `buffer` (e.g., Titta's dummy mode before the first
+    calibration) are skipped until they have one.
+    """
+
+    HEADER_SIZE = 4096  # bytes
+
+    def __init__(self, eyetracker, path, stream="gaze", interval=0.5, chunk_size=600):
+        self.eyetracker = eyetracker
+        self.stream = stream
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.samples_path = f"{path}_{stream}.npy"
+        self.messages_path = f"{path}_messages.csv"
+        self.dtype = None
+        self.n_samples = 0
+        self.n_chunks = 0
+        self.flush_durations = []  # time to consume and write every chunk (s)
+        self._samples_file = None
+        self._messages_file = open(self.messages_path, "w", newline="")
+        self._messages = csv.writer(self._messages_file)
+        self._messages.writerow(["system_time_stamp", "sample", "message"])
+        self._pending = queue.Queue()  # messages waiting for their sample
+        self._waiting = []  # (ts, message) of messages later than the last written sample
+        self._last_chunk = (0, np.empty(0))  # index of the first sample and timestamps of the last chunk
+        self._recording_kwargs = None  # arguments of `start_recording()` while recording
+        self._lock = threading.Lock()
+        self._recording = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._work, name="GazeRecorder", daemon=True)
+        self._thread.start()
+
+    def start_recording(self, **kwargs):
+        """Start the eye tracker's recording (`eyetracker.start_recording(**kwargs)`) and empty its buffer in the background."""
+        self.eyetracker.start_recording(**kwargs)
+        self._recording_kwargs = kwargs
+        self._recording.set()
+
+    def stop_recording(self, **kwargs):
+        """
+        Stop the background draining, write the samples that are left, then stop the
+        eye tracker's recording (`eyetracker.stop_recording(**kwargs)`) and write the
+        samples that arrived until then.
+        """
+        self._recording.clear()
+        with self._lock:  # waits for a drain of the background thread to finish
+            self._drain()
+            self.eyetracker.stop_recording(**kwargs)
+            self._recording_kwargs = None
+            self._drain(final=True)
+
+    def add_message(self, message, ts=None):
+        """Store `message` with its eye tracker time `ts` (default: now). Does not block."""
+        if ts is None and hasattr(self.eyetracker, "get_system_time_stamp"):
+            ts = self.eyetracker.get_system_time_stamp()
+        self._pending.put((ts, message))
+
+    def _work(self):
+        while not self._closed.wait(self.interval):
+            with self._lock:
+                if self._recording.is_set():
+                    self._drain()
+
+    def _drain(self, final=False):
+        buffer = getattr(self.eyetracker, "buffer", None)
+        if buffer is not None:
+            while True:
+                start = time.perf_counter()
+                n = self._write_samples(buffer.consume_N(self.stream, self.chunk_size))
+                if n == 0:
+                    break
+                self.flush_durations.append(time.perf_counter() - start)
+                if n < self.chunk_size:
+                    break
+        self._write_messages(final)
+
+    def _write_samples(self, chunk):
+        columns = {name: np.asarray(values) for name, values in chunk.items()}
+        n = len(columns.get("system_time_stamp", ()))
+        if n == 0:
+            return 0
+        if self._samples_file is None:
+            self.dtype = np.dtype(
+                [
+                    (name, values.dtype)
+                    for name, values in columns.items()
+                    if values.ndim == 1 and values.dtype.kind in "biuf"
+                ]
+            )
+            self._samples_file = open(self.samples_path, "wb")
+            self._samples_file.write(_npy_header(self.dtype, 0, self.HEADER_SIZE))
+        samples = np.empty(n, dtype=self.dtype)
+        for name in self.dtype.names:
+            samples[name] = columns[name]
+        samples = samples[np.argsort(samples["system_time_stamp"], kind="stable")]
+
+        # Data first, then the sample count, so the file is complete at any time
+        self._samples_file.seek(0, 2)
+        self._samples_file.write(samples.tobytes())
+        self._samples_file.seek(0)
+        self._samples_file.write(_npy_header(self.dtype, self.n_samples + n, self.HEADER_SIZE))
+        self._samples_file.flush()
+
+        # Messages up to the last sample of this chunk can be placed now
+        self._collect_messages()
+        timestamps = samples["system_time_stamp"]
+        placed = [(ts, message) for ts, message in self._waiting if ts <= timestamps[-1]]
+        self._waiting = [(ts, message) for ts, message in self._waiting if ts > timestamps[-1]]
+        for ts, message in placed:
+            if ts < timestamps[0] and len(self._last_chunk[1]):
+                # arrived after its samples were written (at most one chunk late)
+                first, previous = self._last_chunk
+                sample = first + int(np.searchsorted(previous, ts))
+            else:
+                sample = self.n_samples + int(np.searchsorted(timestamps, ts))
+            self._messages.writerow([ts, sample, message])
+        self._last_chunk = (self.n_samples, timestamps)
+        self.n_samples += n
+        self.n_chunks += 1
+        return n
+
+    def _collect_messages(self):
+        while True:
+            try:
+                ts, message = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if ts is None:  # no time: at the current end of the samples
+                self._messages.writerow(["", self.n_samples, message])
+            else:
+                self._waiting.append((ts, message))
+        self._waiting.sort(key=lambda item: item[0])
+
+    def _write_messages(self, final=False):
+        """Write the messages that are later than all samples so far (all of them if `final`)."""
+        self._collect_messages()
+        if final:
+            for ts, message in self._waiting:
+                self._messages.writerow([ts, self.n_samples, message])
+            self._waiting = []
+        self._messages_file.flush()
+
+    def close(self):
+        """
+        Stop the recording if it still runs (as `stop_recording()`, with the arguments
+        of `start_recording()`), write everything that is left and close the files.
+        Call before `eyetracker.save_data()`.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        if self._recording_kwargs is not None:
+            self.stop_recording(**self._recording_kwargs)
+        with self._lock:
+            self._drain(final=True)
+        if self._samples_file is not None:
+            self._samples_file.close()
+        self._messages_file.close()
+
+
+class DummyBuffer(object):
+    """
+    Stand-in for Titta's sample buffer (`eyetracker.buffer`).
+
+    Samples arrive at `sampling_rate` per second (`n_columns` random gaze
+    columns and `system_time_stamp` in µs of `time.perf_counter`) and are
+    handed out, oldest first, by `consume_N()`. No samples arrive between
+    `stop()` and `start()`. `max_held` is the largest number of samples that
+    waited in the buffer.
+    """
+
+    def __init__(self, sampling_rate=120, n_columns=30, seed=None):
+        self.sampling_rate = sampling_rate
+        self.columns = [f"gaze_{i}" for i in range(n_columns)]
+        self.n_consumed = 0
+        self.max_held = 0
+        self._start = time.perf_counter()
+        self._stopped = None  # time of `stop()` while stopped
+        self._rng = np.random.default_rng(seed)
+
+    def start(self):
+        if self._stopped is not None:
+            self._start += time.perf_counter() - self._stopped
+            self._stopped = None
+
+    def stop(self):
+        if self._stopped is None:
+            self._stopped = time.perf_counter()
+
+    @property
+    def n_arrived(self):
+        """Number of samples that arrived so far."""
+        now = time.perf_counter() if self._stopped is None else self._stopped
+        return int((now - self._start) * self.sampling_rate)
+
+    def consume_N(self, stream, N=None):
+        available = self.n_arrived - self.n_consumed
+        self.max_held = max(self.max_held, available)
+        n = available if N is None else min(N, available)
+        index = self.n_consumed + np.arange(n)
+        self.n_consumed += n
+        samples = dict(
+            system_time_stamp=np.round((self._start + index / self.sampling_rate) * 1e6).astype(np.int64)
+        )
+        for column in self.columns:
+            samples[column] = self._rng.random(n)
+        return samples
+
+
+class DummyEyetracker(object):
+    """
+    Stand-in for a Titta eye tracker that only keeps the messages it gets.
+
+    `call_duration` (s) simulates the time an SDK call takes. With a
+    `sampling_rate`, it also has a `buffer` of samples (`DummyBuffer`), which
+    only get samples while recording.
+    """
+
+    def __init__(self, call_duration=0.0, sampling_rate=None):
+        self.call_duration = call_duration
+        self.messages = []
+        self.recording = False
+        if sampling_rate is not None:
+            self.buffer = DummyBuffer(sampling_rate)
+            self.buffer.stop()
+
+    def start_recording(self, **kwargs):
+        self.recording = True
+        if hasattr(self, "buffer"):
+            self.buffer.start()
+
+    def stop_recording(self, **kwargs):
+        if self.call_duration:
+            time.sleep(self.call_duration)  # samples still arrive
+        self.recording = False
+        if hasattr(self, "buffer"):
+            self.buffer.stop()
+
+    def get_system_time_stamp(self):
+        return int(time.perf_counter() * 1e6)
+
+    def send_message(self, msg, ts=None):
+        if self.call_duration:
+            time.sleep(self.call_duration)
+        if ts is None:
+            ts = self.get_system_time_stamp()
+        self.messages.append((ts, msg))
+
+
+if __name__ == "__main__":
+    # Measure how long sending messages takes in the frame loop and in the queue:
+    # python -m src.eyetracking [n_messages] [simulated SDK call duration in ms]
+    import sys
+
+    import numpy as np
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    call_duration = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0005
+    frame_period = 1 / 60
+
+    eyetracker = DummyEyetracker(call_duration=call_duration)
+    dispatcher = MessageDispatcher(eyetracker, clock=time.perf_counter)
+    send_durations = []
+    flip_times = []
+    for i in range(n):
+        flip_time = time.perf_counter()  # stands in for the time returned by `win.flip()`
+        flip_times.append(flip_time)
+        start = time.perf_counter()
+        dispatcher.send(f"message {i}", flip_time)
+        send_durations.append(time.perf_counter() - start)
+        time.sleep(frame_period / 4)  # a few messages per frame
+    dispatcher.close()
+    # both clocks are the same here, so message times should equal the flip times
+    timestamp_errors = np.array([ts for ts, msg in eyetracker.messages]) - np.array(flip_times) * 1e6
+    send_durations = np.array(send_durations) * 1e6
+    latencies = np.array(dispatcher.latencies) * 1e3
+    print(f"{n} messages, simulated SDK call: {call_duration * 1e3:.2f} ms")
+    print(
+        f"Time in the frame loop per message: median {np.median(send_durations):.1f} µs, "
+        + f"max {send_durations.max():.1f} µs (synchronous: {call_duration * 1e6:.0f} µs or more)"
+    )
+    print(
+        f"Queue latency until sent: median {np.median(latencies):.2f} ms, "
+        + f"95th percentile {np.percentile(latencies, 95):.2f} ms, max {latencies.max():.2f} ms"
+    )
+    print(f"Largest message time error: {np.abs(timestamp_errors).max():.1f} µs")
@@ -0,0 +1,250 @@
+"""
+Fit the models in `src.models` to the choices of logged sessions.
+
+Every session's trial log is compiled into arrays once (`compile_session()`:
+integer codes of symbols, contexts and choices, outcomes, which outcomes
+were shown). The log-likelihood is then evaluated for many parameter sets
+at once, with the models' NumPy batches (`log_likelihood()`): one pass over
+the trials updates all candidate parameter sets together.
+
+Learning follows the task: outcomes are only learned if they were shown
+(both with "complete" feedback, the chosen one with "partial", none with
+"none" or "skip", e.g., in the transfer phase), and trials without response
+are skipped. In the explicit phase, options are valued by their expected
+value (probability x outcome), as in `src.simulation`. By default, training
+trials are learned from but not counted in the likelihood, and neither are
+explicit choices: they do not depend on learned values, and choices between
+shown expected values are usually much more deterministic than choices
+between learned ones, so a shared inverse temperature would be pulled up by
+them (`--phases learning transfer explicit` counts them anyway).
+
+Parameters are fitted by a batched random search that narrows down around
+the best candidates (`fit()`), and sessions are fitted in parallel in a
+process pool (`fit_sessions()`).
+
+Usage:
+    python -m src.fitting --store data/aggregate --models qlearning relative range
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+from .models import MODELS, observed_outcomes, sample_parameters
+from .simulation import encode_symbols
+
+FIT_PHASES = ("learning", "transfer")
+
+
+def compile_session(log, phases=FIT_PHASES):
+    """
+    Arrays of one session's trial log (in presentation order) for `log_likelihood()`.
+
+    Only choices in `phases` count in the likelihood, but all trials with
+    shown outcomes are learned from.
+
+    Returns:
+        dict
+    """
+    log = log.reset_index(drop=True)
+    symbol1, symbol2, context, symbols, contexts = encode_symbols(
+        log["symbol1"], log["symbol2"]
+    )
+    choice = pd.to_numeric(log["choice"], errors="coerce").values
+    responded = (choice == 1) | (choice == 2)
+    choice = np.where(responded, choice, 0).astype(int)
+    observed1, observed2 = observed_outcomes(log["feedback"].astype(str).values, choice)
+    explicit = (log["phase"] == "explicit").values
+    value1, value2 = (
+        pd.to_numeric(log[f"probability{i}"], errors="coerce").values
+        * pd.to_numeric(log[f"potential_outcome{i}"], errors="coerce").values
+        for i in [1, 2]
+    )
+    return dict(
+        symbol1=symbol1,
+        symbol2=symbol2,
+        context=context,
+        choice=choice,
+        responded=responded,
+        counted=responded & log["phase"].isin(phases).values,
+        explicit=explicit,
+        observed1=observed1 & responded,
+        observed2=observed2 & responded,
+        outcome1=np.nan_to_num(pd.to_numeric(log["actual_outcome1"], errors="coerce").values),
+        outcome2=np.nan_to_num(pd.to_numeric(log["actual_outcome2"], errors="coerce").values),
+        value1=np.where(explicit, value1, 0.0),
+        value2=np.where(explicit, value2, 0.0),
+        n_symbols=len(symbols),
+        n_contexts=len(contexts),
+        n_choices=int((responded & log["phase"].isin(phases).values).sum()),
+    )
+
+
+def log_likelihood(model, session):
+    """Log-likelihood of the session's counted choices for every parameter set of `model` (array)."""
+    model.reset(session["n_symbols"], session["n_contexts"])
+    total = np.zeros(model.n)
+    for t in np.flatnonzero(session["responded"]):
+        if session["explicit"][t]:
+            value1, value2 = session["value1"][t], session["value2"][t]
+        else:
+            value1, value2 = model.values(
+                session["symbol1"][t], session["symbol2"][t], session["context"][t]
+            )
+        if session["counted"][t]:
+            p = model.p_choose_1(value1, value2)
+            if session["choice"][t] == 2:
+                p = 1 - p
+            total += np.log(np.maximum(p, 1e-12))
+        if not session["explicit"][t]:
+            model.update(
+                session["symbol1"][t],
+                session["symbol2"][t],
+                session["outcome1"][t],
+                session["outcome2"][t],
+                session["observed1"][t],
+                session["observed2"][t],
+                session["context"][t],
+            )
+    return total
+
+
+def fit(model_class, session, n_candidates=1000, n_rounds=8, n_best=50, rng=None):
+    """
+    Maximum-likelihood parameters of `model_class` for one compiled session.
+
+    Draws `n_candidates` parameter sets uniformly within the model's bounds,
+    then, for `n_rounds`, draws new ones from a normal distribution around
+    the `n_best` best so far (clipped to the bounds).
+
+    Returns:
+        dict: Best parameters and their log-likelihood
+    """
+    rng = np.random.default_rng(rng)
+    names = model_class.parameter_names
+    lower = np.array([model_class.bounds[name][0] for name in names])
+    upper = np.array([model_class.bounds[name][1] for name in names])
+    candidates = np.column_stack(
+        list(sample_parameters(model_class, n_candidates, rng=rng).values())
+    )
+    best, best_ll = None, np.empty(0)
+    for i in range(n_rounds + 1):
+        ll = log_likelihood(model_class(**dict(zip(names, candidates.T))), session)
+        pool = candidates if best is None else np.vstack([best, candidates])
+        pool_ll = np.concatenate([best_ll, ll])
+        order = np.argsort(pool_ll)[::-1][:n_best]
+        best, best_ll = pool[order], pool_ll[order]
+        if i < n_rounds:
+            spread = np.maximum(best.std(axis=0), 1e-3 * (upper - lower))
+            candidates = np.clip(
+                rng.normal(best.mean(axis=0), spread, size=(n_candidates, len(names))),
+                lower,
+                upper,
+            )
+    return dict(zip(names, best[0].tolist()), log_likelihood=float(best_ll[0]))
+
+
+def _fit_session(task):
+    """Fit one model to one session (runs in the worker processes)."""
+    name, log, model_name, phases, options, seed = task
+    session = compile_session(log, phases)
+    model_class = MODELS[model_name]
+    result = fit(model_class, session, rng=seed, **options)
+    k, n = len(model_class.parameter_names), session["n_choices"]
+    result.update(
+        session=name,
+        model=model_name,
+        n_choices=n,
+        aic=2 * k - 2 * result["log_likelihood"],
+        bic=k * np.log(max(n, 1)) - 2 * result["log_likelihood"],
+    )
+    return result
+
+
+def fit_sessions(logs, models=tuple(MODELS), phases=FIT_PHASES, n_jobs=None, seed=None, **options):
+    """
+    Fit every model to every session in a process pool.
+
+    Args:
+        logs (dict): Trial log (pandas.DataFrame) of every session, by session name
+        models (list): Model names (keys of `src.models.MODELS`)
+        options: Passed on to `fit()` (e.g., `n_candidates`)
+
+    Returns:
+        pandas.DataFrame: One row per session and model
+    """
+    tasks = [(name, log, model) for name, log in logs.items() for model in models]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(
+            pool.map(
+                _fit_session,
+                [task + (phases, options, task_seed) for task, task_seed in zip(tasks, seeds)],
+            )
+        )
+    columns = ["session", "model", "n_choices", "log_likelihood", "aic", "bic"]
+    results = pd.DataFrame(results)
+    return results[columns + [c for c in results.columns if c not in columns]]
+
+
+def load_logs(folder=None, store=None, experiment_label=None):
+    """Trial logs by session (logfile name), from a folder of logfiles or an aggregated store (`src.aggregate`)."""
+    from .aggregate import enforce_types, find_sessions, load_store, read_session
+
+    if store is not None:
+        trials = load_store(store)
+    else:
+        names = find_sessions(folder, experiment_label)
+        trials = enforce_types(
+            pd.concat([read_session(join(folder, name)) for name in names], ignore_index=True)
+        )
+    return {name: log for name, log in trials.groupby("session_file", sort=False)}
+
+
+def main():
+    import settings
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "folder", nargs="?", default=settings.logfile_folder, help="Folder with the logfiles"
+    )
+    parser.add_argument("--store", default=None, help="Aggregated store (instead of the folder)")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--phases", nargs="+", default=list(FIT_PHASES))
+    parser.add_argument("--candidates", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="Worker processes (default: all cores)"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=join(settings.logfile_folder, "fits.csv"))
+    args = parser.parse_args()
+
+    logs = load_logs(args.folder, args.store, settings.experiment_label)
+    start = time.perf_counter()
+    fits = fit_sessions(
+        logs,
+        models=args.models,
+        phases=args.phases,
+        n_jobs=args.jobs,
+        seed=args.seed,
+        n_candidates=args.candidates,
+        n_rounds=args.rounds,
+    )
+    print(
+        f"Fitted {len(args.models)} models to {len(logs)} sessions in {time.perf_counter() - start:.1f} s."
+    )
+    print(fits.groupby("model")[["log_likelihood", "aic", "bic"]].sum().round(1).to_string())
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    fits.to_csv(args.output, index=False)
+    print(f"Wrote '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import numpy as np
+
+# Parts of a trial whose flips are recorded, in the order they are shown
+PHASES = ("stimulus", "choice", "outcome", "iti")
+
+
+class FlipRecorder(object):
+    """
+    Records the time of every window flip, labelled with trial and trial phase.
+
+    Use `flip(phase)` instead of `win.flip()`. Timestamps (as returned by
+    `win.flip()`) go into preallocated arrays, so recording costs about a
+    microsecond per flip. Everything else (durations, dropped frames) is
+    computed once per trial in `trial_summary()`.
+
+    A frame counts as dropped if two consecutive flips of the same phase are
+    more than `tolerance` frame periods apart (flips of different phases are
+    usually separated by waits on purpose).
+    """
+
+    def __init__(self, win, frame_period=None, tolerance=1.5, clock=None, capacity=100000):
+        self.win = win
+        self.frame_period = win.monitorFramePeriod if frame_period is None else frame_period
+        self.tolerance = tolerance
+        if clock is None:
+            from psychopy import core
+
+            clock = core.getTime
+        self.clock = clock
+        self.times = np.empty(capacity)
+        self.trials = np.empty(capacity, dtype=np.int32)
+        self.phases = np.empty(capacity, dtype=np.int8)
+        self.n = 0
+        self.trial = -1
+        self._trial_start = 0  # index of the first flip of the current trial
+        self._phase_codes = {phase: code for code, phase in enumerate(PHASES)}
+
+    def start_trial(self):
+        """Start recording flips of the next trial."""
+        self.trial += 1
+        self._trial_start = self.n
+
+    def flip(self, phase):
+        """Flip the window and record the flip time. Returns it like `win.flip()`."""
+        t = self.win.flip()
+        if self.n == len(self.times):
+            self._grow()
+        self.times[self.n] = t
+        self.trials[self.n] = self.trial
+        self.phases[self.n] = self._phase_codes[phase]
+        self.n += 1
+        return t
+
+    def _grow(self):
+        self.times = np.concatenate([self.times, np.empty_like(self.times)])
+        self.trials = np.concatenate([self.trials, np.empty_like(self.trials)])
+        self.phases = np.concatenate([self.phases, np.empty_like(self.phases)])
+
+    def trial_summary(self, intended, end=None):
+        """
+        Intended and achieved duration of every phase of the current trial, and its dropped frames.
+
+        A phase lasts from its first flip to the first flip of the next phase
+        (the last phase until `end`, by default now).
+
+        Args:
+            intended (dict): Intended duration (s) of each phase in `PHASES` that was shown
+
+        Returns:
+            dict: `duration_<phase>_intended`, `duration_<phase>_achieved`, `n_flips`
+                and `frames_dropped`, to add to the trial log
+        """
+        end = self.clock() if end is None else end
+        times = self.times[self._trial_start : self.n]
+        phases = self.phases[self._trial_start : self.n]
+
+        # Onset of every phase is its first flip (flips are in chronological order)
+        onsets = {}
+        for i in np.flatnonzero(np.r_[True, phases[1:] != phases[:-1]]):
+            onsets.setdefault(PHASES[phases[i]], times[i])
+        offsets = dict(zip(onsets, list(onsets.values())[1:] + [end]))
+
+        summary = {}
+        for phase in PHASES:
+            summary[f"duration_{phase}_intended"] = intended.get(phase, np.nan)
+            summary[f"duration_{phase}_achieved"] = (
+                offsets[phase] - onsets[phase] if phase in onsets else np.nan
+            )
+
+        intervals = np.diff(times)[phases[1:] == phases[:-1]]
+        late = intervals[intervals > self.tolerance * self.frame_period]
+        summary["n_flips"] = len(times)
+        summary["frames_dropped"] = int(np.sum(np.round(late / self.frame_period) - 1))
+        return summary
+
+    def to_frame(self):
+        """All recorded flips as a pandas.DataFrame (trial, phase, time, interval to the previous flip)."""
+        import pandas as pd
+
+        times = self.times[: self.n]
+        return pd.DataFrame(
+            dict(
+                trial=self.trials[: self.n],
+                phase=np.array(PHASES)[self.phases[: self.n]],
+                time=times,
+                interval=np.r_[np.nan, np.diff(times)],
+            )
+        )
+
+    def save(self, path):
+        self.to_frame().to_csv(path, index=False)
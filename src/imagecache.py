@@ -0,0 +1,64 @@
+from psychopy import visual
+from collections import OrderedDict
+from os.path import join
+
+
+class ImageCache(object):
+    """
+    Bounded cache of decoded symbol images.
+
+    Every cached entry is a `visual.ImageStim` that already holds its texture,
+    so handing it to a trial is just swapping stimulus objects without any
+    file I/O or texture upload. Entries are keyed by (stimulus set, file name)
+    and the least recently used entry is evicted once `capacity` is exceeded.
+    """
+
+    def __init__(self, win=None, capacity=24, image_dir=join("stim", "images"), **kwargs):
+        self.win = win
+        self.capacity = capacity
+        self.image_dir = image_dir
+        self.kwargs = kwargs  # passed on to every `visual.ImageStim`
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stims = OrderedDict()
+
+    def __len__(self):
+        return len(self._stims)
+
+    def __contains__(self, key):
+        return key in self._stims
+
+    def path(self, stimulus_set, file_name):
+        return join(self.image_dir, str(stimulus_set), file_name)
+
+    def preload(self, stimulus_set, file_names):
+        """Decode all `file_names` of `stimulus_set` up front (e.g., all images in the stimulus map)."""
+        file_names = list(file_names)
+        if len(file_names) > self.capacity:
+            print(
+                f"ImageCache: Preloading {len(file_names)} images with capacity {self.capacity}. Some will be evicted again."
+            )
+        for file_name in file_names:
+            key = (str(stimulus_set), file_name)
+            if key not in self._stims:
+                self._load(key)
+
+    def get(self, stimulus_set, file_name):
+        """Return the `visual.ImageStim` showing `file_name` of `stimulus_set`, decoding it on a miss."""
+        key = (str(stimulus_set), file_name)
+        stim = self._stims.get(key)
+        if stim is not None:
+            self.hits += 1
+            self._stims.move_to_end(key)
+            return stim
+        self.misses += 1
+        return self._load(key)
+
+    def _load(self, key):
+        stim = visual.ImageStim(self.win, image=self.path(*key), **self.kwargs)
+        self._stims[key] = stim
+        while len(self._stims) > self.capacity:
+            self._stims.popitem(last=False)
+            self.evictions += 1
+        return stim
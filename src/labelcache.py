@@ -0,0 +1,180 @@
+import numpy as np
+from psychopy import visual
+
+
+def explicit_label(probability, outcome):
+    """Text of an explicit-phase lottery (e.g., "75%\\n\\n10 Pkt.")."""
+    return f"{(float(probability) * 100):.0f}%\n\n{float(outcome):.0f} Pkt."
+
+
+class LabelCache(object):
+    """
+    Explicit-phase lottery labels, rendered to textures once.
+
+    Every label is laid out by a `visual.TextStim` only once, drawn on top of
+    its background rectangle, and captured into a `visual.BufferImageStim`.
+    Trials then draw the captured quad, and the opacity animation only
+    changes its alpha instead of re-rendering text. Entries are keyed by
+    (slot, label text); slot `i` uses `templates[i]` (the TextStim that would
+    show the label otherwise, for font, size, color and position) and
+    `backgrounds[i]` (the rectangle behind it).
+    """
+
+    def __init__(self, win, templates, backgrounds, inset=0.9):
+        self.win = win
+        self.templates = templates
+        self.backgrounds = backgrounds
+        self.inset = inset  # captured part of the background rectangle (fraction of its size)
+        self.hits = 0
+        self.misses = 0
+        self._stims = {}
+
+    def __len__(self):
+        return len(self._stims)
+
+    def preload(self, labels):
+        """Render all `(slot, text)` labels up front (e.g., of all explicit trials in the schedule)."""
+        for key in labels:
+            if key not in self._stims:
+                self._render(key)
+        # don't show the captured labels on the next flip
+        self.win.clearBuffer()
+
+    def get(self, slot, text):
+        """Return the stimulus showing `text` in `slot`, rendering it on a miss."""
+        stim = self._stims.get((slot, text))
+        if stim is not None:
+            self.hits += 1
+            return stim
+        self.misses += 1
+        stim = self._render((slot, text))
+        self.win.clearBuffer()
+        return stim
+
+    def _render(self, key):
+        slot, text = key
+        template, background = self.templates[slot], self.backgrounds[slot]
+        template.setText(text)
+        template.setOpacity(1)
+
+        # Capture the inner part of the background rectangle (in norm units, [left, top, right, bottom])
+        width_pix, height_pix = self.win.size
+        x, y = background.pos  # height units
+        width, height = background.size[0] * self.inset, background.size[1] * self.inset
+        aspect = height_pix / width_pix
+        rect = [
+            (2 * x - width) * aspect,
+            2 * y + height,
+            (2 * x + width) * aspect,
+            2 * y - height,
+        ]
+        stim = visual.BufferImageStim(self.win, stim=[background, template], rect=rect)
+        stim.setPos((x * height_pix, y * height_pix))  # BufferImageStims use pixel units
+        self._stims[key] = stim
+        return stim
+
+
+def outcome_text(outcome):
+    """Text of an outcome in the feedback, as `TextStim.setText()` shows the number (e.g., "10.0" or "-2.5")."""
+    return str(outcome)
+
+
+class OutcomeTextCache(object):
+    """
+    Outcome feedback texts, laid out once.
+
+    Holds one `visual.TextStim` per (x position, text, color), e.g., for all
+    outcomes of a session and "?", at both positions and in the chosen and
+    counterfactual colors. Showing feedback is then just picking prebuilt
+    stimuli, without text layout right before the outcome flip.
+    `kwargs` (e.g., `height`) are passed on to every `visual.TextStim`.
+    """
+
+    def __init__(self, win, **kwargs):
+        self.win = win
+        self.kwargs = kwargs
+        self.hits = 0
+        self.misses = 0
+        self._stims = {}
+
+    def __len__(self):
+        return len(self._stims)
+
+    def preload(self, positions, texts, colors):
+        """Lay out every combination of x `positions`, `texts` and `colors` up front."""
+        for x in positions:
+            for text in texts:
+                for color in colors:
+                    key = (float(x), text, str(color))
+                    if key not in self._stims:
+                        self._stims[key] = self._make(x, text, color)
+
+    def get(self, x, text, color):
+        """Return the stimulus showing `text` in `color` at x position `x`, laying it out on a miss."""
+        key = (float(x), text, str(color))
+        stim = self._stims.get(key)
+        if stim is not None:
+            self.hits += 1
+            return stim
+        self.misses += 1
+        stim = self._stims[key] = self._make(x, text, color)
+        return stim
+
+    def _make(self, x, text, color):
+        return visual.TextStim(self.win, text=text, pos=(x, 0), color=color, **self.kwargs)
+
+
+def preload_caches(
+    win,
+    schedule,
+    templates,
+    backgrounds,
+    positions,
+    colors,
+    labels=True,
+    outcomes=True,
+    **kwargs,
+):
+    """
+    Label and outcome text caches with everything the session's `schedule` will show.
+
+    Args:
+        templates, backgrounds (list): Explicit-phase TextStims and background rectangles (see `LabelCache`)
+        positions (list): x positions of the outcomes (left, right)
+        colors (list): Outcome colors (chosen and counterfactual)
+        labels, outcomes (bool): Whether to make the label cache and the outcome cache (otherwise None)
+        kwargs: Passed on to every outcome TextStim (e.g., `height`)
+
+    Returns:
+        LabelCache or None, OutcomeTextCache or None
+    """
+    label_cache = None
+    if labels:
+        label_cache = LabelCache(win, templates=templates, backgrounds=backgrounds)
+        explicit_trials = schedule.loc[schedule["phase"] == "explicit"]
+        label_cache.preload(
+            {
+                (slot, explicit_label(probability, outcome))
+                for slot in [0, 1]
+                for probability, outcome in zip(
+                    explicit_trials[f"probability{slot + 1}"],
+                    explicit_trials[f"potential_outcome{slot + 1}"],
+                )
+            }
+        )
+    outcome_cache = None
+    if outcomes:
+        outcome_cache = OutcomeTextCache(win, **kwargs)
+        feedback_trials = schedule.loc[schedule["feedback"].isin(["complete", "partial"])]
+        outcome_cache.preload(
+            positions=positions,
+            texts={
+                outcome_text(outcome)
+                for outcome in np.concatenate(
+                    [feedback_trials["actual_outcome1"], feedback_trials["actual_outcome2"]]
+                )
+            }
+            | {"?"},
+            colors=colors,
+        )
+    return label_cache, outcome_cache
@@ -0,0 +1,158 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+_STOP = object()  # tells the writer thread to finish
+
+
+def _to_json(value):
+    """Make numpy scalars and other odd values JSON serializable."""
+    if isinstance(value, np.floating):
+        # keep the digits `str()` shows in the csv file (e.g., of float32)
+        return float(str(value))
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class TrialLogWriter(object):
+    """
+    Append-only trial log that is written while the session runs.
+
+    Every row passed to `write()` is handed to a background thread that
+    appends it as one JSON line to `path` and flushes it to the operating
+    system right away. `os.fsync` is only called every `fsync_interval`
+    seconds (and on `close()`), so the trial loop never waits for the disk.
+    A crash or `core.quit()` therefore loses at most the rows of the last
+    `fsync_interval` seconds (and only on a power cut or system crash).
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.n_rows = 0
+        self._queue = queue.Queue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._work, name="TrialLogWriter", daemon=True)
+        self._thread.start()
+        # make sure everything is written when the experiment is quit
+        atexit.register(self.close)
+
+    def write(self, row):
+        """Queue a row (dict of column name -> value). Does not block."""
+        self._queue.put(row)
+
+    def _work(self):
+        last_sync = time.monotonic()
+        dirty = False
+        while True:
+            try:
+                row = self._queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                row = None
+            if row is not None and row is not _STOP:
+                self._file.write(json.dumps(row, default=_to_json) + "\n")
+                self._file.flush()
+                self.n_rows += 1
+                dirty = True
+            if dirty and (
+                row is _STOP
+                or time.monotonic() - last_sync >= self.fsync_interval
+            ):
+                os.fsync(self._file.fileno())
+                last_sync = time.monotonic()
+                dirty = False
+            if row is _STOP:
+                return
+
+    def close(self):
+        """Write all queued rows, sync them to disk and stop the writer thread."""
+        if self._file.closed:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+
+
+def read_trial_log(path):
+    """
+    Read a streamed trial log into a pandas.DataFrame.
+
+    Columns keep the order in which `Trial.log()` adds them, as in the
+    csv file that psychopy's ExperimentHandler writes at the end of a session.
+    """
+    import pandas as pd
+
+    return pd.DataFrame(_read_rows(path))
+
+
+def _read_rows(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_wide_text(rows, path):
+    """
+    Write rows (dicts of column name -> value) to a csv file like psychopy does.
+
+    Follows `ExperimentHandler.saveAsWideText()` of psychopy 2023.1: columns in
+    the order in which they were first added (`dataNames`), every cell (also
+    the last one of a line) followed by a comma, values written with `str()`
+    (quoted if they contain a comma or line break), missing values as empty
+    cells, encoded as utf-8-sig. Newer versions add columns of their own
+    (e.g., `thisRow.t` and `notes`), see `recover_csv()`.
+    """
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    with open(path, "w", encoding="utf-8-sig") as file:
+        file.write("".join(f"{name}," for name in names) + "\n")
+        for row in rows:
+            for name in names:
+                if name not in row:
+                    file.write(",")
+                    continue
+                value = str(row[name])
+                file.write(f'"{value}",' if "," in value or "\n" in value else f"{value},")
+            file.write("\n")
+
+
+def recover_csv(path, csv_path):
+    """
+    Write the csv file of a session from its streamed trial log `path`.
+
+    If psychopy is installed, the rows are written by its `ExperimentHandler`,
+    so the file has the columns and format of the installed version. Otherwise
+    they are written with `write_wide_text()`.
+    """
+    rows = _read_rows(path)
+    try:
+        from psychopy import data
+    except ImportError:
+        write_wide_text(rows, csv_path)
+        return
+    exp = data.ExperimentHandler(
+        dataFileName=os.path.splitext(csv_path)[0], savePickle=False, saveWideText=False
+    )
+    for row in rows:
+        for var, val in row.items():
+            exp.addData(var, val)
+        exp.nextEntry()
+    exp.saveAsWideText(csv_path, delim=",", fileCollisionMethod="overwrite")
+
+
+if __name__ == "__main__":
+    # Recover a csv logfile from the streamed log of a session that did not finish:
+    # python -m src.logwriter data/task-..._trials.jsonl
+    import sys
+
+    for path in sys.argv[1:]:
+        csv_path = path.replace("_trials.jsonl", "") + ".csv"
+        if os.path.exists(csv_path):
+            print(f"'{csv_path}' exists already. Skipping.")
+            continue
+        recover_csv(path, csv_path)
+        print(f"Wrote {csv_path}")
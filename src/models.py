@@ -0,0 +1,158 @@
+"""
+Reinforcement-learning models of choices in the task.
+
+All models work on a batch of parameter sets at once: every parameter is an
+array with one entry per batch member (e.g., one simulated agent or one
+candidate parameter set of a fit). Symbols and contexts are integer codes.
+"""
+import numpy as np
+
+
+def p_choose_1(beta, value1, value2):
+    """Softmax probability of choosing option 1 (numerically stable logistic function)."""
+    return 0.5 * (1 + np.tanh(0.5 * beta * (value1 - value2)))
+
+
+def observed_outcomes(feedback, choice):
+    """
+    Which outcomes are shown to the participant after a choice.
+
+    "complete" shows both outcomes, "partial" only the chosen one, and
+    "none" (question marks) and "skip" show none. Works on arrays.
+
+    Returns:
+        observed1, observed2 (numpy.ndarray of bool)
+    """
+    feedback = np.asarray(feedback)
+    choice = np.asarray(choice)
+    complete = feedback == "complete"
+    partial = feedback == "partial"
+    return complete | (partial & (choice == 1)), complete | (partial & (choice == 2))
+
+
+class QLearning(object):
+    """
+    Standard Q-learning with a softmax choice rule.
+
+    Q-values start at 0 and are updated towards every observed outcome
+    with learning rate `alpha`.
+    """
+
+    name = "qlearning"
+    parameter_names = ("alpha", "beta")
+    bounds = dict(alpha=(0.0, 1.0), beta=(0.0, 5.0))
+
+    def __init__(self, **parameters):
+        values = np.broadcast_arrays(
+            *[
+                np.atleast_1d(np.asarray(parameters[name], dtype=float))
+                for name in self.parameter_names
+            ]
+        )
+        for name, value in zip(self.parameter_names, values):
+            setattr(self, name, value)
+        self.n = len(values[0])
+        self._rows = np.arange(self.n)
+
+    def reset(self, n_symbols, n_contexts):
+        self.q = np.zeros((self.n, n_symbols))
+
+    def values(self, symbol1, symbol2, context):
+        return self.q[self._rows, symbol1], self.q[self._rows, symbol2]
+
+    def p_choose_1(self, value1, value2):
+        return p_choose_1(self.beta, value1, value2)
+
+    def _learn(self, symbol, target, observed, alpha):
+        q = self.q[self._rows, symbol]
+        self.q[self._rows, symbol] = np.where(observed, q + alpha * (target - q), q)
+
+    def update(self, symbol1, symbol2, outcome1, outcome2, observed1, observed2, context):
+        self._learn(symbol1, outcome1, observed1, self.alpha)
+        self._learn(symbol2, outcome2, observed2, self.alpha)
+
+
+class Relative(QLearning):
+    """
+    Relative (reference-point) model (RELATIVE; Palminteri et al., 2015; Bavard et al., 2021).
+
+    Every context (pair of symbols) learns its value, the mean of the outcomes
+    observed in it (learning rate `alpha_context`). Q-values (learning rate
+    `alpha`) learn outcomes relative to this context value.
+    """
+
+    name = "relative"
+    parameter_names = ("alpha", "alpha_context", "beta")
+    bounds = dict(alpha=(0.0, 1.0), alpha_context=(0.0, 1.0), beta=(0.0, 5.0))
+
+    def reset(self, n_symbols, n_contexts):
+        super().reset(n_symbols, n_contexts)
+        self.v = np.zeros((self.n, n_contexts))
+
+    def update(self, symbol1, symbol2, outcome1, outcome2, observed1, observed2, context):
+        outcome1 = np.where(observed1, outcome1, np.nan)
+        outcome2 = np.where(observed2, outcome2, np.nan)
+        v = self.v[self._rows, context]
+
+        # Learn outcomes relative to the context value (before it is updated)
+        self._learn(symbol1, outcome1 - v, observed1, self.alpha)
+        self._learn(symbol2, outcome2 - v, observed2, self.alpha)
+
+        # Update the context value towards the mean observed outcome
+        n_observed = observed1.astype(int) + observed2.astype(int)
+        mean = (np.nan_to_num(outcome1) + np.nan_to_num(outcome2)) / np.maximum(n_observed, 1)
+        self.v[self._rows, context] = np.where(
+            n_observed > 0, v + self.alpha_context * (mean - v), v
+        )
+
+
+class RangeAdaptation(QLearning):
+    """
+    Range-adaptation model (RANGE; Bavard et al., 2021).
+
+    Every context (pair of symbols) tracks the maximum and minimum outcome
+    observed in it (learning rate `alpha_range`, only updated if an outcome
+    exceeds the current value). Q-values (learning rate `alpha`) learn outcomes
+    rescaled to this range, i.e., between 0 (minimum) and 1 (maximum).
+    """
+
+    name = "range"
+    parameter_names = ("alpha", "alpha_range", "beta")
+    bounds = dict(alpha=(0.0, 1.0), alpha_range=(0.0, 1.0), beta=(0.0, 50.0))
+
+    def reset(self, n_symbols, n_contexts):
+        super().reset(n_symbols, n_contexts)
+        self.r_max = np.zeros((self.n, n_contexts))
+        self.r_min = np.zeros((self.n, n_contexts))
+
+    def update(self, symbol1, symbol2, outcome1, outcome2, observed1, observed2, context):
+        outcome1 = np.where(observed1, outcome1, np.nan)
+        outcome2 = np.where(observed2, outcome2, np.nan)
+
+        # Update the range of this context
+        r_max = self.r_max[self._rows, context]
+        r_min = self.r_min[self._rows, context]
+        highest = np.fmax(outcome1, outcome2)
+        lowest = np.fmin(outcome1, outcome2)
+        r_max = np.where(highest > r_max, r_max + self.alpha_range * (highest - r_max), r_max)
+        r_min = np.where(lowest < r_min, r_min + self.alpha_range * (lowest - r_min), r_min)
+        self.r_max[self._rows, context] = r_max
+        self.r_min[self._rows, context] = r_min
+
+        # Learn range-normalized outcomes
+        span = np.where(r_max > r_min, r_max - r_min, 1.0)
+        self._learn(symbol1, (outcome1 - r_min) / span, observed1, self.alpha)
+        self._learn(symbol2, (outcome2 - r_min) / span, observed2, self.alpha)
+
+
+MODELS = {model.name: model for model in [QLearning, Relative, RangeAdaptation]}
+
+
+def sample_parameters(model, n, rng=np.random, **fixed):
+    """Draw `n` parameter sets uniformly within the model's bounds (or use `fixed` values)."""
+    return {
+        name: np.full(n, float(fixed[name]))
+        if name in fixed
+        else rng.uniform(*model.bounds[name], size=n)
+        for name in model.parameter_names
+    }
@@ -0,0 +1,297 @@
+import numpy as np
+import pandas as pd
+from os.path import join
+from string import ascii_uppercase
+
+# Order in which `task.py` runs the phases
+PHASES = ["training", "learning", "transfer", "explicit"]
+
+
+def make_stimulus_map(conditions, rng=np.random):
+    """
+    Randomly map symbol IDs (training symbols "T1", "T2", ... and task symbols "A", "B", ...)
+    to image files ("1.png", "2.png", ...).
+
+    Returns:
+        dict: symbol ID -> image file name
+    """
+    ## Get the number of symbols needed
+    n_symbols_training = np.unique(
+        conditions.query("phase == 'training'")[["symbol1", "symbol2"]].values.ravel()
+    ).size
+    n_symbols_task = np.unique(
+        conditions.query("phase == 'learning'")[["symbol1", "symbol2"]].values.ravel()
+    ).size
+
+    symbol_ids = ascii_uppercase[:n_symbols_task]
+    image_names = [f"{i + 1}.png" for i in range(n_symbols_task + n_symbols_training)]
+    rng.shuffle(image_names)  # shuffle in place
+
+    # first n_symbols_training images are for training
+    training_symbol_map = {
+        f"T{i + 1}": image_names[i] for i in range(n_symbols_training)
+    }
+    # next n_symbols_task images are for main task
+    task_symbol_map = {
+        symbol_id: image_names[n_symbols_training + i]
+        for i, symbol_id in enumerate(symbol_ids)
+    }
+    return dict(task_symbol_map, **training_symbol_map)
+
+
+def shuffle_block(trial_types, temporal_arrangement, rng=np.random, size=None):
+    """
+    Draw the trial order within a block.
+
+    - "interleaved" randomly shuffles all trials of the block.
+    - "blocked" keeps trials of the same `trial_type` together, but
+      randomizes the order of these trial_type chunks and the order of
+      trials within each chunk.
+
+    Args:
+        trial_types (array-like): `trial_type` of every trial in the block
+        temporal_arrangement (str): "interleaved" or "blocked"
+        rng: numpy random generator (or the `np.random` module)
+        size (int, optional): Number of independent orders to draw at once
+
+    Returns:
+        numpy.ndarray: Indices into `trial_types` in presentation order,
+            of shape (n_trials,) or (size, n_trials)
+    """
+    trial_types = np.asarray(trial_types)
+    shape = (len(trial_types),) if size is None else (size, len(trial_types))
+    keys = rng.random(shape)  # random order within the block (or within chunks)
+    if temporal_arrangement == "blocked":
+        # move every chunk to a random position by adding its rank to the keys
+        types, type_index = np.unique(trial_types, return_inverse=True)
+        chunk_rank = rng.random(shape[:-1] + (len(types),)).argsort(-1).argsort(-1)
+        keys = keys + chunk_rank[..., type_index]
+    elif temporal_arrangement != "interleaved":
+        raise ValueError(
+            f"`temporal_arrangement` must be in ['interleaved', 'blocked'], but is '{temporal_arrangement}'."
+        )
+    return keys.argsort(-1)
+
+
+def draw_outcomes(potential_outcome, probability, rng=np.random):
+    """
+    Realize outcomes of "random" trials: `potential_outcome` with `probability`, 0 otherwise.
+
+    Works on arrays of any (matching or broadcastable) shape.
+    """
+    potential_outcome = np.asarray(potential_outcome, dtype=float)
+    probability = np.asarray(probability, dtype=float)
+    shape = np.broadcast(potential_outcome, probability).shape
+    return np.where(rng.random(shape) < probability, potential_outcome, 0.0)
+
+
+def presample_outcomes(conditions, training_n_repeats_max=0, rng=np.random):
+    """
+    Realize the outcomes of all trials of a session at once.
+
+    Training trials are repeated for every possible training repetition
+    (`training_repeat` 0 to `training_n_repeats_max`), so that repeated
+    training trials get their own outcomes. For trials with
+    `outcome_randomness` "random", `actual_outcome1` and `actual_outcome2`
+    are drawn in one vectorized draw; "pseudorandom" trials keep theirs.
+
+    Returns:
+        pandas.DataFrame: `conditions` with repeated training trials,
+            a `training_repeat` column and filled `actual_outcome` columns
+    """
+    training = conditions["phase"] == "training"
+    session_conditions = pd.concat(
+        [
+            conditions.loc[training].assign(training_repeat=repeat)
+            for repeat in range(training_n_repeats_max + 1)
+        ]
+        + [conditions.loc[~training].assign(training_repeat=0)],
+        ignore_index=True,
+    )
+    random = (session_conditions["outcome_randomness"] == "random").values
+    drawn = draw_outcomes(
+        session_conditions.loc[random, ["potential_outcome1", "potential_outcome2"]].values,
+        session_conditions.loc[random, ["probability1", "probability2"]].values,
+        rng,
+    )
+    for i in [1, 2]:
+        actual_outcome = pd.to_numeric(
+            session_conditions[f"actual_outcome{i}"], errors="coerce"
+        ).values.astype(float)
+        actual_outcome[random] = drawn[:, i - 1]
+        session_conditions[f"actual_outcome{i}"] = actual_outcome
+    return session_conditions
+
+
+def compile_schedule(conditions, exp_info, seed):
+    """
+    Compile conditions, settings and random seed into the complete session schedule.
+
+    Everything random about a session is decided here, using only `seed`:
+    the trial order (phases in order, blocks in order, trials shuffled within
+    blocks according to `temporal_arrangement`), all outcomes (see
+    `presample_outcomes`) and the ITIs. Together with the image and movie
+    files (from the stimulus map) and the stimulus positions, this makes one
+    row per trial, so running a session is just walking through the rows.
+
+    Training trials are included for every possible repetition
+    (`training_repeat` 0 to `training_n_repeats_max`).
+
+    Args:
+        conditions (pandas.DataFrame): Conditions as in `stim/conditions.csv`
+        exp_info (dict): Needs `training_n_repeats_max`, `temporal_arrangement`,
+            `Stimulus-Set`, `stimulus_map`, `pos_left`, `pos_right`,
+            `duration_iti` and `duration_iti_jitter`
+        seed (int): Random seed
+
+    Returns:
+        numpy.ndarray: Structured array with one record per trial
+    """
+    rng = np.random.default_rng(seed)
+    session_conditions = presample_outcomes(
+        conditions, exp_info["training_n_repeats_max"], rng=rng
+    )
+
+    # Trial order
+    order = []
+    for phase in PHASES:
+        in_phase = (session_conditions["phase"] == phase).values
+        for repeat in np.unique(session_conditions.loc[in_phase, "training_repeat"]):
+            in_repeat = in_phase & (session_conditions["training_repeat"] == repeat).values
+            for block in session_conditions.loc[in_repeat, "block"].unique():
+                rows = np.flatnonzero(
+                    in_repeat & (session_conditions["block"] == block).values
+                )
+                trial_order = shuffle_block(
+                    session_conditions["trial_type"].values[rows],
+                    exp_info["temporal_arrangement"],
+                    rng=rng,
+                )
+                order.append(rows[trial_order])
+    schedule = session_conditions.iloc[np.concatenate(order)].reset_index(drop=True)
+
+    # Stimulus positions
+    option1pos = schedule["option1pos"]
+    if not option1pos.isin(["left", "right"]).all():
+        raise ValueError(
+            f"`option1pos` must be 'left' or 'right' (is {sorted(set(option1pos) - {'left', 'right'})})."
+        )
+    schedule["pos1"] = np.where(
+        option1pos == "left", exp_info["pos_left"], exp_info["pos_right"]
+    )
+    schedule["pos2"] = np.where(
+        option1pos == "left", exp_info["pos_right"], exp_info["pos_left"]
+    )
+
+    # Image and movie files (none in the explicit phase)
+    explicit = (schedule["phase"] == "explicit").values
+    image_dir = join("stim", "images", str(exp_info["Stimulus-Set"]))
+    for i in [1, 2]:
+        image_names = schedule[f"symbol{i}"].map(exp_info["stimulus_map"])
+        missing = image_names.isna().values & ~explicit
+        if missing.any():
+            raise ValueError(
+                f"No image for symbol(s) {sorted(set(schedule[f'symbol{i}'][missing].astype(str)))} in the stimulus map."
+            )
+        image_names = image_names.fillna("")
+        schedule[f"image{i}"] = np.where(
+            explicit, "", join(image_dir, "") + image_names
+        )
+        schedule[f"video{i}"] = np.where(
+            explicit,
+            "",
+            join(image_dir, "anim", "") + image_names.str.replace("png", "mp4"),
+        )
+
+    # ITIs
+    schedule["iti"] = rng.uniform(
+        exp_info["duration_iti"] - exp_info["duration_iti_jitter"] / 2,
+        exp_info["duration_iti"] + exp_info["duration_iti_jitter"] / 2,
+        size=len(schedule),
+    )
+
+    return to_structured_array(schedule)
+
+
+def to_structured_array(df):
+    """Convert a DataFrame into a NumPy structured array with typed fields (text columns become fixed-width strings, missing text becomes "")."""
+    fields = []
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+            values = values.to_numpy()
+        elif pd.api.types.is_float_dtype(values):
+            values = values.to_numpy(dtype=float)
+        else:
+            values = np.asarray(values.where(values.notna(), "").astype(str), dtype=str)
+        fields.append((column, values))
+    array = np.empty(len(df), dtype=[(column, values.dtype) for column, values in fields])
+    for column, values in fields:
+        array[column] = values
+    return array
+
+
+def schedule_to_frame(schedule):
+    """Load a compiled schedule into a DataFrame (empty strings become NaN again, as in the conditions file)."""
+    return pd.DataFrame(schedule).replace("", np.nan)
+
+
+class TrialRecord(object):
+    """
+    Information of a single trial (one row of the schedule), used like a dict.
+
+    Much lighter than the pandas.Series that `DataFrame.iterrows()` builds:
+    records of the same schedule share one field -> position index, and
+    only keep a list of values. Fields that are added later (e.g., `subject`
+    in `Trial.log()`) are appended.
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = list(values)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Make one record per row of a DataFrame (e.g., the trials of a block, in order)."""
+        index = {column: i for i, column in enumerate(df.columns)}
+        return [cls(index, values) for values in df.itertuples(index=False, name=None)]
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __setitem__(self, key, value):
+        position = self._index.get(key)
+        if position is None:
+            # don't change the index shared with the other records
+            self._index = dict(self._index)
+            self._index[key] = len(self._values)
+            self._values.append(value)
+        else:
+            self._values[position] = value
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        return default if position is None else self._values[position]
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return zip(self._index, self._values)
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return "TrialRecord(" + ", ".join(f"{k}={v!r}" for k, v in self.items()) + ")"
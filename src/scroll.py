@@ -0,0 +1,64 @@
+"""
+Displacement profile of the slot machine roll of the choice animations.
+
+Used by the procedural animations (`src.animation.ScrollingImageStim`) and
+by `stim/images/slot_animation.py`, which renders the `.mp4` files, so both
+roll the symbols the same way. Only needs NumPy.
+"""
+import numpy as np
+
+
+def displacement_piecewise(t, T, total_offset, aT, dT):
+    """
+    Compute the displacement (in pixels) at time(s) t using a piecewise function
+    with acceleration, constant speed, and deceleration phases.
+
+    `t` can be a scalar or an array of times (clipped to [0, T]).
+    """
+    t = np.clip(t, 0, T)
+    T_const = T - aT - dT  # constant speed phase duration
+    # Compute maximum speed so that the total displacement is achieved:
+    v_max = total_offset / (T_const + 0.5 * (aT + dT))
+    t_prime = t - (aT + T_const)
+    return np.where(
+        t < aT,
+        # Acceleration phase: quadratic ease-in
+        0.5 * (v_max / aT) * (t**2),
+        np.where(
+            t < aT + T_const,
+            # Constant speed phase: linear motion
+            0.5 * v_max * aT + v_max * (t - aT),
+            # Deceleration phase: quadratic ease-out
+            0.5 * v_max * aT
+            + v_max * T_const
+            + v_max * t_prime
+            - 0.5 * (v_max / dT) * (t_prime**2),
+        ),
+    )
+
+
+def scroll_displacement(
+    t,
+    duration,
+    rotation_speed,
+    acceleration_duration=0.1,
+    deceleration_duration=0.1,
+):
+    """
+    Displacement (in pixels) of a rolling symbol after t seconds.
+
+    Uses the piecewise profile if acceleration and deceleration fit into `duration`,
+    and a cosine ease-in/out otherwise.
+    """
+    total_offset = rotation_speed * duration
+    if (
+        acceleration_duration is not None
+        and deceleration_duration is not None
+        and (acceleration_duration + deceleration_duration) < duration
+    ):
+        return displacement_piecewise(
+            t, duration, total_offset, acceleration_duration, deceleration_duration
+        )
+    else:
+        progress = 0.5 - 0.5 * np.cos(np.pi * np.clip(t, 0, duration) / duration)
+        return total_offset * progress
@@ -0,0 +1,319 @@
+"""
+Headless simulation of the task with synthetic agents.
+
+Agents go through the trials of a conditions file in the same order
+`task.py` would show them (phases in order, blocks in order, trials
+shuffled within blocks according to `temporal_arrangement`), with the same
+outcome logic as `Trial.prepare()` and the feedback rules of `Trial.run()`.
+All agents are simulated at once, with NumPy arrays over agents.
+
+Training is run once (no repetitions) and agents always respond in time.
+The logs have the columns of real sessions (with frame timing and image
+cache), and are written like psychopy writes them. What is not simulated
+(`rt`, `prepare_duration`, `animation_frames_dropped`, the frame timing and
+the image cache counts) is missing.
+
+Usage:
+    python -m src.simulation --model range --n-agents 1000 --output data/simulated
+"""
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import time
+from os.path import join
+
+from .conditions import load_conditions
+from .frametiming import PHASES as FRAME_PHASES
+from .logwriter import write_wide_text
+from .models import MODELS, observed_outcomes, sample_parameters
+from .schedule import PHASES, draw_outcomes, make_stimulus_map, shuffle_block
+
+# Columns of real sessions that are not simulated (missing in the logs), in the order of `Trial.log()`
+NOT_SIMULATED = (
+    ["prepare_duration", "animation_frames_dropped"]
+    + [f"duration_{phase}_{kind}" for phase in FRAME_PHASES for kind in ["intended", "achieved"]]
+    + ["n_flips", "frames_dropped", "image_cache_hits", "image_cache_misses"]
+)
+
+
+def encode_symbols(symbol1, symbol2, symbols=None):
+    """
+    Integer codes of symbols and contexts (unordered symbol pairs).
+
+    Missing symbols (explicit phase) get code -1, as do their contexts.
+
+    Returns:
+        symbol1, symbol2, context (numpy.ndarray of int), symbols (list), contexts (list)
+    """
+    symbol1 = pd.Series(np.asarray(symbol1, dtype=object)).replace("None", np.nan)
+    symbol2 = pd.Series(np.asarray(symbol2, dtype=object)).replace("None", np.nan)
+    if symbols is None:
+        symbols = sorted(set(symbol1.dropna()) | set(symbol2.dropna()))
+    codes = {symbol: i for i, symbol in enumerate(symbols)}
+    code1 = symbol1.map(codes).fillna(-1).astype(int).values
+    code2 = symbol2.map(codes).fillna(-1).astype(int).values
+    pairs = np.where(
+        code1 >= 0, np.minimum(code1, code2) * len(symbols) + np.maximum(code1, code2), -1
+    )
+    contexts, context = np.unique(pairs, return_inverse=True)
+    context = context.reshape(pairs.shape)
+    if len(contexts) and contexts[0] == -1:  # keep -1 for "no context"
+        contexts = contexts[1:]
+        context = context - 1
+    return code1, code2, context, symbols, list(contexts)
+
+
+def trial_order(conditions, temporal_arrangement, n_agents, rng):
+    """
+    Row positions of `conditions` in the order they are shown, for every agent.
+
+    Returns:
+        numpy.ndarray of shape (n_agents, n_trials)
+    """
+    order = []
+    for phase in PHASES:
+        in_phase = (conditions["phase"] == phase).values
+        for block in conditions.loc[in_phase, "block"].unique():
+            rows = np.flatnonzero(in_phase & (conditions["block"] == block).values)
+            block_order = shuffle_block(
+                conditions["trial_type"].values[rows],
+                temporal_arrangement,
+                rng=rng,
+                size=n_agents,
+            )
+            order.append(rows[block_order])
+    return np.concatenate(order, axis=1)
+
+
+def simulate(
+    conditions,
+    model,
+    n_agents=None,
+    temporal_arrangement="blocked",
+    duration_iti=0.2,
+    duration_iti_jitter=0,
+    stimulus_set="Set 1",
+    pos_left=-0.25,
+    pos_right=0.25,
+    seed=None,
+):
+    """
+    Simulate agents of a `model` (instance of a class in `src.models`) doing the task.
+
+    Returns:
+        pandas.DataFrame: Trial log of all agents, with the columns of real sessions
+            (`subject` identifies agents, numbered from 1)
+        list: Stimulus map of every agent
+    """
+    rng = np.random.default_rng(seed)
+    n_agents = model.n if n_agents is None else n_agents
+    conditions = conditions.reset_index(drop=True)
+    rows = trial_order(conditions, temporal_arrangement, n_agents, rng)
+    n_trials = rows.shape[1]
+
+    # Trial information as (agents x trials) arrays
+    symbol1, symbol2, context, symbols, contexts = encode_symbols(
+        conditions["symbol1"], conditions["symbol2"]
+    )
+    symbol1, symbol2, context = symbol1[rows], symbol2[rows], context[rows]
+    phase = conditions["phase"].values[rows[0]]  # phases are in the same order for every agent
+    feedback = conditions["feedback"].values[rows]
+    potential_outcome1 = conditions["potential_outcome1"].values.astype(float)[rows]
+    potential_outcome2 = conditions["potential_outcome2"].values.astype(float)[rows]
+    probability1 = pd.to_numeric(conditions["probability1"], errors="coerce").values[rows]
+    probability2 = pd.to_numeric(conditions["probability2"], errors="coerce").values[rows]
+
+    # Realize outcomes like `Trial.prepare()`
+    random = (conditions["outcome_randomness"] == "random").values[rows]
+    actual_outcome1 = np.where(
+        random,
+        draw_outcomes(potential_outcome1, probability1, rng),
+        pd.to_numeric(conditions["actual_outcome1"], errors="coerce").values[rows],
+    )
+    actual_outcome2 = np.where(
+        random,
+        draw_outcomes(potential_outcome2, probability2, rng),
+        pd.to_numeric(conditions["actual_outcome2"], errors="coerce").values[rows],
+    )
+
+    # Let the agents choose and learn
+    model.reset(len(symbols), len(contexts))
+    choice = np.zeros((n_agents, n_trials), dtype=int)
+    for t in range(n_trials):
+        if phase[t] == "explicit":
+            # No symbols, choose according to the shown expected values
+            value1 = probability1[:, t] * potential_outcome1[:, t]
+            value2 = probability2[:, t] * potential_outcome2[:, t]
+        else:
+            value1, value2 = model.values(symbol1[:, t], symbol2[:, t], context[:, t])
+        p_choose_1 = model.p_choose_1(value1, value2)
+        choice[:, t] = np.where(rng.random(n_agents) < p_choose_1, 1, 2)
+        if phase[t] != "explicit":
+            observed1, observed2 = observed_outcomes(feedback[:, t], choice[:, t])
+            model.update(
+                symbol1[:, t],
+                symbol2[:, t],
+                actual_outcome1[:, t],
+                actual_outcome2[:, t],
+                observed1,
+                observed2,
+                context[:, t],
+            )
+
+    # Assemble the trial log (same columns as `Trial.log()`, see `NOT_SIMULATED`)
+    log = conditions.iloc[rows.ravel()].reset_index(drop=True)
+    log["actual_outcome1"] = actual_outcome1.ravel()
+    log["actual_outcome2"] = actual_outcome2.ravel()
+    log["training_repeat"] = 0
+    option1left = log["option1pos"].values == "left"
+    log["pos1"] = np.where(option1left, pos_left, pos_right)
+    log["pos2"] = np.where(option1left, pos_right, pos_left)
+
+    # Random mapping of symbols to images for every agent (as in `task.py`)
+    map_symbols = list(make_stimulus_map(conditions, rng=rng))
+    images = rng.permuted(
+        np.tile([f"{i + 1}.png" for i in range(len(map_symbols))], (n_agents, 1)),
+        axis=1,
+    )
+    stimulus_maps = [dict(zip(map_symbols, agent_images.tolist())) for agent_images in images]
+    agents = np.arange(n_agents)[:, None]
+    for i in [1, 2]:
+        image_index = (
+            conditions[f"symbol{i}"].map({s: k for k, s in enumerate(map_symbols)}).values
+        )[rows]
+        image_names = images[agents, np.nan_to_num(image_index).astype(int)]
+        # No images in the explicit phase (empty, as in `src.schedule.compile_schedule()`)
+        log[f"image{i}"] = np.where(
+            np.isnan(image_index),
+            "",
+            np.char.add(join("stim", "images", stimulus_set, ""), image_names),
+        ).ravel().astype(object)
+        log[f"video{i}"] = np.where(
+            np.isnan(image_index),
+            "",
+            np.char.add(
+                join("stim", "images", stimulus_set, "anim", ""),
+                np.char.replace(image_names, "png", "mp4"),
+            ),
+        ).ravel().astype(object)
+    log["iti"] = rng.uniform(
+        duration_iti - duration_iti_jitter / 2,
+        duration_iti + duration_iti_jitter / 2,
+        size=n_agents * n_trials,
+    )
+    log["subject"] = np.repeat(np.arange(1, n_agents + 1), n_trials)
+    log["session"] = 1
+    choice = choice.ravel()
+    log["response"] = np.where((choice == 1) == option1left, "left", "right")
+    log["choice"] = choice
+    log["rt"] = np.nan
+    log["obtained_reward"] = np.where(
+        choice == 1, log["actual_outcome1"], log["actual_outcome2"]
+    )
+    counted = np.where(log["phase"] != "training", log["obtained_reward"], 0)
+    log["cumulative_reward"] = counted.reshape(n_agents, n_trials).cumsum(1).ravel()
+    for column in NOT_SIMULATED:
+        log[column] = np.nan
+    return log, stimulus_maps
+
+
+def save_sessions(log, stimulus_maps, parameters, model, folder, experiment_label, stimulus_set):
+    """Write every agent's log and settings like real sessions (`<logfile>.csv`, as psychopy writes it, and `<logfile>_settings.json`)."""
+    os.makedirs(folder, exist_ok=True)
+    date, clock = time.strftime("%Y%m%d"), time.strftime("%H%M")
+    for (subject, agent_log), stimulus_map in zip(log.groupby("subject", sort=True), stimulus_maps):
+        logfile_path = join(
+            folder,
+            f"task-{experiment_label}_subject-sim{subject:05d}_date-{date}_time-{clock}",
+        )
+        write_wide_text(
+            agent_log.assign(subject=f"sim{subject:05d}").to_dict("records"), f"{logfile_path}.csv"
+        )
+        exp_info = {
+            "Subject": f"sim{subject:05d}",
+            "Session": 1,
+            "Stimulus-Set": stimulus_set,
+            "Date": date,
+            "Time": clock,
+            "stimulus_map": stimulus_map,
+            "model": model.name,
+            "parameters": {
+                name: float(values[subject - 1]) for name, values in parameters.items()
+            },
+        }
+        with open(f"{logfile_path}_settings.json", "w") as file:
+            json.dump(exp_info, file)
+
+
+def main():
+    import settings
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--model", choices=list(MODELS), default="qlearning")
+    parser.add_argument("--n-agents", type=int, default=100)
+    parser.add_argument(
+        "--conditions",
+        default=join("stim", settings.conditions_file),
+        help="Conditions file (default: the one in settings.py)",
+    )
+    parser.add_argument(
+        "--set",
+        nargs="*",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Fix model parameters (others are drawn uniformly within the model's bounds)",
+    )
+    parser.add_argument(
+        "--stimulus-set",
+        choices=["Set 1", "Set 2"],
+        default="Set 1",
+        help="Stimulus set of the simulated sessions, as chosen in the task's dialog (default: %(default)s)",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=join(settings.logfile_folder, "simulated"))
+    parser.add_argument(
+        "--no-files", action="store_true", help="Only simulate, don't write logfiles"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    model_class = MODELS[args.model]
+    fixed = dict(item.split("=") for item in args.set)
+    parameters = sample_parameters(model_class, args.n_agents, rng=rng, **fixed)
+    model = model_class(**parameters)
+
+    start = time.perf_counter()
+    log, stimulus_maps = simulate(
+        load_conditions(args.conditions),
+        model,
+        temporal_arrangement=settings.temporal_arrangement,
+        duration_iti=settings.duration_iti,
+        duration_iti_jitter=settings.duration_iti_jitter,
+        stimulus_set=args.stimulus_set,
+        pos_left=settings.pos_left,
+        pos_right=settings.pos_right,
+        seed=rng,
+    )
+    print(
+        f"Simulated {args.n_agents} agents ({len(log)} trials) in {time.perf_counter() - start:.2f} s."
+    )
+    if not args.no_files:
+        start = time.perf_counter()
+        save_sessions(
+            log,
+            stimulus_maps,
+            parameters,
+            model,
+            args.output,
+            settings.experiment_label,
+            args.stimulus_set,
+        )
+        print(f"Wrote logfiles to '{args.output}' in {time.perf_counter() - start:.2f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from psychopy import visual, event, core
 import numpy as np
 
+_executor = None  # decodes slide images in the background, shared by all slides
+
+
+def _prefetch_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SlidePrefetch")
+    return _executor
+
 
 class SlideShow(object):
     """
     Present series of TextSlide or ImageSlide
+
+    While a slide is shown, the next one is prepared: images are decoded in
+    the background, and stimuli are built on the main thread only from what
+    is ready, so waiting for keys never waits for a decode. A slide whose
+    image is not decoded yet is built when it is shown.
     """
 
     def __init__(
@@ -36,10 +52,18 @@ class SlideShow(object):
 
     def run(self):
         position = self.start_idx
+        last = len(self.slides) - 1
         while True:
             self.slides[position].draw()
             self.win.flip()
-            key = event.waitKeys(maxWait=self.timeout, keyList=self.key_list)[0]
+            event.clearEvents(eventType="keyboard")
+            # Get the next slide (and the last one, for skipping) ready while this one is read.
+            # Keys pressed in the meantime stay in the buffer.
+            for upcoming in {min(position + 1, last), last}:
+                self.slides[upcoming].prefetch()
+            self.slides[min(position + 1, last)].prepare(wait=False)
+            keys = event.waitKeys(maxWait=self.timeout, keyList=self.key_list, clearEvents=False)
+            key = keys[0] if keys else None
             if key is not None:
                 # Quit everything
                 if key in self.keys_quit:
@@ -63,22 +87,74 @@ class SlideShow(object):
 
 
 class TextSlide(object):
+    """Slide with a `visual.TextStim`, built when first needed."""
+
     def __init__(self, win=None, text="", **kwargs):
         self.win = win
         self.text = text
         self.kwargs = kwargs
-        self._text = visual.TextStim(win=self.win, text=self.text, **self.kwargs)
+        self._text = None
+
+    def prefetch(self):
+        """Nothing to load in the background (text layout needs the window's GL context)."""
+        pass
+
+    def prepare(self, wait=True):
+        """Build the stimulus (main thread)."""
+        if self._text is None:
+            self._text = visual.TextStim(win=self.win, text=self.text, **self.kwargs)
 
     def draw(self):
+        self.prepare()
         self._text.draw()
 
 
 class ImageSlide(object):
+    """
+    Slide with a `visual.ImageStim`, built when first needed.
+
+    Image files are decoded once, on a background thread (`prefetch()`), and
+    downscaled to fit the window if they are larger, so the texture is never
+    bigger than the screen. Without a `size` in `kwargs`, the image is shown
+    at its (downscaled) pixel size.
+    """
+
     def __init__(self, win=None, image=None, **kwargs):
         self.win = win
         self.image = image
         self.kwargs = kwargs
-        self._image = visual.ImageStim(win=win, image=self.image, **self.kwargs)
+        self._image = None
+        self._pixels = None  # future of the decoded image
+
+    def load(self):
+        """Decode the image file and downscale it to the window size (no GL calls, thread-safe)."""
+        if not isinstance(self.image, str):
+            return self.image  # already decoded (array or PIL image)
+        from PIL import Image
+
+        pixels = Image.open(self.image)
+        pixels.load()
+        width, height = (int(s) for s in self.win.size)
+        if pixels.width > width or pixels.height > height:
+            pixels.thumbnail((width, height), Image.LANCZOS)
+        return pixels
+
+    def prefetch(self):
+        """Start decoding the image in the background (once)."""
+        if self._image is None and self._pixels is None:
+            self._pixels = _prefetch_executor().submit(self.load)
+
+    def prepare(self, wait=True):
+        """Build the stimulus from the decoded image (main thread). Waits for the decoding, or returns if it is not done and not `wait`."""
+        if self._image is None:
+            self.prefetch()
+            if not wait and not self._pixels.done():
+                return
+            self._image = visual.ImageStim(
+                win=self.win, image=self._pixels.result(), **self.kwargs
+            )
+            self._pixels = None
 
     def draw(self):
+        self.prepare()
         self._image.draw()
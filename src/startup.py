@@ -0,0 +1,52 @@
+import json
+import time
+
+
+class StartupProfiler(object):
+    """
+    Time breakdown of the task's startup, by phase.
+
+    `lap(phase)` ends the current phase: the time since the previous lap (or
+    since the profiler was created) is booked on `phase`. Laps with the same
+    name add up. A disabled profiler (the default in `task.py`, enable it
+    with `--profile-startup`) only keeps the timestamps and prints nothing.
+    """
+
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.durations = {}
+        self._start = self._last = clock()
+
+    def lap(self, phase):
+        """Book the time since the last lap on `phase`."""
+        now = self.clock()
+        self.durations[phase] = self.durations.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self._start
+
+    def report(self):
+        """Table of all phases (ms and share of the total)."""
+        total = self.total
+        width = max([len(phase) for phase in self.durations] + [len("total")])
+        lines = ["Startup time by phase:"]
+        for phase, duration in self.durations.items():
+            lines.append(
+                f"  {phase:{width}s} {duration * 1e3:9.1f} ms {duration / total:6.1%}"
+            )
+        lines.append(f"  {'total':{width}s} {total * 1e3:9.1f} ms")
+        return "\n".join(lines)
+
+    def print_report(self):
+        """Print `report()` (only if enabled)."""
+        if self.enabled:
+            print(self.report())
+
+    def save(self, path):
+        """Write the durations (s) to the json file `path` (only if enabled)."""
+        if self.enabled:
+            with open(path, "w") as file:
+                json.dump(dict(self.durations, total=self.total), file, indent=2)
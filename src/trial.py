@@ -1,12 +1,11 @@
-import psychopy
-
-psychopy.useVersion("2024.1.0")
-
 from psychopy import event, core
 
 import numpy as np
-from os.path import join
+from os.path import basename
 import math
+import time
+
+from .labelcache import explicit_label, outcome_text
 
 
 class Trial(object):
@@ -20,214 +19,213 @@ class Trial(object):
         self.exp_info = exp_info
         self.bg_rects = visual_elements["bg_rects"]
         self.fb_rects = visual_elements["fb_rects"]
-        self.outcomeStims = visual_elements["outcomes"]
+        self.outcomeStims = list(visual_elements["outcomes"])
+        self.outcomeCache = visual_elements.get("outcome_cache")
         self.imageStims = visual_elements["images"]
+        self.imageCache = visual_elements.get("image_cache")
         self.videoStims = visual_elements["videos"]
         self.explicitStims = visual_elements["explicit"]
+        self.labelCache = visual_elements.get("label_cache")
+        self.flipRecorder = exp_info.get("flip_recorder")
+        self.keyboard = exp_info.get("keyboard")
+        self.frame_timing = {}
+
+    def flip(self, phase):
+        """Flip the window (recording the flip with its trial `phase` if a `FlipRecorder` is used)."""
+        if self.flipRecorder is None:
+            return self.win.flip()
+        return self.flipRecorder.flip(phase)
+
+    def draw_stimuli(self):
+        """Draw the stimulus screen (images, or probabilities and outcomes in the explicit phase)."""
+        for rect in self.bg_rects:
+            rect.draw()
+        if self.trial_info["phase"] != "explicit":
+            for image in self.imageStims:
+                image.draw()
+        else:  # explicit phase
+            for explicit in self.explicitStims:
+                explicit.draw()
+
+    def poll_keyboard(self, keyList):
+        """
+        Show the stimuli and poll the keyboard once per frame until a key is pressed or `duration_timeout` is over.
+
+        Key presses are timestamped by psychopy's `hardware.keyboard` (relative to the
+        flip that showed the stimuli), and the stimuli are redrawn every frame.
+
+        Returns:
+            rt_start (float): Time of the stimulus onset flip
+            list or None: `[(key, rt)]` of the first key press, like `event.waitKeys(timeStamped=...)`
+        """
+        timeout = self.exp_info["duration_timeout"]
+        self.keyboard.clearEvents()
+        self.win.callOnFlip(self.keyboard.clock.reset)  # RTs relative to stimulus onset
+        self.draw_stimuli()
+        rt_start = self.flip("stimulus")
+
+        ### Eyetracker message and trigger: Stimulus on
+        self.mark_event("stimulus on", rt_start)
+
+        while True:
+            timed_out = self.keyboard.clock.getTime() >= timeout
+            keys = self.keyboard.getKeys(keyList=keyList, waitRelease=False)
+            if keys and keys[0].rt <= timeout:
+                return rt_start, [(keys[0].name, keys[0].rt)]
+            if timed_out:
+                return rt_start, None
+            self.draw_stimuli()
+            self.flip("stimulus")
+
+    def set_outcome(self, i, text, color):
+        """Show `text` in `color` as the outcome of option `i` (0 or 1), at its position."""
+        x = self.trial_info[f"pos{i + 1}"]
+        if self.outcomeCache is not None:
+            # swap in the prebuilt stimulus (no text layout)
+            self.outcomeStims[i] = self.outcomeCache.get(x, text, color)
+        else:
+            self.outcomeStims[i].setText(text)
+            self.outcomeStims[i].color = color
+            self.outcomeStims[i].setPos((x, 0))
+
+    def mark_event(self, event, t=None):
+        """
+        Queue an eye tracker message (see `src.eyetracking.MessageDispatcher`)
+        and a serial port trigger (see `src.triggers.TriggerPort`) for an event of this trial.
+
+        `t` is the (psychopy clock) time the event happened, usually the time of the flip that showed it.
+        """
+        if self.exp_info["use_eyetracker"]:
+            self.exp_info["eyetracker_messages"].send(
+                f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} {event}", t
+            )
+        if self.exp_info["use_serialport"]:
+            self.exp_info["serialport"].send_trigger(event, t)
 
     def prepare(self):
         """
         Updates the visual elements to use information from current `trial_info`.
         """
+        prepare_start = time.perf_counter()
+
         if self.trial_info["phase"] != "explicit":
             # Set up images and outcomes
-            for i, (imageStim, symbol) in enumerate(
-                zip(
-                    self.imageStims,
-                    (self.trial_info["symbol1"], self.trial_info["symbol2"]),
-                )
-            ):
-                imagePath = join(
-                    "stim",
-                    "images",
-                    str(self.exp_info["Stimulus-Set"]),
-                    self.exp_info["stimulus_map"][symbol],
-                )
-                # save images that were shown
-                imageStim.setImage(imagePath)
-                self.trial_info[f"image{i+1}"] = imagePath
-
-            for i, (videoStim, symbol) in enumerate(
-                zip(
-                    self.videoStims,
-                    (self.trial_info["symbol1"], self.trial_info["symbol2"]),
-                )
-            ):
-                videoPath = join(
-                    "stim",
-                    "images",
-                    str(self.exp_info["Stimulus-Set"]),
-                    "anim",
-                    self.exp_info["stimulus_map"][symbol].replace("png", "mp4"),
-                )
-                # save images that were shown
-                videoStim.setFilename(videoPath)
+            ## Image and movie files come from the compiled session schedule (see `src.schedule.compile_schedule`)
+            imageStims = []
+            for i, imageStim in enumerate(self.imageStims):
+                imagePath = self.trial_info[f"image{i+1}"]
+                if self.imageCache is not None:
+                    # swap in the pre-decoded image (no file I/O)
+                    imageStim = self.imageCache.get(
+                        self.exp_info["Stimulus-Set"], basename(imagePath)
+                    )
+                else:
+                    imageStim.setImage(imagePath)
+                imageStims.append(imageStim)
+            self.imageStims = imageStims
+
+            for i, videoStim in enumerate(self.videoStims):
+                if self.exp_info["animation_mode"] == "procedural":
+                    # the animation rolls the symbol image itself
+                    videoStim.setImage(self.trial_info[f"image{i+1}"])
+                else:
+                    videoStim.setFilename(self.trial_info[f"video{i+1}"])
 
         else:  # Explicit phase: Set up text stimuli
-            for explicitStim, probability, outcome in zip(
-                self.explicitStims,
-                [self.trial_info["probability1"], self.trial_info["probability2"]],
-                [
-                    self.trial_info["potential_outcome1"],
-                    self.trial_info["potential_outcome2"],
-                ],
-            ):
-                explicitStim.setText(
-                    f"{(float(probability) * 100):.0f}%\n\n{float(outcome):.0f} Pkt."
-                )
+            labels = [
+                explicit_label(
+                    self.trial_info["probability1"], self.trial_info["potential_outcome1"]
+                ),
+                explicit_label(
+                    self.trial_info["probability2"], self.trial_info["potential_outcome2"]
+                ),
+            ]
+            if self.labelCache is not None:
+                # swap in the pre-rendered labels (no text layout)
+                self.explicitStims = [
+                    self.labelCache.get(slot, label) for slot, label in enumerate(labels)
+                ]
+            else:
+                for explicitStim, label in zip(self.explicitStims, labels):
+                    explicitStim.setText(label)
+            for explicitStim in self.explicitStims:
                 explicitStim.setOpacity(
                     1
                 )  # reset opacity which we might have animated for feedback
 
-                # log that no images were shown
-                self.trial_info["image1"] = np.nan
-                self.trial_info["image2"] = np.nan
-
-        # Prepare outcomes
-        ## If `outcome_randomness` is "random", we need to draw `actual_outcome`s according to their probabilities.
-        if self.trial_info["outcome_randomness"] == "random":
-            # Check that probability info is given
-            for p in [self.trial_info["probability1"], self.trial_info["probability2"]]:
-                assert isinstance(p, (float, int)) and not np.isnan(
-                    p
-                ), "If `outcome_randomness` is set to 'random', 'probability' columns in 'conditions.csv' need to be of type float!"
-
-            self.trial_info["actual_outcome1"] = np.random.choice(
-                [self.trial_info["potential_outcome1"], 0],
-                p=[
-                    self.trial_info["probability1"],
-                    1 - self.trial_info["probability1"],
-                ],
-            )
-            self.trial_info["actual_outcome2"] = np.random.choice(
-                [self.trial_info["potential_outcome2"], 0],
-                p=[
-                    self.trial_info["probability2"],
-                    1 - self.trial_info["probability2"],
-                ],
-            )
-        ## Otherwise, they are read from the actual_outcome columns directly
-        elif self.trial_info["outcome_randomness"] == "pseudorandom":
-            # just check that actual outcomes are provided
-            for o in [
-                self.trial_info["actual_outcome1"],
-                self.trial_info["actual_outcome2"],
-            ]:
-                assert isinstance(o, (float, int)) and not np.isnan(
-                    o
-                ), "If `outcome_randomness` is set to 'pseudorandom', you must provide numerical values in `actual_outcome`s!"
-        else:
-            raise ValueError(
-                f"`outcome_randomness` experiment setting must be one of ['random', 'pseudorandom'], but is '{self.exp_info['outcome_randomness']}'."
-            )
-
         # Prepare outcome feedback
-        if self.trial_info["feedback"] == "skip":
-            pass
-        else:
-            if self.trial_info["feedback"] in ["complete", "partial"]:
-                ## Content, i.e., reward information
-                outcomeContent = (
-                    self.trial_info["actual_outcome1"],
-                    self.trial_info["actual_outcome2"],
-                )
-            elif self.trial_info["feedback"] == "none":
+        ## Conditions are checked when they are loaded (see `src.conditions.load_conditions`),
+        ## and actual outcomes are realized for the whole session at its start (see `src.schedule.presample_outcomes`)
+        feedback = self.trial_info["feedback"]
+        if feedback != "skip":
+            if feedback == "none":
                 ## show question marks for no feedback (for partial, the unchosen option's content will be updated after choice)
                 outcomeContent = ("?", "?")
             else:
-                raise ValueError(
-                    f"`feedback` must be one of ['complete', 'partial', 'none', 'skip'], but is '{self.trial_info['feedback']}'."
+                ## Content, i.e., reward information
+                outcomeContent = (
+                    outcome_text(self.trial_info["actual_outcome1"]),
+                    outcome_text(self.trial_info["actual_outcome2"]),
                 )
 
-            # Initialize outcome content and color
-            for outcomeStim, outcome in zip(
-                self.outcomeStims,
-                outcomeContent,
-            ):
-                outcomeStim.setText(outcome)
-                # also set color to counterfactual color
-                outcomeStim.color = self.exp_info["outcome_color_counterfactual"]
+            # Initialize outcome content and color (counterfactual color until the choice)
+            self.outcomeContent = outcomeContent
+            for i, outcome in enumerate(outcomeContent):
+                self.set_outcome(i, outcome, self.exp_info["outcome_color_counterfactual"])
 
         # Set positions
-        if self.trial_info["option1pos"] == "left":
-            self.imageStims[0].setPos((self.exp_info["pos_left"], 0))
-            self.imageStims[1].setPos((self.exp_info["pos_right"], 0))
-            self.videoStims[0].setPos((self.exp_info["pos_left"], 0))
-            self.videoStims[1].setPos((self.exp_info["pos_right"], 0))
-            self.outcomeStims[0].setPos((self.exp_info["pos_left"], 0))
-            self.outcomeStims[1].setPos((self.exp_info["pos_right"], 0))
-        elif self.trial_info["option1pos"] == "right":
-            self.imageStims[0].setPos((self.exp_info["pos_right"], 0))
-            self.imageStims[1].setPos((self.exp_info["pos_left"], 0))
-            self.videoStims[0].setPos((self.exp_info["pos_right"], 0))
-            self.videoStims[1].setPos((self.exp_info["pos_left"], 0))
-            self.outcomeStims[0].setPos((self.exp_info["pos_right"], 0))
-            self.outcomeStims[1].setPos((self.exp_info["pos_left"], 0))
-        else:
-            raise ValueError(
-                f"`option1pos` must be 'left' or 'right' (is '{self.trial_info['option1pos']}')."
-            )
+        for stims in [self.imageStims, self.videoStims]:
+            stims[0].setPos((self.trial_info["pos1"], 0))
+            stims[1].setPos((self.trial_info["pos2"], 0))
+
+        # Trial ITI (drawn when the schedule was compiled)
+        self.iti = self.trial_info["iti"]
 
-        # Compute trial ITI
-        self.iti = np.random.uniform(
-            self.exp_info["duration_iti"] - self.exp_info["duration_iti_jitter"] / 2,
-            self.exp_info["duration_iti"] + self.exp_info["duration_iti_jitter"] / 2,
-        )
+        self.prepare_duration = time.perf_counter() - prepare_start
 
     def run(self):
-        # Stimulus phase
-        for rect in self.bg_rects:
-            rect.draw()
-        if self.trial_info["phase"] != "explicit":
-            for image in self.imageStims:
-                image.draw()
-        else:  # explicit phase
-            for explicit in self.explicitStims:
-                explicit.draw()
+        if self.flipRecorder is not None:
+            self.flipRecorder.start_trial()
 
+        # Stimulus phase
         ## Show stimuli and wait for response
-        rt_start = self.win.flip()
+        keyList = [
+            self.exp_info["buttons"]["button_left"],
+            self.exp_info["buttons"]["button_right"],
+            self.exp_info["buttons"]["button_quit"],
+        ]
+        if self.exp_info["response_mode"] == "keyboard":
+            rt_start, keyEvents = self.poll_keyboard(keyList)
+        else:
+            self.draw_stimuli()
+            rt_start = self.flip("stimulus")
 
-        ### Eyetracker message: Stimulus on
-        if self.exp_info["use_eyetracker"]:
-            self.exp_info["eyetracker"].send_message(
-                f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} stimulus on"
-            )
+            ### Eyetracker message and trigger: Stimulus on
+            self.mark_event("stimulus on", rt_start)
 
-        # Serial port trigger example
-        # if self.exp_info["use_serialport"]:
-        #     self.exp_info["serialport"].send_trigger(f"trial_{self.trial_id}_stimuli-on")
+            keyEvents = event.waitKeys(
+                keyList=keyList,
+                maxWait=self.exp_info["duration_timeout"],
+                timeStamped=rt_start,
+            )
 
         # Choice phase
         ## When a choice was made, show the feedback frame for `duration_choice`
         ## or, if `duration_fixed_response == True` for `duration_timeout` - rt
 
-        keyEvents = event.waitKeys(
-            keyList=[
-                self.exp_info["buttons"]["button_left"],
-                self.exp_info["buttons"]["button_right"],
-                self.exp_info["buttons"]["button_quit"],
-            ],
-            maxWait=self.exp_info["duration_timeout"],
-            timeStamped=rt_start,
-        )
-
         ## Decode response
         if keyEvents is not None:
             # participant pressed a button
 
-            ### Eyetracker message
-            if self.exp_info["use_eyetracker"]:
-                self.exp_info["eyetracker"].send_message(
-                    f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} responded"
-                )
-
             if keyEvents[0][0] in [self.exp_info["buttons"]["button_quit"]]:
                 print("User quit experiment.")
                 core.quit()
             timed_out = False
             key_pressed, rt = keyEvents[0]
 
+            ### Eyetracker message and trigger (at the time of the key press)
+            self.mark_event("responded", rt_start + rt)
+
             # decode into response (left or right)
             if key_pressed == self.exp_info["buttons"]["button_left"]:
                 response = "left"
@@ -237,32 +235,12 @@ class Trial(object):
                 raise ValueError(f"An unexpected key was pressed: {key_pressed}")
 
             # decode into choice (1 or 2)
-            if self.trial_info["option1pos"] == "left":
-                if response == "left":
-                    choice = 1
-                elif response == "right":
-                    choice = 2
-                else:
-                    raise ValueError(response)
-            elif self.trial_info["option1pos"] == "right":
-                if response == "left":
-                    choice = 2
-                elif response == "right":
-                    choice = 1
-                else:
-                    raise ValueError(response)
-            else:
-                raise ValueError(
-                    f"`option1pos` must be 'left' or 'right' (is '{self.trial_info['option1pos']}')."
-                )
+            choice = 1 if response == self.trial_info["option1pos"] else 2
         else:
             # no button was pressed
 
-            ## Eye tracker message: timed out
-            if self.exp_info["use_eyetracker"]:
-                self.exp_info["eyetracker"].send_message(
-                    f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} timed out"
-                )
+            ## Eyetracker message and trigger: timed out
+            self.mark_event("timed out", rt_start + self.exp_info["duration_timeout"])
 
             timed_out = True
             key_pressed, rt = (np.nan, np.nan)
@@ -285,14 +263,21 @@ class Trial(object):
                 for videoStim in self.videoStims:
                     videoStim.play()
 
-            choicephase_timer = core.CountdownTimer(duration_choicephase)
-            animation_phase = 0
-
-            ### Eyetracker message: Choice on
-            if self.exp_info["use_eyetracker"]:
-                self.exp_info["eyetracker"].send_message(
-                    f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} choice on"
+            if self.exp_info["response_mode"] == "keyboard":
+                # Count from the key press, not from now, and stop flipping choice frames
+                # when the outcome (shown one frame after the last choice frame) would
+                # otherwise appear more than half a frame too late
+                choicephase_timer = core.CountdownTimer(
+                    rt_start
+                    + rt
+                    + duration_choicephase
+                    - 1.5 * self.win.monitorFramePeriod
+                    - core.getTime()
                 )
+            else:
+                choicephase_timer = core.CountdownTimer(duration_choicephase)
+            animation_phase = 0
+            choice_onset = None
 
             while choicephase_timer.getTime() > 0:
                 # Draw background rectangles
@@ -319,13 +304,12 @@ class Trial(object):
                 ].draw()  # will draw left rect if response == "left" and right rect if response == "right"
 
                 ### Flip it
-                self.win.flip()
+                t = self.flip("choice")
 
-            ### Eyetracker message: Choice off
-            if self.exp_info["use_eyetracker"]:
-                self.exp_info["eyetracker"].send_message(
-                    f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} choice off"
-                )
+                ### Eyetracker message and trigger: Choice on (at the first flip)
+                if choice_onset is None:
+                    choice_onset = t
+                    self.mark_event("choice on", choice_onset)
 
             ## Show outcome(s) if feedback != "skip"
             if not self.trial_info["feedback"] == "skip":
@@ -340,32 +324,44 @@ class Trial(object):
                 # For partial or complete feedback, update chosen option outcome's color
                 if self.trial_info["feedback"] in ["complete", "partial"]:
                     # chosen outcome color
-                    self.outcomeStims[choice - 1].color = self.exp_info["outcome_color"]
+                    self.set_outcome(
+                        choice - 1,
+                        self.outcomeContent[choice - 1],
+                        self.exp_info["outcome_color"],
+                    )
 
                 # For partial feedback, occlude unchosen outcome
                 if self.trial_info["feedback"] == "partial":
-                    self.outcomeStims[1 - (choice - 1)].setText("?")
+                    self.set_outcome(
+                        1 - (choice - 1), "?", self.exp_info["outcome_color_counterfactual"]
+                    )
 
                 # Draw the outcomes
                 [outcomeStim.draw() for outcomeStim in self.outcomeStims]
 
                 # Show everything
-                self.win.flip()
+                t = self.flip("outcome")
 
-                ### Eyetracker message: Outcome on
-                if self.exp_info["use_eyetracker"]:
-                    self.exp_info["eyetracker"].send_message(
-                        f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} outcome on"
-                    )
+                ### Eyetracker messages and triggers: Choice off, outcome on
+                self.mark_event("choice off", t)
+                self.mark_event("outcome on", t)
 
                 core.wait(self.exp_info["duration_outcome"])
             else:  # feedback == "skip"
-                self.win.flip()
+                t = self.flip("outcome")
+
+                ### Eyetracker message and trigger: Choice off
+                self.mark_event("choice off", t)
         else:  # timed out
-            self.win.flip()
+            self.flip("outcome")
 
         # Let's only stop and unload the video here, otherwise timing feels stuttery
+        self.animation_frames_dropped = np.nan
         if not self.trial_info["phase"] == "explicit":
+            if self.exp_info["animation_mode"] == "preloaded":
+                self.animation_frames_dropped = sum(
+                    videoStim.frames_dropped for videoStim in self.videoStims
+                )
             for videoStim in self.videoStims:
                 videoStim.stop()
                 videoStim.unload()
@@ -384,17 +380,29 @@ class Trial(object):
 
         # Show ITI
         ## Trial-specific ITI (in case of `duration_iti_jitter != 0`)
-        ## is computed in self.prepare()
-        self.win.flip()
+        ## comes from the session schedule (see self.prepare())
+        t = self.flip("iti")
 
-        ### Eyetracker message: Outcome off
-        if self.exp_info["use_eyetracker"]:
-            self.exp_info["eyetracker"].send_message(
-                f"{self.trial_info['trial_type']} {self.trial_info['trial_id']} outcome off"
-            )
+        ### Eyetracker message and trigger: Outcome off
+        self.mark_event("outcome off", t)
 
         core.wait(self.iti)
 
+        # Intended vs. achieved durations of the trial phases
+        if self.flipRecorder is not None:
+            intended = dict(iti=self.iti)
+            if timed_out:
+                intended.update(stimulus=self.exp_info["duration_timeout"], outcome=0)
+            else:
+                intended.update(
+                    stimulus=rt,
+                    choice=duration_choicephase,
+                    outcome=0
+                    if self.trial_info["feedback"] == "skip"
+                    else self.exp_info["duration_outcome"],
+                )
+            self.frame_timing = self.flipRecorder.trial_summary(intended)
+
     def log(self):
         # Add subject and session information
         self.trial_info["subject"] = self.exp_info["Subject"]
@@ -404,13 +412,28 @@ class Trial(object):
         self.trial_info["iti"] = self.iti
 
         ## Copy all information from trial_info
-        for var, val in self.trial_info.items():
-            self.exp.addData(var, val)
+        row = dict(self.trial_info.items())
 
         ## Log information
-        self.exp.addData("response", self.response)
-        self.exp.addData("choice", self.choice)
-        self.exp.addData("rt", self.rt)
-        self.exp.addData("obtained_reward", self.obtained_reward)
-        self.exp.addData("cumulative_reward", self.exp_info["total_reward"])
+        row["response"] = self.response
+        row["choice"] = self.choice
+        row["rt"] = self.rt
+        row["obtained_reward"] = self.obtained_reward
+        row["cumulative_reward"] = self.exp_info["total_reward"]
+
+        ## Log preparation latency and image cache usage
+        row["prepare_duration"] = self.prepare_duration
+        row["animation_frames_dropped"] = self.animation_frames_dropped
+        row.update(self.frame_timing)
+        if self.imageCache is not None:
+            row["image_cache_hits"] = self.imageCache.hits
+            row["image_cache_misses"] = self.imageCache.misses
+
+        for var, val in row.items():
+            self.exp.addData(var, val)
         self.exp.nextEntry()
+
+        ## Stream the row to disk right away (in case the session does not end properly)
+        if self.exp_info["log_writer"] is not None:
+            self.exp_info["log_writer"].write(row)
+        return row
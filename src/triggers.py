@@ -0,0 +1,153 @@
+import csv
+import queue
+import threading
+import time
+
+_STOP = object()  # tells the writer thread to finish
+
+
+class TriggerPort(object):
+    """
+    Sends trigger codes (single bytes) to a serial port from a background thread.
+
+    The port is opened once at the start. `send_trigger(event, t)` only looks
+    up the event's code and queues it, so the trial loop never waits for the
+    port. The writer thread writes the code, keeps it up for `pulse_duration`
+    seconds and then writes `reset_code`, so every trigger is a separate pulse
+    (triggers queued in the meantime follow the reset). With
+    `pulse_duration=0`, codes are written without reset.
+
+    Events that are not in `codes` are ignored, so only the events of interest
+    need a code. Every sent trigger is logged with the time it was requested
+    (e.g., the flip time of the event) and the time it was written (both on
+    the psychopy clock) to the csv file `log_path`. Every row is flushed to
+    the operating system as soon as the trigger is sent, so the log of a
+    session that crashes or is quit is complete up to its last trigger.
+
+    Needs pyserial (`pip install pyserial`).
+    """
+
+    def __init__(
+        self,
+        port,
+        codes,
+        baudrate=115200,
+        pulse_duration=0.01,
+        reset_code=0,
+        log_path=None,
+        clock=None,
+    ):
+        import serial
+
+        for event, code in codes.items():
+            if not 0 <= code <= 255 or code == reset_code:
+                raise ValueError(
+                    f"Trigger codes must be between 0 and 255 and differ from `reset_code` ({reset_code}), but '{event}' has {code}."
+                )
+        self.codes = dict(codes)
+        self.pulse_duration = pulse_duration
+        self.reset_code = reset_code
+        if clock is None:
+            from psychopy import core
+
+            clock = core.getTime
+        self.clock = clock
+        self.n_sent = 0
+        self._serial = serial.Serial(port, baudrate=baudrate)
+        self._log_file = None
+        if log_path is not None:
+            self._log_file = open(log_path, "w", newline="")
+            self._log = csv.writer(self._log_file)
+            self._log.writerow(["event", "code", "time_requested", "time_sent"])
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name="TriggerPort", daemon=True)
+        self._thread.start()
+
+    def send_trigger(self, event, t=None):
+        """Queue the trigger of `event` (if it has a code), requested at psychopy clock time `t` (default: now). Does not block."""
+        code = self.codes.get(event)
+        if code is None:
+            return
+        self._queue.put((event, code, self.clock() if t is None else t))
+
+    def _write(self, code):
+        self._serial.write(bytes([code]))
+        self._serial.flush()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            event, code, t_requested = item
+            self._write(code)
+            t_sent = self.clock()
+            if self.pulse_duration > 0:
+                time.sleep(self.pulse_duration)
+                self._write(self.reset_code)
+            self.n_sent += 1
+            if self._log_file is not None:
+                self._log.writerow([event, code, t_requested, t_sent])
+                # in the writer thread, so this never delays the trial loop
+                self._log_file.flush()
+
+    def close(self):
+        """Send all queued triggers, then close the port and the log file."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._serial.close()
+        if self._log_file is not None:
+            self._log_file.close()
+
+
+if __name__ == "__main__":
+    # Test triggers against a pseudo-terminal pair instead of a hardware port (Linux, macOS):
+    # python -m src.triggers [n_triggers] [pulse duration in ms]
+    import os
+    import sys
+    import tty
+
+    import numpy as np
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    pulse_duration = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.002
+
+    # The trigger port writes to one end, we read the other end like the recording device would
+    device, port = os.openpty()
+    tty.setraw(device)
+    tty.setraw(port)
+    codes = {f"event {i}": i for i in range(1, 11)}
+    triggers = TriggerPort(
+        os.ttyname(port), codes, pulse_duration=pulse_duration, clock=time.perf_counter
+    )
+
+    enqueue_durations = []
+    latencies = []
+    received = []
+    for i in range(n):
+        event = f"event {i % 10 + 1}"
+        start = time.perf_counter()
+        triggers.send_trigger(event, start)
+        enqueue_durations.append(time.perf_counter() - start)
+        code = os.read(device, 1)[0]  # trigger onset
+        latencies.append(time.perf_counter() - start)
+        reset = os.read(device, 1)[0]  # end of the pulse
+        received.append((code, reset))
+    triggers.close()
+    os.close(device)
+
+    expected = [(codes[f"event {i % 10 + 1}"], 0) for i in range(n)]
+    enqueue_durations = np.array(enqueue_durations) * 1e6
+    latencies = np.array(latencies) * 1e3
+    print(f"{n} triggers, pulse duration {pulse_duration * 1e3:.1f} ms")
+    print(f"All codes and resets received correctly: {received == expected}")
+    print(
+        f"Time in the trial loop per trigger: median {np.median(enqueue_durations):.1f} µs, "
+        + f"max {enqueue_durations.max():.1f} µs"
+    )
+    print(
+        f"Latency until the code arrived: median {np.median(latencies):.3f} ms, "
+        + f"95th percentile {np.percentile(latencies, 95):.3f} ms, max {latencies.max():.3f} ms"
+    )
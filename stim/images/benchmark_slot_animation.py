@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare the per-frame callback renderer of slot_animation.py with the batch renderer
+on all images of the stimulus sets.
+
+Usage (from stim/images):
+    python benchmark_slot_animation.py [--encode] [--repeats 3]
+
+Without `--encode` only frame generation is timed. With `--encode` the complete
+mp4 files are written (to a temporary folder) with both renderers.
+"""
+import argparse
+import os
+import tempfile
+import time
+from glob import glob
+
+import numpy as np
+
+from slot_animation import (frame_times, load_image, make_displacement_func,
+                            render_animation, render_batch)
+
+ANIMATION = dict(duration=2, rotation_speed=1600.0, axis="vertical", fps=60,
+                 acceleration_duration=0.1, deceleration_duration=0.1)
+
+def frames_callback(img, duration, rotation_speed, axis, fps,
+                    acceleration_duration, deceleration_duration):
+    # What moviepy asks `make_frame` for: one roll and one copy per frame
+    displacement_func = make_displacement_func(duration, rotation_speed,
+                                               acceleration_duration, deceleration_duration)
+    ax = 0 if axis == "vertical" else 1
+    return [np.roll(img, int(displacement_func(t)), axis=ax).astype(np.uint8)
+            for t in frame_times(duration, fps)]
+
+def best_of(repeats, func, *args, **kwargs):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sets", nargs="+", default=["Set 1", "Set 2"], help="Stimulus set folders")
+    parser.add_argument("--repeats", type=int, default=3, help="Repetitions per image (best is reported)")
+    parser.add_argument("--encode", action="store_true", help="Also time writing the mp4 files")
+    args = parser.parse_args()
+
+    pngs = sorted(png for subdir in args.sets for png in glob(os.path.join(subdir, "*.png")))
+    if not pngs:
+        raise SystemExit(f"No PNG files found in {args.sets}. Run this from stim/images.")
+
+    totals = dict(callback=0.0, batch=0.0)
+    print(f"{'image':<16}{'callback (ms)':>15}{'batch (ms)':>12}{'speedup':>9}")
+    for png in pngs:
+        img = load_image(png)
+        t_callback, frames_old = best_of(args.repeats, frames_callback, img, **ANIMATION)
+        t_batch, frames_new = best_of(args.repeats, render_batch, img, **ANIMATION)
+        assert np.array_equal(np.stack(frames_old), frames_new), f"Renderers disagree for {png}"
+        totals["callback"] += t_callback
+        totals["batch"] += t_batch
+        print(f"{png:<16}{t_callback * 1e3:>15.1f}{t_batch * 1e3:>12.1f}{t_callback / t_batch:>8.1f}x")
+    print(f"{'total':<16}{totals['callback'] * 1e3:>15.1f}{totals['batch'] * 1e3:>12.1f}"
+          f"{totals['callback'] / totals['batch']:>8.1f}x")
+
+    if args.encode:
+        print("\nEncoding (frame generation + mp4 writing):")
+        with tempfile.TemporaryDirectory() as tmp:
+            for renderer in ["callback", "batch"]:
+                start = time.perf_counter()
+                for i, png in enumerate(pngs):
+                    render_animation(png, os.path.join(tmp, f"{renderer}_{i}.mp4"),
+                                     renderer=renderer, **ANIMATION)
+                print(f"{renderer:<10}{time.perf_counter() - start:>8.2f} s for {len(pngs)} animations")
+
+if __name__ == "__main__":
+    main()
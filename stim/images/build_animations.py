@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Build the choice animations (`<Set>/anim/*.mp4`) of all stimulus sets.
+
+Every PNG is rendered in its own worker process. A manifest (`<Set>/anim/manifest.json`)
+stores a hash of each source PNG together with the animation parameters, so symbols
+whose image and parameters did not change are skipped on the next run.
+
+Usage (from stim/images):
+    python build_animations.py                 # all "Set *" folders
+    python build_animations.py "Set 3" --fps 120
+    python build_animations.py --force         # rebuild everything
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+from slot_animation import add_animation_arguments, render_animation
+
+MANIFEST = "manifest.json"
+
+def asset_hash(png, params):
+    """Hash of the source image and everything else that changes the rendered movie."""
+    h = hashlib.sha256()
+    with open(png, "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+def read_manifest(anim_dir):
+    try:
+        with open(os.path.join(anim_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_manifest(anim_dir, manifest):
+    path = os.path.join(anim_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def build_asset(png, output, params):
+    start = time.perf_counter()
+    render_animation(png, output, **params)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sets", nargs="*", help="Stimulus set folders (default: all 'Set *' folders)")
+    add_animation_arguments(parser)
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Rebuild all animations, ignoring the manifest")
+    args = parser.parse_args()
+
+    params = dict(duration=args.duration, rotation_speed=args.rotation_speed, axis=args.axis,
+                  fps=args.fps, acceleration_duration=args.acceleration_duration,
+                  deceleration_duration=args.deceleration_duration)
+    subdirs = args.sets or sorted(d for d in glob("Set *") if os.path.isdir(d))
+
+    # Collect everything that needs to be (re-)built
+    manifests = {}
+    jobs = []
+    n_skipped = 0
+    for subdir in subdirs:
+        if not os.path.isdir(subdir):
+            print(f"Directory '{subdir}' does not exist. Skipping.")
+            continue
+        anim_dir = os.path.join(subdir, "anim")
+        os.makedirs(anim_dir, exist_ok=True)
+        manifests[anim_dir] = manifest = read_manifest(anim_dir)
+        pngs = sorted(glob(os.path.join(subdir, "*.png")))
+        if not pngs:
+            print(f"No PNG files found in {subdir}.")
+        for png in pngs:
+            name = os.path.basename(png)
+            output = os.path.join(anim_dir, name.replace(".png", ".mp4"))
+            digest = asset_hash(png, params)
+            if (not args.force and manifest.get(name, {}).get("hash") == digest
+                    and os.path.exists(output)):
+                n_skipped += 1
+                continue
+            jobs.append((anim_dir, name, png, output, digest))
+
+    print(f"{len(jobs)} animations to build, {n_skipped} up to date.")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(build_asset, png, output, params): (anim_dir, name, output, digest)
+                   for anim_dir, name, png, output, digest in jobs}
+        for future in as_completed(futures):
+            anim_dir, name, output, digest = futures[future]
+            try:
+                duration = future.result()
+            except Exception as error:
+                print(f"FAILED  {output}: {error}")
+                continue
+            print(f"{duration:6.2f} s  {output}")
+            manifests[anim_dir][name] = dict(hash=digest, params=params)
+            # save after every asset, so an interrupted build keeps its progress
+            write_manifest(anim_dir, manifests[anim_dir])
+    print(f"Done in {time.perf_counter() - start:.2f} s.")
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,96 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import sys
+
 import numpy as np
-from moviepy.editor import VideoClip
 from PIL import Image
 
-def displacement_piecewise(t, T, total_offset, aT, dT):
-    """
-    Compute the displacement (in pixels) at time t using a piecewise function
-    with acceleration, constant speed, and deceleration phases.
+# The displacement profile is shared with the task (repository root)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from src.scroll import scroll_displacement
+
+def make_displacement_func(duration, rotation_speed, acceleration_duration, deceleration_duration):
     """
-    T_const = T - aT - dT  # constant speed phase duration
-    # Compute maximum speed so that the total displacement is achieved:
-    v_max = total_offset / (T_const + 0.5 * (aT + dT))
-    if t < aT:
-        # Acceleration phase: quadratic ease-in
-        return 0.5 * (v_max / aT) * (t ** 2)
-    elif t < aT + T_const:
-        # Constant speed phase: linear motion
-        return 0.5 * v_max * aT + v_max * (t - aT)
-    else:
-        # Deceleration phase: quadratic ease-out
-        t_prime = t - (aT + T_const)
-        return (0.5 * v_max * aT +
-                v_max * T_const +
-                v_max * t_prime -
-                0.5 * (v_max / dT) * (t_prime ** 2))
+    Return the displacement function (time(s) -> pixels) of the animation.
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Create a slot machine style animation from an image."
-    )
-    parser.add_argument("--input", type=str, default="1.png", help="Input image file")
-    parser.add_argument("--output", type=str, default="output.mp4", help="Output mp4 file")
-    parser.add_argument("--duration", type=float, default=2, help="Animation duration in seconds")
-    parser.add_argument("--rotation_speed", type=float, default=1600.0,
-                        help="Average rotation speed in pixels per second")
-    parser.add_argument("--axis", type=str, choices=["vertical", "horizontal"], default="vertical",
-                        help="Axis along which to roll the image")
-    parser.add_argument("--fps", type=int, default=60, help="Frames per second for the output video")
-    parser.add_argument("--acceleration_duration", type=float, default=0.1,
-                        help="Acceleration phase duration in seconds (optional)")
-    parser.add_argument("--deceleration_duration", type=float, default=0.1,
-                        help="Deceleration phase duration in seconds (optional)")
-    args = parser.parse_args()
+    The profile is `src.scroll.scroll_displacement`, which the task's
+    procedural animations use as well.
+    """
+    def displacement_func(t):
+        return scroll_displacement(t, duration, rotation_speed,
+                                   acceleration_duration, deceleration_duration)
+    return displacement_func
 
-    # --- Load and prepare the image ---
+def load_image(path):
     # Force conversion to RGB to avoid issues with alpha or palette modes.
-    pil_img = Image.open(args.input).convert("RGB")
-    img = np.array(pil_img)
-    height, width = img.shape[:2]
-
-    # --- Compute overall displacement ---
-    total_offset = args.rotation_speed * args.duration
-
-    # --- Define the displacement function ---
-    # Use piecewise acceleration/deceleration if both durations are provided
-    if (args.acceleration_duration is not None and args.deceleration_duration is not None and
-            (args.acceleration_duration + args.deceleration_duration) < args.duration):
-        def displacement_func(t):
-            return displacement_piecewise(t, args.duration, total_offset,
-                                          args.acceleration_duration, args.deceleration_duration)
-    else:
-        # Otherwise, use a cosine ease-in/out function
-        def displacement_func(t):
-            progress = 0.5 - 0.5 * np.cos(np.pi * t / args.duration)
-            return total_offset * progress
+    return np.array(Image.open(path).convert("RGB"))
+
+def render_frames(img, offsets, axis="vertical"):
+    """
+    Render all frames at once.
+
+    Rolling an image by `offset` is the same as reading a window of the image's
+    length from a doubled copy of it, starting at `-offset`. So the rows (or
+    columns) of all frames are gathered from one doubled buffer with a single
+    fancy index, into a contiguous array of shape (n_frames, height, width, 3).
+    """
+    ax = 0 if axis == "vertical" else 1
+    length = img.shape[ax]
+    doubled = np.concatenate([img, img], axis=ax).astype(np.uint8, copy=False)
+    starts = (-np.asarray(offsets, dtype=np.int64)) % length
+    index = starts[:, None] + np.arange(length)  # (n_frames, length)
+    if ax == 0:
+        return doubled[index]
+    return doubled[np.arange(img.shape[0])[None, :, None], index[:, None, :]]
+
+def frame_times(duration, fps):
+    # Same frame times that moviepy uses when writing a clip
+    return np.arange(0, duration, 1.0 / fps)
+
+def render_batch(img, duration, rotation_speed, axis, fps,
+                 acceleration_duration, deceleration_duration):
+    displacement_func = make_displacement_func(duration, rotation_speed,
+                                               acceleration_duration, deceleration_duration)
+    offsets = displacement_func(frame_times(duration, fps)).astype(np.int64)
+    return render_frames(img, offsets, axis)
+
+def write_frames(frames, output, fps):
+    """
+    Stream a contiguous (n_frames, height, width, 3) array to ffmpeg in one go.
+
+    Encoded like moviepy's `write_videofile(codec="libx264")` in `write_callback`:
+    x264 with preset "medium" and its default quality (no crf or bitrate given),
+    and yuv420p pixels if width and height are even (otherwise ffmpeg's choice
+    for RGB input, yuv444p).
+    """
+    import imageio_ffmpeg
+
+    height, width = frames.shape[1:3]
+    pix_fmt_out = "yuv420p" if width % 2 == 0 and height % 2 == 0 else "yuv444p"
+    writer = imageio_ffmpeg.write_frames(output, (width, height), fps=fps, codec="libx264",
+                                         pix_fmt_out=pix_fmt_out, quality=None,
+                                         macro_block_size=1, output_params=["-preset", "medium"])
+    writer.send(None)  # seed the generator
+    writer.send(frames)
+    writer.close()
+
+def write_callback(img, output, duration, rotation_speed, axis, fps,
+                   acceleration_duration, deceleration_duration):
+    """
+    Previous rendering path: moviepy calls `make_frame` once per frame.
+    """
+    from moviepy.editor import VideoClip
+
+    displacement_func = make_displacement_func(duration, rotation_speed,
+                                               acceleration_duration, deceleration_duration)
 
     # --- Function to generate each video frame ---
     def make_frame(t):
         # Compute current offset (in pixels)
         offset = int(displacement_func(t))
         # Roll the image; np.roll automatically wraps around the array.
-        if args.axis == "vertical":
+        if axis == "vertical":
             frame = np.roll(img, offset, axis=0)
         else:
             frame = np.roll(img, offset, axis=1)
@@ -79,8 +98,53 @@ def main():
         return frame.astype(np.uint8)
 
     # --- Create and write the video clip ---
-    clip = VideoClip(make_frame, duration=args.duration)
-    clip.write_videofile(args.output, fps=args.fps, codec="libx264")
+    clip = VideoClip(make_frame, duration=duration)
+    clip.write_videofile(output, fps=fps, codec="libx264")
+
+def render_animation(input, output, duration=2, rotation_speed=1600.0, axis="vertical", fps=60,
+                     acceleration_duration=0.1, deceleration_duration=0.1, renderer="batch"):
+    """
+    Create the slot machine animation of image `input` and save it to `output`.
+    """
+    img = load_image(input)
+    if renderer == "batch":
+        frames = render_batch(img, duration, rotation_speed, axis, fps,
+                              acceleration_duration, deceleration_duration)
+        write_frames(frames, output, fps)
+    elif renderer == "callback":
+        write_callback(img, output, duration, rotation_speed, axis, fps,
+                       acceleration_duration, deceleration_duration)
+    else:
+        raise ValueError(f"`renderer` must be one of ['batch', 'callback'], but is '{renderer}'.")
+
+def add_animation_arguments(parser):
+    parser.add_argument("--duration", type=float, default=2, help="Animation duration in seconds")
+    parser.add_argument("--rotation_speed", type=float, default=1600.0,
+                        help="Average rotation speed in pixels per second")
+    parser.add_argument("--axis", type=str, choices=["vertical", "horizontal"], default="vertical",
+                        help="Axis along which to roll the image")
+    parser.add_argument("--fps", type=int, default=60, help="Frames per second for the output video")
+    parser.add_argument("--acceleration_duration", type=float, default=0.1,
+                        help="Acceleration phase duration in seconds (optional)")
+    parser.add_argument("--deceleration_duration", type=float, default=0.1,
+                        help="Deceleration phase duration in seconds (optional)")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create a slot machine style animation from an image."
+    )
+    parser.add_argument("--input", type=str, default="1.png", help="Input image file")
+    parser.add_argument("--output", type=str, default="output.mp4", help="Output mp4 file")
+    add_animation_arguments(parser)
+    parser.add_argument("--renderer", type=str, choices=["batch", "callback"], default="batch",
+                        help="Render all frames at once ('batch') or one moviepy callback per frame ('callback')")
+    args = parser.parse_args()
+
+    render_animation(args.input, args.output, duration=args.duration,
+                     rotation_speed=args.rotation_speed, axis=args.axis, fps=args.fps,
+                     acceleration_duration=args.acceleration_duration,
+                     deceleration_duration=args.deceleration_duration,
+                     renderer=args.renderer)
 
 if __name__ == "__main__":
     main()
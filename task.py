@@ -18,22 +18,45 @@ Felix Molter
 2025-02-03
 felixmolter@gmail.com
 """
+import sys
+
+from src.startup import StartupProfiler
+
+# Opt-in time breakdown of the startup: python task.py --profile-startup
+profiler = StartupProfiler(enabled="--profile-startup" in sys.argv)
+
+# Continue a crashed or quit session at its next trial: python task.py --resume data/<logfile>
+resume_path = sys.argv[sys.argv.index("--resume") + 1] if "--resume" in sys.argv else None
+
+PSYCHOPY_VERSION = "2024.1.0"
+
 import psychopy
 
-psychopy.useVersion("2024.1.0")
+# Switching versions is slow, only do it if another version is installed
+if psychopy.__version__ != PSYCHOPY_VERSION:
+    psychopy.useVersion(PSYCHOPY_VERSION)
+profiler.lap("version switching")
 
-from psychopy import visual, event, core, data, gui, monitors
+from psychopy import visual, event, core, data, gui
 from psychopy.tools.filetools import fromFile, toFile
-from string import ascii_uppercase
 
 import numpy as np
-import pandas as pd
-import random
 from os.path import join
 import os
 import json
 
-from src import ImageSlide, TextSlide, SlideShow, Trial
+from src import (
+    ImageSlide,
+    TextSlide,
+    SlideShow,
+    Trial,
+    TrialRecord,
+    ImageCache,
+)
+from src.conditions import load_conditions
+from src.schedule import compile_schedule, make_stimulus_map, schedule_to_frame
+
+profiler.lap("imports")
 
 __version__ = 0.1  # because I pretend to know how to make software
 
@@ -47,8 +70,8 @@ if __name__ == "__main__":
     # Load settings from external settings.py file
     from settings import *
 
-    ## Load conditions file
-    conditions = pd.read_csv(os.path.join("stim", conditions_file))
+    ## Load conditions file (checked once and cached, see `src.conditions.load_conditions`)
+    conditions = load_conditions(os.path.join("stim", conditions_file))
 
     # Check if duration settings are possible
     if duration_fixed_response:
@@ -59,6 +82,7 @@ if __name__ == "__main__":
     ## Create folder if it does not exist
     if not os.path.exists(logfile_folder):
         os.makedirs(logfile_folder)
+    profiler.lap("settings")
 
     ##############################
     # ===== Experiment GUI ===== #
@@ -66,50 +90,89 @@ if __name__ == "__main__":
     # This configures the little
     # dialogue box to enter infos.
 
-    # Try to read experiment settings from a previous run
-    try:
-        exp_info = fromFile("lastRunSettings.pickle")
-        exp_info["Stimulus-Set"] = ["Set 1", "Set 2"]
-    # If there is none, then we use a default parameter set
-    except:
+    if resume_path is not None:
+        # Continue a session: same participant info, seed, stimuli and logfile name as before
+        from src.checkpoint import load_checkpoint, restore_random_state
+
+        resume_logfile = resume_path
+        for suffix in [".csv", "_settings.json", "_checkpoint.jsonl", "_trials.jsonl"]:
+            if resume_logfile.endswith(suffix):
+                resume_logfile = resume_logfile[: -len(suffix)]
+        with open(f"{resume_logfile}_settings.json") as file:
+            resumed_info = json.load(file)
+        resume_state, resumed_rows = load_checkpoint(f"{resume_logfile}_checkpoint.jsonl")
         exp_info = {
-            "Subject": "",
-            "Experimenter": "",
-            "Session": "",
-            "Stimulus-Set": ["Set 1", "Set 2"],
+            key: resumed_info[key]
+            for key in ["Subject", "Experimenter", "Session", "Stimulus-Set", "Date", "Time", "random_seed"]
         }
-    # Add current time
-    exp_info["Date"] = data.getDateStr(format="%Y%m%d")
-    exp_info["Time"] = data.getDateStr(format="%H%M")
-
-    # Draw a random random seed
-    random_seed = np.random.randint(100, 999)
-    exp_info["random_seed"] = random_seed
-
-    # Present the dialog to change parameters:
-    dlg = gui.DlgFromDict(exp_info, title=experiment_name, fixed=["Date", "Time"])
-
-    # Set and save random seed
-    np.random.seed(exp_info["random_seed"])
-
-    if dlg.OK:
-        toFile("lastRunSettings.pickle", exp_info)
+        np.random.seed(exp_info["random_seed"])
+        ## Files that are not continued (settings, flips, triggers, eye tracking) get a new name
+        file_suffix = "_resumed-" + data.getDateStr(format="%H%M%S")
+        print(
+            f"Resuming '{resume_logfile}' after {len(resumed_rows)} trials"
+            + (f" ({resume_state['phase']} trial {resume_state['trial']})." if resume_state else ".")
+        )
     else:
-        core.quit()
+        # Try to read experiment settings from a previous run
+        try:
+            exp_info = fromFile("lastRunSettings.pickle")
+            exp_info["Stimulus-Set"] = ["Set 1", "Set 2"]
+        # If there is none, then we use a default parameter set
+        except:
+            exp_info = {
+                "Subject": "",
+                "Experimenter": "",
+                "Session": "",
+                "Stimulus-Set": ["Set 1", "Set 2"],
+            }
+        # Add current time
+        exp_info["Date"] = data.getDateStr(format="%Y%m%d")
+        exp_info["Time"] = data.getDateStr(format="%H%M")
+
+        # Draw a random random seed
+        random_seed = np.random.randint(100, 999)
+        exp_info["random_seed"] = random_seed
+
+        # Present the dialog to change parameters:
+        dlg = gui.DlgFromDict(exp_info, title=experiment_name, fixed=["Date", "Time"])
+
+        # Set and save random seed
+        np.random.seed(exp_info["random_seed"])
+
+        if dlg.OK:
+            toFile("lastRunSettings.pickle", exp_info)
+        else:
+            core.quit()
+        resume_state, resumed_rows = None, []
+        file_suffix = ""
+    profiler.lap("dialog")
 
     # ---
     # External hardware setup
     # ---
-    # PLACEHOLDER FOR SERIAL PORT SETUP # # # # # #
+    # Serial port triggers
+    ## Sent from a background thread, every trigger is logged to `<logfile>_triggers.csv`
     if use_serialport:
-        # TODO: Include this. # # # # # # # # # # # # #
-        serialport = None
+        from src import TriggerPort
+
+        serialport = TriggerPort(
+            serialport_name,
+            serialport_codes,
+            baudrate=serialport_baudrate,
+            pulse_duration=serialport_pulse_duration,
+            log_path=os.path.join(
+                logfile_folder,
+                f"task-{experiment_label}_subject-{exp_info['Subject']}_date-{exp_info['Date']}_time-{exp_info['Time']}{file_suffix}_triggers.csv",
+            ),
+        )
     else:
         serialport = None
 
     # PLACEHOLDER FOR EYE-TRACKER SETUP # # # # # #
     if use_eyetracker:
+        from psychopy import monitors
         from titta import Titta
+        from src import GazeRecorder, MessageDispatcher
 
         # Monitor setup
         mon = monitors.Monitor(monitor)
@@ -120,7 +183,7 @@ if __name__ == "__main__":
         settings = Titta.get_defaults(eyetracker_name)
         settings.FILENAME = os.path.join(
             logfile_folder,
-            f"task-{experiment_label}_subject-{exp_info['Subject']}_date-{exp_info['Date']}_time-{exp_info['Time']}_eyetracking",
+            f"task-{experiment_label}_subject-{exp_info['Subject']}_date-{exp_info['Date']}_time-{exp_info['Time']}{file_suffix}_eyetracking",
         )
         settings.N_CAL_TARGETS = eyetracker_n_calibration_targets
         settings.DEBUG = eyetracker_debug
@@ -131,8 +194,28 @@ if __name__ == "__main__":
             eyetracker.set_dummy_mode()
         eyetracker.init()
         eyetracker.send_message("experiment begin")
+
+        # Write the samples to disk while recording (from a background thread), with the messages
+        if eyetracker_stream:
+            gaze_recorder = GazeRecorder(
+                eyetracker,
+                settings.FILENAME,
+                interval=eyetracker_stream_interval,
+                chunk_size=eyetracker_stream_chunk_size,
+            )
+        else:
+            gaze_recorder = None
+
+        # Send messages from a background thread, timestamped with the flips they belong to
+        ## Titta's dummy mode keeps time in seconds, so its messages are stamped when they arrive
+        eyetracker_messages = MessageDispatcher(
+            eyetracker, n_sync=0 if eyetracker_dummy_mode else 20, recorder=gaze_recorder
+        )
     else:
         eyetracker = None
+        eyetracker_messages = None
+        gaze_recorder = None
+    profiler.lap("hardware connect")
 
     ############################
     # ===== Window setup ===== #
@@ -149,6 +232,7 @@ if __name__ == "__main__":
 
     if fullscreen:
         screen_size = win.monitor.getSizePix()
+    profiler.lap("window")
 
     ############################
     # ===== Instructions ===== #
@@ -164,40 +248,25 @@ if __name__ == "__main__":
         instr_slides_explicit,
         debriefing_slides,
     ) = instructions.make_instructions(win)
+    profiler.lap("instructions")
 
     #########################################################################################################
     ## FROM THIS POINT ON, THERE BE DRAGONS. ONLY GO THERE IF YOU KNOW WHAT YOU'RE DOING AND HAVE A BACKUP ##
     #########################################################################################################
 
     # Make random mapping of symbol IDs (ABCDEFGH and training ones) to images (1,2,3,4,5.png)
-    ## Get the number of symbols needed
     ## After a random number generator seed has been set, there will be a
     ## participant-specific mapping of symbols (e.g., 1.png) to IDs (e.g., A)
     ## Don't change unless you're really sure about it.
-    n_symbols_training = np.unique(
-        conditions.query("phase == 'training'")[["symbol1", "symbol2"]].values.ravel()
-    ).size
-    n_symbols_task = np.unique(
-        conditions.query("phase == 'learning'")[["symbol1", "symbol2"]].values.ravel()
-    ).size
+    if resume_path is not None:
+        stimulus_map = resumed_info["stimulus_map"]
+    else:
+        stimulus_map = make_stimulus_map(conditions, rng=np.random)
     print(
-        f"Assuming {n_symbols_training} training symbols and {n_symbols_task} task symbols."
+        f"Assuming {sum(symbol.startswith('T') for symbol in stimulus_map)} training symbols and "
+        + f"{sum(not symbol.startswith('T') for symbol in stimulus_map)} task symbols."
     )
 
-    symbol_ids = ascii_uppercase[:n_symbols_task]
-    image_names = [f"{i + 1}.png" for i in range(n_symbols_task + n_symbols_training)]
-    np.random.shuffle(image_names)  # shuffle in place
-
-    # first n_symbols_training images are for training
-    training_symbol_map = {
-        f"T{i + 1}": image_names[i] for i in range(n_symbols_training)
-    }
-    # next n_symbols_task images are for main task
-    task_symbol_map = {
-        symbol_id: image_names[n_symbols_training + i]
-        for i, symbol_id in enumerate(symbol_ids)
-    }
-
     # Build the logfile name
     logfile_name = f"task-{experiment_label}_subject-{exp_info['Subject']}_date-{exp_info['Date']}_time-{exp_info['Time']}"
     logfile_path = os.path.join(logfile_folder, logfile_name)
@@ -226,9 +295,24 @@ if __name__ == "__main__":
     exp_info["pos_right"] = pos_right
     exp_info["screen_size"] = screen_size
     exp_info["animation_speed"] = animation_speed
+    exp_info["image_cache_size"] = image_cache_size
+    exp_info["cache_explicit_labels"] = cache_explicit_labels
+    exp_info["cache_outcome_texts"] = cache_outcome_texts
+    exp_info["animation_mode"] = animation_mode
+    exp_info["animation_preload_max_mb"] = animation_preload_max_mb
+    exp_info["animation_scroll_duration"] = animation_scroll_duration
+    exp_info["animation_scroll_speed"] = animation_scroll_speed
+    exp_info["animation_scroll_axis"] = animation_scroll_axis
+    exp_info["animation_scroll_acceleration_duration"] = (
+        animation_scroll_acceleration_duration
+    )
+    exp_info["animation_scroll_deceleration_duration"] = (
+        animation_scroll_deceleration_duration
+    )
 
     ## Experiment Flow
     exp_info["temporal_arrangement"] = temporal_arrangement
+    exp_info["response_mode"] = response_mode
     exp_info["buttons"] = dict(
         button_quit=button_quit,
         button_left=button_left,
@@ -243,21 +327,41 @@ if __name__ == "__main__":
     exp_info["training_n_repeats_max"] = training_n_repeats_max
     exp_info["show_block_dividers"] = show_block_dividers
     exp_info["show_score_after_phase"] = show_score_after_phase
-    exp_info["total_reward"] = 0  # used to track reward
+    exp_info["total_reward"] = 0 if resume_state is None else resume_state["total_reward"]  # used to track reward
+    exp_info["resume_trial"] = 0 if resume_state is None else resume_state["trial"] + 1  # first trial to run
     exp_info["logfile_path"] = logfile_path
+    exp_info["log_stream"] = log_stream
+    exp_info["print_trial_info"] = print_trial_info
+    exp_info["record_flips"] = record_flips
+    exp_info["flip_drop_tolerance"] = flip_drop_tolerance
 
     ## Stimuli
-    exp_info["stimuli"] = dict(conditions=conditions.to_dict())
-    exp_info["stimulus_map"] = dict(
-        task_symbol_map, **training_symbol_map
-    )  # combines task- and training symbol map
+    exp_info["stimulus_map"] = stimulus_map  # combines task- and training symbol map
+
+    # Compile the complete session schedule
+    ## Trial order, outcomes, ITIs, positions and files of every trial are decided here,
+    ## from the random seed only. The session then just walks through it.
+    ## Training trials are included once for every possible repetition.
+    exp_info["schedule_file"] = f"{logfile_path}_schedule.npy"
+    if resume_path is not None:
+        ## Continue with the schedule of the first run (even if conditions or settings changed since)
+        schedule = np.load(exp_info["schedule_file"])
+    else:
+        schedule = compile_schedule(conditions, exp_info, seed=exp_info["random_seed"])
+        np.save(exp_info["schedule_file"], schedule)
+    schedule = schedule_to_frame(schedule)
+    exp_info["stimuli"] = dict(
+        conditions=conditions.to_dict(), schedule=schedule.to_dict()
+    )
 
     ## External Hardware
     exp_info["use_eyetracker"] = use_eyetracker
     exp_info["use_serialport"] = use_serialport
+    if use_serialport:
+        exp_info["serialport_codes"] = serialport_codes
 
     # Save experiment settings for this run
-    with open(f"{logfile_path}_settings.json", "w") as file:
+    with open(f"{logfile_path}{file_suffix}_settings.json", "w") as file:
         json.dump(exp_info, file)
 
     # Also add serial port (after .json dump)
@@ -265,11 +369,57 @@ if __name__ == "__main__":
 
     # Add eye tracking object
     exp_info["eyetracker"] = eyetracker
+    exp_info["eyetracker_messages"] = eyetracker_messages
+    exp_info["gaze_recorder"] = gaze_recorder
 
     # Set up experiment object
     exp = data.ExperimentHandler(
         name=experiment_name, version=__version__, dataFileName=logfile_path
     )
+    ## When resuming, the trials of the first run are logged again, so the .csv has the whole session
+    for row in resumed_rows:
+        for var, val in row.items():
+            exp.addData(var, val)
+        exp.nextEntry()
+
+    # Stream trials to disk while the task runs
+    if log_stream:
+        from src import TrialLogWriter
+
+        exp_info["log_writer"] = TrialLogWriter(
+            f"{logfile_path}_trials.jsonl", fsync_interval=log_fsync_interval
+        )
+    else:
+        exp_info["log_writer"] = None
+
+    # Checkpoint after every trial, to resume the session if it does not end properly
+    if checkpoint:
+        from src import Checkpoint
+
+        exp_info["checkpoint"] = Checkpoint(f"{logfile_path}_checkpoint.jsonl")
+    else:
+        exp_info["checkpoint"] = None
+
+    # Keyboard for frame-locked response polling
+    if response_mode == "keyboard":
+        from psychopy.hardware import keyboard
+
+        exp_info["keyboard"] = keyboard.Keyboard()
+    elif response_mode == "event":
+        exp_info["keyboard"] = None
+    else:
+        raise ValueError(
+            f"`response_mode` must be one of ['keyboard', 'event'], but is '{response_mode}'."
+        )
+
+    # Record the timing of every flip
+    if record_flips:
+        from src import FlipRecorder
+
+        exp_info["flip_recorder"] = FlipRecorder(win, tolerance=flip_drop_tolerance)
+    else:
+        exp_info["flip_recorder"] = None
+    profiler.lap("schedule")
 
     ###########################
     ## Set up visual stimuli ##
@@ -292,26 +442,91 @@ if __name__ == "__main__":
     )
     images = [image_left, image_right]
 
-    ## Videos
-    ## Files are just placeholder, will be replaced in `trial.prepare()`
-    video_left = visual.MovieStim(
-        win,
-        filename="",  # join("stim", "images", str(exp_info["Stimulus-Set"]), "anim", "1.mp4"),
-        pos=(pos_left, 0),
-        size=(symbol_width, symbol_height),
-        loop=False,
-        autoStart=False,
-        units="height",
-    )
-    video_right = visual.MovieStim(
+    ## Decode all symbol images of this session once, so that `trial.prepare()` only swaps them
+    image_cache = ImageCache(
         win,
-        filename="",  # join("stim", "images", str(exp_info["Stimulus-Set"]), "anim", "2.mp4"),
-        pos=(pos_right, 0),
+        capacity=image_cache_size,
         size=(symbol_width, symbol_height),
-        loop=False,
-        autoStart=False,
-        units="height",
     )
+    image_cache.preload(exp_info["Stimulus-Set"], exp_info["stimulus_map"].values())
+
+    ## Videos
+    ## Files are just placeholder, will be replaced in `trial.prepare()`
+    if animation_mode == "movie":
+        video_left = visual.MovieStim(
+            win,
+            filename="",  # join("stim", "images", str(exp_info["Stimulus-Set"]), "anim", "1.mp4"),
+            pos=(pos_left, 0),
+            size=(symbol_width, symbol_height),
+            loop=False,
+            autoStart=False,
+            units="height",
+        )
+        video_right = visual.MovieStim(
+            win,
+            filename="",  # join("stim", "images", str(exp_info["Stimulus-Set"]), "anim", "2.mp4"),
+            pos=(pos_right, 0),
+            size=(symbol_width, symbol_height),
+            loop=False,
+            autoStart=False,
+            units="height",
+        )
+    elif animation_mode == "preloaded":
+        ## Decode all animations once, trials then only pick frames from memory
+        from src import MovieBank, PreloadedMovieStim
+
+        movie_bank = MovieBank(
+            exp_info["Stimulus-Set"], max_mb=animation_preload_max_mb
+        )
+        video_left = PreloadedMovieStim(
+            win,
+            movies=movie_bank,
+            pos=(pos_left, 0),
+            size=(symbol_width, symbol_height),
+            units="height",
+        )
+        video_right = PreloadedMovieStim(
+            win,
+            movies=movie_bank,
+            pos=(pos_right, 0),
+            size=(symbol_width, symbol_height),
+            units="height",
+        )
+    elif animation_mode == "procedural":
+        ## Roll the symbol images at draw time, no movie files involved
+        from src import ScrollingImageStim
+
+        scroll_images = [
+            image_cache.path(exp_info["Stimulus-Set"], image_name)
+            for image_name in exp_info["stimulus_map"].values()
+        ]
+        scroll_settings = dict(
+            duration=animation_scroll_duration,
+            rotation_speed=animation_scroll_speed,
+            axis=animation_scroll_axis,
+            acceleration_duration=animation_scroll_acceleration_duration,
+            deceleration_duration=animation_scroll_deceleration_duration,
+        )
+        video_left = ScrollingImageStim(
+            win,
+            images=scroll_images,
+            pos=(pos_left, 0),
+            size=(symbol_width, symbol_height),
+            units="height",
+            **scroll_settings,
+        )
+        video_right = ScrollingImageStim(
+            win,
+            images=scroll_images,
+            pos=(pos_right, 0),
+            size=(symbol_width, symbol_height),
+            units="height",
+            **scroll_settings,
+        )
+    else:
+        raise ValueError(
+            f"`animation_mode` must be one of ['movie', 'preloaded', 'procedural'], but is '{animation_mode}'."
+        )
     videos = [video_left, video_right]
 
     ## Set up background rectangles
@@ -388,17 +603,44 @@ if __name__ == "__main__":
     )
     explicit = [explicit_left, explicit_right]
 
+    ## Render the lottery labels of all explicit trials once, so that trials only swap
+    ## textures and the opacity animation does not re-render text, and lay out all outcome
+    ## texts once (in both colors, at both positions), so that showing feedback only swaps stimuli
+    from src.labelcache import preload_caches
+
+    label_cache, outcome_cache = preload_caches(
+        win,
+        schedule,
+        templates=explicit,
+        backgrounds=bg_rects,
+        positions=[pos_left, pos_right],
+        colors=[outcome_color, outcome_color_counterfactual],
+        labels=cache_explicit_labels,
+        outcomes=cache_outcome_texts,
+        height=text_height * outcome_text_scale,
+    )
+
     # Save all pre-made visual elements
     visual_elements = dict(
         images=images,
+        image_cache=image_cache,
         videos=videos,
         bg_rects=bg_rects,
         outcomes=outcomes,
+        outcome_cache=outcome_cache,
         explicit=explicit,
+        label_cache=label_cache,
         fb_rects=fb_rects,
     )
     ## They are saved to `exp_info` so that `run_phase` and `Trial.run()` can use them
     exp_info["visual_elements"] = visual_elements
+    profiler.lap("stimuli")
+    profiler.print_report()
+    profiler.save(f"{logfile_path}{file_suffix}_startup.json")
+
+    # Continue the random number generator where the first run stopped
+    if resume_state is not None and resume_state["random_state"] is not None:
+        restore_random_state(resume_state["random_state"])
 
     ######################
     ## Start experiment ##
@@ -406,37 +648,58 @@ if __name__ == "__main__":
 
     def run_phase(
         phase,
-        conditions,
+        schedule,
         instruction_slides,
         exp_info,
         exp,
         win,
         calibrate_eyetracker=False,
+        training_repeat=0,
     ):
         """
         This function runs a single phase of the task.
 
         Specifically, it
-        - selects the conditions for this phase
+        - selects the trials of this phase from the session schedule
         - shows instructions
         - runs trials (with optional block dividers)
         - optionally shows points tally after phase is done
 
         Args:
             phase (str): "training", "learning", "transfer", or "explicit"
-            conditions (pandas.DataFrame): _description_
+            schedule (pandas.DataFrame): Compiled session schedule (see `src.schedule.compile_schedule`)
             instructions (slideshow.Slide): list of slide objects
             exp_info (_type_): _description_
+            training_repeat (int): Which repetition of the training phase this is (their outcomes differ)
         """
-        ## Extract conditions
-        conditions_phase = conditions.loc[conditions["phase"] == phase]
+        ## Extract trials of this phase (already in presentation order)
+        conditions_phase = schedule.loc[
+            (schedule["phase"] == phase)
+            & (schedule["training_repeat"] == training_repeat)
+        ]
+
+        ## When resuming, phases that were completed before are skipped, and so are completed trials
+        resume_trial = exp_info["resume_trial"]
+        if len(conditions_phase) > 0 and conditions_phase.index[-1] < resume_trial:
+            print(f"{phase} was completed before resuming.")
+            return
+        if len(conditions_phase) > 0 and conditions_phase.index[0] < resume_trial:
+            instruction_slides = [
+                TextSlide(
+                    win=win,
+                    text="Es geht dort weiter, wo Sie aufgehört haben."
+                    + f"\n\nMit '{exp_info['buttons']['button_instr_finish'].capitalize()}' fortfahren.",
+                    height=exp_info["text_height"],
+                    color=exp_info["text_color"],
+                ),
+            ]
 
         # Only proceed if there are conditions to do
         if len(conditions_phase) > 0:
             run_phase_message = f"{phase} begin ({len(conditions_phase)} trials)"
             print(run_phase_message)
             if exp_info["use_eyetracker"]:
-                exp_info["eyetracker"].send_message(run_phase_message)
+                exp_info["eyetracker_messages"].send(run_phase_message)
 
             ## Run instruction slideshow
             instruction = SlideShow(
@@ -449,14 +712,14 @@ if __name__ == "__main__":
                 keys_skip=[exp_info["buttons"]["button_instr_skip"]],
             )
             if exp_info["use_eyetracker"]:
-                exp_info["eyetracker"].send_message(f"{phase} instructions on")
+                exp_info["eyetracker_messages"].send(f"{phase} instructions on")
             response = instruction.run()
 
             ## Eye tracking
             if exp_info["use_eyetracker"]:
                 ### Calibration
                 if calibrate_eyetracker:
-                    eyetracker.send_message(f"{phase} calibration on")
+                    exp_info["eyetracker_messages"].send(f"{phase} calibration on")
                     if eyetracker_bimonocular_calibration:
                         exp_info["eyetracker"].calibrate(
                             win, eye="left", calibration_number="first"
@@ -466,10 +729,10 @@ if __name__ == "__main__":
                         )
                     else:
                         exp_info["eyetracker"].calibrate(win)
-                    eyetracker.send_message(f"{phase} calibration off")
+                    exp_info["eyetracker_messages"].send(f"{phase} calibration off")
 
-                ### Start recording
-                exp_info["eyetracker"].start_recording(
+                ### Start recording (through the `GazeRecorder`, if samples are streamed)
+                (exp_info["gaze_recorder"] or exp_info["eyetracker"]).start_recording(
                     gaze=True,
                     time_sync=True,
                     eye_image=False,
@@ -487,8 +750,14 @@ if __name__ == "__main__":
             blocks = conditions_phase["block"].unique()
             n_blocks = len(blocks)
             for b, block in enumerate(blocks):
+                trials_block = conditions_phase.loc[
+                    (conditions_phase["block"] == block)
+                    & (conditions_phase.index >= resume_trial)
+                ]
+                if len(trials_block) == 0:  # completed before resuming
+                    continue
                 if exp_info["use_eyetracker"]:
-                    exp_info["eyetracker"].send_message(f"{phase} block {block} on")
+                    exp_info["eyetracker_messages"].send(f"{phase} block {block} on")
                 if exp_info["show_block_dividers"]:
                     # Show a block divider if there are multiple blocks
                     if n_blocks > 1:
@@ -508,32 +777,12 @@ if __name__ == "__main__":
                         win.flip()
                         core.wait(exp_info["duration_first_trial_blank"])
 
-                trials_block = conditions_phase.loc[conditions_phase["block"] == block]
-
-                # Temporal arrangement: Blocked or interleaved
-                ## "interleaved" randomly shuffles all trials in this block
-                if exp_info["temporal_arrangement"] == "interleaved":
-                    trials_block = trials_block.sample(frac=1)
-                ## "blocked" will keep trials of the same `trial_type` in this block together,
-                ## but randomize the order of these trial_type chunks
-                elif exp_info["temporal_arrangement"] == "blocked":
-                    # split by trial_type
-                    chunks = [
-                        trials_of_type.sample(frac=1)  # randomize within each chunk
-                        for _, trials_of_type in trials_block.groupby("trial_type")
-                    ]
-                    # shuffle chunks
-                    random.shuffle(chunks)
-                    # concatenate them
-                    trials_block = pd.concat(chunks).reset_index(drop=True)
-                else:
-                    raise ValueError(
-                        f"`temporal_arrangement` must be in ['interleaved', 'blocked], but is '{exp_info['temporal_arrangement']}'."
-                    )
-
                 # Iterate through trials of this block
-                for idx, trial_info in trials_block.iterrows():
-                    print(trial_info)
+                for index, trial_info in zip(
+                    trials_block.index, TrialRecord.from_frame(trials_block)
+                ):
+                    if exp_info["print_trial_info"]:
+                        print(trial_info)
                     trial = Trial(
                         trial_info=trial_info,
                         exp=exp,
@@ -543,12 +792,24 @@ if __name__ == "__main__":
                     )
                     trial.prepare()
                     trial.run()
-                    trial.log()
+                    row = trial.log()
+                    if exp_info["checkpoint"] is not None:
+                        exp_info["checkpoint"].save(
+                            dict(
+                                trial=int(index),
+                                phase=phase,
+                                training_repeat=training_repeat,
+                                block=block,
+                                total_reward=exp_info["total_reward"],
+                            ),
+                            row,
+                        )
 
         # Stop eye tracker recording
         if exp_info["use_eyetracker"]:
-            eyetracker.send_message(f"{phase} end")
-            exp_info["eyetracker"].stop_recording(
+            exp_info["eyetracker_messages"].send(f"{phase} end")
+            ## The `GazeRecorder` writes the samples that are left before and after stopping
+            (exp_info["gaze_recorder"] or exp_info["eyetracker"]).stop_recording(
                 gaze=True,
                 time_sync=True,
                 eye_image=False,
@@ -575,7 +836,7 @@ if __name__ == "__main__":
                 ).run()
 
         else:  # No conditions to show
-            print(f"No conditions with phase '{phase}' in `conditions`.")
+            print(f"No trials with phase '{phase}' in the schedule.")
             return
 
     # -------------- #
@@ -585,14 +846,21 @@ if __name__ == "__main__":
 
     n_repeats = 0
     repeat_training = True  # set to False to skip training
+    if resume_state is not None:
+        # Continue in the training repeat of the last completed trial, or after the training
+        if resume_state["phase"] == "training":
+            n_repeats = resume_state["training_repeat"]
+        else:
+            repeat_training = False
     while repeat_training and n_repeats <= training_n_repeats_max:
         run_phase(
             phase="training",
-            conditions=conditions,
+            schedule=schedule,
             instruction_slides=instr_slides_training,
             exp_info=exp_info,
             exp=exp,
             win=win,
+            training_repeat=n_repeats,
         )
         # check if maximum repeats is reached
         if n_repeats == training_n_repeats_max:
@@ -638,7 +906,7 @@ if __name__ == "__main__":
 
     run_phase(
         phase="learning",
-        conditions=conditions,
+        schedule=schedule,
         instruction_slides=instr_slides_learning,
         exp_info=exp_info,
         exp=exp,
@@ -652,7 +920,7 @@ if __name__ == "__main__":
 
     run_phase(
         phase="transfer",
-        conditions=conditions,
+        schedule=schedule,
         instruction_slides=instr_slides_transfer,
         exp_info=exp_info,
         exp=exp,
@@ -666,7 +934,7 @@ if __name__ == "__main__":
 
     run_phase(
         phase="explicit",
-        conditions=conditions,
+        schedule=schedule,
         instruction_slides=instr_slides_explicit,
         exp_info=exp_info,
         exp=exp,
@@ -692,11 +960,15 @@ if __name__ == "__main__":
     print(len(total_score_string) * "$")
     print(total_score_string)
     print(len(total_score_string) * "$")
+    print(
+        f"Image cache: {image_cache.hits} hits, {image_cache.misses} misses, {image_cache.evictions} evictions."
+    )
 
     # Finish the experiment
     if use_eyetracker:
-        eyetracker.send_message("experiment end")
-        eyetracker.stop_recording(
+        eyetracker_messages.send("experiment end")
+        eyetracker_messages.close()  # send all queued messages before the data are saved
+        (gaze_recorder or eyetracker).stop_recording(
             gaze=True,
             time_sync=True,
             eye_image=False,
@@ -704,8 +976,18 @@ if __name__ == "__main__":
             external_signal=True,
             positioning=True,
         )
+        if gaze_recorder is not None:
+            gaze_recorder.close()  # samples are in `<logfile>_eyetracking_gaze.npy`, not in the .h5 file
         eyetracker.save_data()
 
     # Close window and save data
+    if exp_info["flip_recorder"] is not None:
+        exp_info["flip_recorder"].save(f"{logfile_path}{file_suffix}_flips.csv")
+    if exp_info["log_writer"] is not None:
+        exp_info["log_writer"].close()
+    if exp_info["checkpoint"] is not None:
+        exp_info["checkpoint"].close()
+    if use_serialport:
+        serialport.close()
     win.close()
     core.quit()